@@ -1,24 +1,19 @@
-import os
 import json
-import httpx
 import logging
-from typing import List
+from typing import List, Optional, Sequence
 
 from pydantic import BaseModel, Field
 from pydantic_ai import Agent
-from pydantic_ai.models.openai import OpenAIChatModel
-from pydantic_ai.providers.ollama import OllamaProvider
 
 from app.agents.json_runner import run_json_agent
+from app.agents.llm_cache import make_cache_key
+from app.agents.llm_clients import OLLAMA_MODEL
+from app.services.similar_tickets import SimilarHit, format_examples, examples_key
 
 logger = logging.getLogger("classify_agent")
 
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
-OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
-
-_http_client = httpx.AsyncClient(timeout=httpx.Timeout(connect=5.0, read=120.0, write=30.0, pool=5.0))
-_provider = OllamaProvider(base_url=OLLAMA_BASE_URL, http_client=_http_client)
-_model = OpenAIChatModel(model_name=OLLAMA_MODEL, provider=_provider)
+# à incrémenter dès que le system prompt / le format du prompt change (invalide le cache)
+PROMPT_VERSION = "2"
 
 
 class CategorySuggestion(BaseModel):
@@ -28,7 +23,6 @@ class CategorySuggestion(BaseModel):
 
 
 _agent = Agent(
-    _model,
     output_type=str,
     system_prompt=(
         "Tu es un agent de classification de tickets.\n"
@@ -45,17 +39,39 @@ _agent = Agent(
 )
 
 
-async def classify_ticket(title: str, description: str, allowed_categories: List[str]) -> CategorySuggestion:
-    allowed = json.dumps(allowed_categories, ensure_ascii=False)
+async def classify_ticket(
+    title: str,
+    description: str,
+    allowed_categories: List[str],
+    allowed_json: Optional[str] = None,
+    examples: Sequence[SimilarHit] = (),
+) -> CategorySuggestion:
+    """examples: tickets similaires déjà triés (few-shot, cf. similar_tickets.lookup)."""
+    allowed = allowed_json or json.dumps(allowed_categories, ensure_ascii=False)
     desc = (description or "")[:1500]
 
     prompt = (
         f"Catégories autorisées (liste stricte): {allowed}\n\n"
+        f"{format_examples(examples)}"
         f"Ticket:\nTitle: {title}\nDescription: {desc}\n"
     )
 
-    return await run_json_agent(_agent, prompt, CategorySuggestion, temperature=0.2, max_tokens=240)
-
+    cache_key = make_cache_key(
+        "classify",
+        PROMPT_VERSION,
+        OLLAMA_MODEL,
+        title=title,
+        description=desc,
+        allowed_categories=allowed_categories,
+        examples=examples_key(examples),
+    )
+    return await run_json_agent(
+        _agent,
+        prompt,
+        CategorySuggestion,
+        temperature=0.2,
+        max_tokens=240,
+        cache_key=cache_key,
+        enums={"category_name": allowed_categories},
+    )
 
-async def close_client():
-    await _http_client.aclose()
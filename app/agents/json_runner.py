@@ -1,45 +1,274 @@
+import os
+import copy
+import json
 import time
 import logging
-from typing import Type, TypeVar
+from functools import lru_cache
+from typing import Any, Dict, Optional, Sequence, Type, TypeVar
 
 from pydantic import BaseModel, ValidationError
 from pydantic_ai import Agent
 
+from app.agents.llm_cache import llm_cache, LLM_CACHE_ENABLED
+from app.agents.llm_clients import get_llm_model, OLLAMA_MODEL
+from app.observability.metrics import current_endpoint, llm_call_seconds, llm_parse_failures_total
+from app.observability.tracing import current_span, span
+
 logger = logging.getLogger("json_runner")
 
 T = TypeVar("T", bound=BaseModel)
 
+# Mode streaming: coupe la génération dès que l'objet JSON est complet (opt-in)
+LLM_STREAM_MODE = os.getenv("LLM_STREAM_MODE", "0") == "1"
+
+# Compteurs par mode d'exécution, pour mesurer le gain du streaming (tokens / ms par appel)
+LLM_RUN_STATS = {
+    "full": {"calls": 0, "output_tokens": 0, "ms": 0.0},
+    "stream": {"calls": 0, "output_tokens": 0, "ms": 0.0, "early_stops": 0},
+}
+
+# Génération contrainte par le JSON schema du modèle Pydantic (response_format json_schema, opt-in)
+LLM_CONSTRAINED_OUTPUT = os.getenv("LLM_CONSTRAINED_OUTPUT", "0") == "1"
+
+# "<Modèle>:<constrained|free>" -> compteurs du 1er parse (montre si le chemin "repair" devient rare)
+PARSE_STATS: Dict[str, Dict[str, int]] = {}
+
+
+class JsonObjectScanner:
+    """
+    Scanner incrémental (reprenable) de la frontière du 1er objet JSON top-level.
+    feed() peut être appelé chunk par chunk (streaming): l'état (profondeur, chaîne, échappement)
+    est conservé entre les appels, chaque caractère n'est examiné qu'une fois.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.start = -1
+        self._pos = 0
+        self._depth = 0
+        self._in_str = False
+        self._escape = False
+        self.result: Optional[str] = None
+
+    @property
+    def started(self) -> bool:
+        return self.start != -1
+
+    def feed(self, chunk: str) -> Optional[str]:
+        if self.result is not None:
+            return self.result
+
+        self.text += chunk
+        s = self.text
+        i = self._pos
+
+        if self.start == -1:
+            i = s.find("{", i)
+            if i == -1:
+                self._pos = len(s)
+                return None
+            self.start = i
+
+        in_str, escape, depth = self._in_str, self._escape, self._depth
+        for i in range(i, len(s)):
+            ch = s[i]
+            if in_str:
+                if escape:
+                    escape = False
+                elif ch == "\\":
+                    escape = True
+                elif ch == '"':
+                    in_str = False
+            else:
+                if ch == '"':
+                    in_str = True
+                elif ch == "{":
+                    depth += 1
+                elif ch == "}":
+                    depth -= 1
+                    if depth == 0:
+                        self.result = s[self.start : i + 1]
+                        return self.result
+
+        self._pos = len(s)
+        self._in_str, self._escape, self._depth = in_str, escape, depth
+        return None
+
 
 def _extract_first_json_object(text: str) -> str:
-    s = (text or "").strip()
-    start = s.find("{")
-    if start == -1:
-        raise ValueError("Aucun '{' trouvé, pas de JSON.")
-
-    in_str = False
-    escape = False
-    depth = 0
-
-    for i in range(start, len(s)):
-        ch = s[i]
-        if in_str:
-            if escape:
-                escape = False
-            elif ch == "\\":
-                escape = True
-            elif ch == '"':
-                in_str = False
-        else:
-            if ch == '"':
-                in_str = True
-            elif ch == "{":
-                depth += 1
-            elif ch == "}":
-                depth -= 1
-                if depth == 0:
-                    return s[start : i + 1]
-
-    raise ValueError("JSON incomplet: '}' manquant.")
+    scanner = JsonObjectScanner()
+    js = scanner.feed((text or "").strip())
+    if js is None:
+        if not scanner.started:
+            raise ValueError("Aucun '{' trouvé, pas de JSON.")
+        raise ValueError("JSON incomplet: '}' manquant.")
+    return js
+
+
+@lru_cache(maxsize=64)
+def _cached_schema(model: Type[BaseModel], enums: tuple) -> str:
+    schema = copy.deepcopy(model.model_json_schema())
+    for field_name, values in enums:
+        prop = schema.get("properties", {}).get(field_name)
+        if prop is not None:
+            prop.pop("anyOf", None)
+            prop["type"] = "string"
+            prop["enum"] = list(values)
+    return json.dumps(schema, ensure_ascii=False)
+
+
+def constrained_schema(model: Type[BaseModel], enums: Optional[Dict[str, Sequence[str]]] = None) -> Dict[str, Any]:
+    """
+    JSON schema du modèle, avec éventuellement des champs restreints à une liste (enum),
+    ex: category_name limité aux catégories en base.
+    """
+    key = tuple(sorted((k, tuple(v)) for k, v in (enums or {}).items()))
+    return json.loads(_cached_schema(model, key))
+
+
+def _response_format(name: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    # format OpenAI "structured outputs", supporté par l'API compatible d'Ollama
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+
+
+def record_parse(model_name: str, constrained: bool, first_pass_ok: bool, repair_ok: Optional[bool] = None) -> None:
+    st = PARSE_STATS.setdefault(
+        f"{model_name}:{'constrained' if constrained else 'free'}",
+        {"first_pass": 0, "first_pass_failures": 0, "repair_failures": 0},
+    )
+    st["first_pass"] += 1
+    labels = {"model": OLLAMA_MODEL, "output": model_name, "endpoint": current_endpoint()}
+    if not first_pass_ok:
+        st["first_pass_failures"] += 1
+        llm_parse_failures_total.inc(stage="first_pass", **labels)
+    if repair_ok is False:
+        st["repair_failures"] += 1
+        llm_parse_failures_total.inc(stage="repair", **labels)
+
+
+def _output_tokens(usage) -> int:
+    # selon la version de pydantic_ai: output_tokens (récent) ou response_tokens
+    return getattr(usage, "output_tokens", None) or getattr(usage, "response_tokens", None) or 0
+
+
+def _input_tokens(usage) -> int:
+    return getattr(usage, "input_tokens", None) or getattr(usage, "request_tokens", None) or 0
+
+
+def _trace_tokens(prompt_tokens: int, response_tokens: int, **extra) -> None:
+    s = current_span()
+    if s is not None and s.kind == "llm":
+        s.set(prompt_tokens=prompt_tokens, response_tokens=response_tokens, **extra)
+
+
+def llm_run_stats() -> dict:
+    out = {}
+    for mode, st in LLM_RUN_STATS.items():
+        calls = st["calls"] or 1
+        out[mode] = {
+            **st,
+            "avg_output_tokens": round(st["output_tokens"] / calls, 1),
+            "avg_ms": round(st["ms"] / calls, 1),
+        }
+    out["parse"] = {
+        key: {**st, "first_pass_failure_rate": round(st["first_pass_failures"] / (st["first_pass"] or 1), 4)}
+        for key, st in PARSE_STATS.items()
+    }
+    return out
+
+
+async def run_agent_text(
+    agent: Agent,
+    prompt: str,
+    *,
+    temperature: float,
+    max_tokens: int,
+    stream: bool = LLM_STREAM_MODE,
+    json_schema: Optional[Dict[str, Any]] = None,
+    schema_name: str = "output",
+    kind: str = "raw",
+) -> str:
+    """
+    Exécute l'agent et retourne le texte brut.
+    stream=True: génération streamée, coupée dès que le 1er objet JSON top-level est fermé
+    (le bavardage après le JSON n'est jamais décodé).
+    json_schema: génération contrainte par le backend (response_format json_schema).
+    kind: "raw" (1er appel) ou "repair" (relance de correction), label de la métrique llm_call_seconds
+    et flag retry du span de trace.
+    """
+    t0 = time.perf_counter()
+    try:
+        with span(
+            f"llm.{schema_name}",
+            "llm",
+            model=OLLAMA_MODEL,
+            output=schema_name,
+            retry=kind == "repair",
+            stream=stream,
+            constrained=json_schema is not None,
+            prompt_chars=len(prompt),
+        ):
+            return await _run_agent_text(
+                agent,
+                prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=stream,
+                json_schema=json_schema,
+                schema_name=schema_name,
+            )
+    finally:
+        llm_call_seconds.observe(
+            time.perf_counter() - t0, model=OLLAMA_MODEL, output=schema_name, kind=kind, endpoint=current_endpoint()
+        )
+
+
+async def _run_agent_text(
+    agent: Agent,
+    prompt: str,
+    *,
+    temperature: float,
+    max_tokens: int,
+    stream: bool,
+    json_schema: Optional[Dict[str, Any]],
+    schema_name: str,
+) -> str:
+    settings: Dict[str, Any] = {"temperature": temperature, "max_tokens": max_tokens}
+    if json_schema is not None:
+        settings["extra_body"] = {"response_format": _response_format(schema_name, json_schema)}
+    t0 = time.perf_counter()
+
+    if not stream:
+        result = await agent.run(prompt, model=get_llm_model(), model_settings=settings)
+        usage = result.usage()
+        st = LLM_RUN_STATS["full"]
+        st["calls"] += 1
+        st["output_tokens"] += _output_tokens(usage)
+        st["ms"] += (time.perf_counter() - t0) * 1000
+        _trace_tokens(_input_tokens(usage), _output_tokens(usage))
+        return result.output
+
+    scanner = JsonObjectScanner()
+    chunks = 0
+    async with agent.run_stream(prompt, model=get_llm_model(), model_settings=settings) as result:
+        async for delta in result.stream_text(delta=True, debounce_by=None):
+            chunks += 1
+            if scanner.feed(delta) is not None:
+                # sortie du context manager => la réponse HTTP est fermée, Ollama arrête la génération
+                break
+
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    st = LLM_RUN_STATS["stream"]
+    st["calls"] += 1
+    st["output_tokens"] += chunks  # ~1 token par chunk côté Ollama
+    st["ms"] += elapsed_ms
+    # stream coupé: l'usage n'est pas toujours renvoyé, les tokens de réponse sont estimés par les chunks
+    _trace_tokens(_input_tokens(result.usage()), chunks, early_stop=scanner.result is not None)
+    if scanner.result is not None:
+        st["early_stops"] += 1
+        logger.info("stream: JSON fermé après %s chunks (%.0f ms), génération coupée", chunks, elapsed_ms)
+        return scanner.result
+    return scanner.text
 
 
 async def run_json_agent(
@@ -49,15 +278,55 @@ async def run_json_agent(
     *,
     temperature: float = 0.2,
     max_tokens: int = 220,
+    cache_key: Optional[str] = None,
+    enums: Optional[Dict[str, Sequence[str]]] = None,
+) -> T:
+    """
+    enums: valeurs autorisées par champ (ex: {"category_name": [...]}) utilisées
+    en mode LLM_CONSTRAINED_OUTPUT pour restreindre le schéma envoyé au backend.
+    """
+    use_cache = cache_key is not None and LLM_CACHE_ENABLED
+    if use_cache:
+        cached = await llm_cache.aget(cache_key)
+        if cached is not None:
+            try:
+                return model.model_validate_json(cached)
+            except ValidationError:
+                # schéma modifié depuis la mise en cache: on ignore l'entrée
+                logger.warning("cache entry invalide pour %s, ignorée", model.__name__)
+
+    result = await _run_json_agent_uncached(
+        agent, prompt, model, temperature=temperature, max_tokens=max_tokens, enums=enums
+    )
+
+    if use_cache:
+        await llm_cache.aset(cache_key, result.model_dump_json())
+    return result
+
+
+async def _run_json_agent_uncached(
+    agent: Agent,
+    prompt: str,
+    model: Type[T],
+    *,
+    temperature: float,
+    max_tokens: int,
+    enums: Optional[Dict[str, Sequence[str]]] = None,
 ) -> T:
+    schema = constrained_schema(model, enums) if LLM_CONSTRAINED_OUTPUT else None
+
     t0 = time.perf_counter()
-    raw = (await agent.run(prompt, model_settings={"temperature": temperature, "max_tokens": max_tokens})).output
+    raw = await run_agent_text(
+        agent, prompt, temperature=temperature, max_tokens=max_tokens, json_schema=schema, schema_name=model.__name__
+    )
     logger.info("agent raw done in %.2fs", time.perf_counter() - t0)
 
     # 1) parse + validate
     try:
         js = _extract_first_json_object(raw)
-        return model.model_validate_json(js)
+        out = model.model_validate_json(js)
+        record_parse(model.__name__, schema is not None, first_pass_ok=True)
+        return out
     except Exception as e1:
         # 2) repair
         repair_prompt = (
@@ -68,13 +337,25 @@ async def run_json_agent(
         )
 
         t1 = time.perf_counter()
-        raw2 = (await agent.run(repair_prompt, model_settings={"temperature": 0.0, "max_tokens": max_tokens})).output
+        raw2 = await run_agent_text(
+            agent,
+            repair_prompt,
+            temperature=0.0,
+            max_tokens=max_tokens,
+            json_schema=schema,
+            schema_name=model.__name__,
+            kind="repair",
+        )
         logger.info("agent repair done in %.2fs", time.perf_counter() - t1)
 
         try:
             js2 = _extract_first_json_object(raw2)
-            return model.model_validate_json(js2)
+            out = model.model_validate_json(js2)
+            record_parse(model.__name__, schema is not None, first_pass_ok=False, repair_ok=True)
+            return out
         except ValidationError as ve:
+            record_parse(model.__name__, schema is not None, first_pass_ok=False, repair_ok=False)
             raise ValueError(f"Validation Pydantic impossible: {ve}")
         except Exception as e2:
+            record_parse(model.__name__, schema is not None, first_pass_ok=False, repair_ok=False)
             raise ValueError(f"Parsing JSON impossible: {e2}")
@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from app.observability.metrics import registry
+
+logger = logging.getLogger("llm_cache")
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "./llm_cache.db")
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MEMORY_SIZE = int(os.getenv("LLM_CACHE_MEMORY_SIZE", "1024"))
+LLM_CACHE_MAX_ROWS = int(os.getenv("LLM_CACHE_MAX_ROWS", "50000"))
+
+# on ne vérifie la taille du tier SQLite que toutes les N écritures
+_EVICT_EVERY = 100
+
+
+def make_cache_key(namespace: str, prompt_version: str, model_name: str, **inputs) -> str:
+    """
+    Clé = hash des entrées du prompt + modèle + version du prompt.
+    Changer le system prompt / les règles => bump de la version côté agent.
+    """
+    payload = json.dumps(
+        {"ns": namespace, "v": prompt_version, "model": model_name, "inputs": inputs},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LlmCache:
+    """
+    Cache des sorties LLM validées (JSON) sur 2 niveaux:
+    - LRU en mémoire (process)
+    - SQLite persistant (partagé entre workers / redémarrages)
+    """
+
+    def __init__(self, path: str, ttl_seconds: int, memory_size: int, max_rows: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+
+        self._mem: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._mem_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes = 0
+
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0,
+                       "memory_evictions": 0, "disk_evictions": 0, "expired": 0}
+
+    # ---------- SQLite ----------
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_last_access ON llm_cache (last_access)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _disk_get(self, key: str, now: float) -> Optional[tuple[float, str]]:
+        with self._db_lock:
+            db = self._db()
+            row = db.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at <= now:
+                db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                db.commit()
+                self._stats["expired"] += 1
+                return None
+            db.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            db.commit()
+            return expires_at, value
+
+    def _disk_set(self, key: str, value: str, expires_at: float, now: float) -> None:
+        with self._db_lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now),
+            )
+            self._writes += 1
+            if self._writes % _EVICT_EVERY == 0:
+                self._disk_evict(db, now)
+            db.commit()
+
+    def _disk_evict(self, db: sqlite3.Connection, now: float) -> None:
+        cur = db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+        self._stats["expired"] += cur.rowcount
+        (count,) = db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        overflow = count - self.max_rows
+        if overflow > 0:
+            db.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_access LIMIT ?)",
+                (overflow,),
+            )
+            self._stats["disk_evictions"] += overflow
+
+    # ---------- mémoire ----------
+
+    def _mem_get(self, key: str, now: float) -> Optional[str]:
+        with self._mem_lock:
+            item = self._mem.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= now:
+                del self._mem[key]
+                self._stats["expired"] += 1
+                return None
+            self._mem.move_to_end(key)
+            return value
+
+    def _mem_set(self, key: str, value: str, expires_at: float) -> None:
+        with self._mem_lock:
+            self._mem[key] = (expires_at, value)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.memory_size:
+                self._mem.popitem(last=False)
+                self._stats["memory_evictions"] += 1
+
+    # ---------- API ----------
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        value = self._mem_get(key, now)
+        if value is not None:
+            self._stats["memory_hits"] += 1
+            return value
+
+        try:
+            item = self._disk_get(key, now)
+        except sqlite3.Error as e:
+            logger.warning("llm_cache lecture SQLite échouée: %s", e)
+            item = None
+
+        if item is None:
+            self._stats["misses"] += 1
+            return None
+
+        expires_at, value = item
+        self._mem_set(key, value, expires_at)
+        self._stats["disk_hits"] += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        self._mem_set(key, value, expires_at)
+        self._stats["sets"] += 1
+        try:
+            self._disk_set(key, value, expires_at, now)
+        except sqlite3.Error as e:
+            logger.warning("llm_cache écriture SQLite échouée: %s", e)
+
+    async def aget(self, key: str) -> Optional[str]:
+        # hit mémoire: pas besoin de thread
+        now = time.time()
+        value = self._mem_get(key, now)
+        if value is not None:
+            self._stats["memory_hits"] += 1
+            return value
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: str) -> None:
+        await asyncio.to_thread(self.set, key, value)
+
+    def clear(self) -> None:
+        with self._mem_lock:
+            self._mem.clear()
+        with self._db_lock:
+            db = self._db()
+            db.execute("DELETE FROM llm_cache")
+            db.commit()
+
+    def stats(self) -> dict:
+        hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+        lookups = hits + self._stats["misses"]
+        return {
+            **self._stats,
+            "hits": hits,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._mem),
+            "enabled": LLM_CACHE_ENABLED,
+        }
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+llm_cache = LlmCache(
+    LLM_CACHE_DB,
+    ttl_seconds=LLM_CACHE_TTL_SECONDS,
+    memory_size=LLM_CACHE_MEMORY_SIZE,
+    max_rows=LLM_CACHE_MAX_ROWS,
+)
+
+
+def _cache_metrics() -> list[str]:
+    st = llm_cache.stats()
+    return [
+        "# HELP llm_cache_hits_total Réponses LLM servies par le cache",
+        "# TYPE llm_cache_hits_total counter",
+        f'llm_cache_hits_total{{tier="memory"}} {st["memory_hits"]}',
+        f'llm_cache_hits_total{{tier="disk"}} {st["disk_hits"]}',
+        "# HELP llm_cache_misses_total Recherches cache sans résultat",
+        "# TYPE llm_cache_misses_total counter",
+        f"llm_cache_misses_total {st['misses']}",
+    ]
+
+
+registry.add_collector(_cache_metrics)
@@ -0,0 +1,169 @@
+import os
+import logging
+from typing import Dict
+
+import httpx
+from pydantic_ai.models.openai import OpenAIChatModel
+from pydantic_ai.providers.ollama import OllamaProvider
+
+logger = logging.getLogger("llm_clients")
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1:8b")  # override possible via env
+
+# Pool HTTP partagé par TOUS les agents (triage, classify, priority, reply)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "16"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "8"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+
+# Timeouts HTTP vers Ollama (évite les “hang” infinis).
+# pool = attente max d'une connexion libre quand le pool est plein.
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+LLM_WRITE_TIMEOUT = float(os.getenv("LLM_WRITE_TIMEOUT", "30"))
+LLM_POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", "60"))
+
+# backend -> base_url (un client poolé par backend)
+LLM_BACKENDS: Dict[str, str] = {"ollama": OLLAMA_BASE_URL}
+
+
+class _CountingStream(httpx.AsyncByteStream):
+    """Corps de réponse: la requête reste "en cours" jusqu'à la fermeture du flux."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, transport: "_CountingTransport"):
+        self._stream = stream
+        self._transport = transport
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._transport.in_flight -= 1
+
+
+class _CountingTransport(httpx.AsyncBaseTransport):
+    """Transport HTTP qui compte les requêtes en cours (API publique httpx, pas l'état interne httpcore)."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+        self.in_flight = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.in_flight += 1
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self.in_flight -= 1
+            raise
+        response.stream = _CountingStream(response.stream, self)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class LlmClientRegistry:
+    """
+    Registre central des clients LLM: un httpx.AsyncClient keep-alive par backend.
+    Ouvert/fermé dans le lifespan FastAPI; recréé à la demande s'il a été fermé.
+    """
+
+    def __init__(self, backends: Dict[str, str]):
+        self.backends = backends
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._models: Dict[str, OpenAIChatModel] = {}
+        self._transports: Dict[str, _CountingTransport] = {}
+
+    def _new_client(self, backend: str) -> httpx.AsyncClient:
+        # les limites vont au transport: httpx les ignore quand un transport est fourni
+        transport = _CountingTransport(
+            httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+                ),
+            )
+        )
+        self._transports[backend] = transport
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                connect=LLM_CONNECT_TIMEOUT,
+                read=LLM_READ_TIMEOUT,
+                write=LLM_WRITE_TIMEOUT,
+                pool=LLM_POOL_TIMEOUT,
+            ),
+            transport=transport,
+        )
+
+    def client(self, backend: str = "ollama") -> httpx.AsyncClient:
+        if backend not in self.backends:
+            raise ValueError(f"Backend LLM inconnu: {backend}")
+
+        c = self._clients.get(backend)
+        if c is None or c.is_closed:
+            c = self._new_client(backend)
+            self._clients[backend] = c
+            self._models.pop(backend, None)
+        return c
+
+    def model(self, backend: str = "ollama") -> OpenAIChatModel:
+        http_client = self.client(backend)
+        m = self._models.get(backend)
+        if m is None:
+            provider = OllamaProvider(base_url=self.backends[backend], http_client=http_client)
+            m = OpenAIChatModel(model_name=OLLAMA_MODEL, provider=provider)
+            self._models[backend] = m
+        return m
+
+    async def open(self) -> None:
+        for backend in self.backends:
+            self.model(backend)
+        logger.info(
+            "LLM clients ready (%s), max_connections=%s keepalive=%s",
+            ", ".join(self.backends), LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS,
+        )
+
+    async def aclose(self) -> None:
+        for c in self._clients.values():
+            await c.aclose()
+        self._clients.clear()
+        self._models.clear()
+        self._transports.clear()
+
+    def pool_stats(self) -> Dict[str, dict]:
+        """
+        Etat des pools: requêtes en cours, dont celles qui occupent une connexion et celles qui en attendent une
+        (au-delà de max_connections).
+        """
+        out: Dict[str, dict] = {}
+        for backend in self.backends:
+            c = self._clients.get(backend)
+            transport = self._transports.get(backend)
+            in_flight = transport.in_flight if transport is not None else 0
+            out[backend] = {
+                "open": c is not None and not c.is_closed,
+                "max_connections": LLM_MAX_CONNECTIONS,
+                "in_flight": in_flight,
+                "in_use": min(in_flight, LLM_MAX_CONNECTIONS),
+                "queued": max(0, in_flight - LLM_MAX_CONNECTIONS),
+            }
+        return out
+
+
+llm_clients = LlmClientRegistry(LLM_BACKENDS)
+
+
+def get_llm_model(backend: str = "ollama") -> OpenAIChatModel:
+    return llm_clients.model(backend)
+
+
+async def close_llm_clients() -> None:
+    await llm_clients.aclose()
@@ -1,25 +1,20 @@
-import os
 import json
-import httpx
 import logging
-from typing import List
+from typing import List, Optional, Sequence
 
 from pydantic import BaseModel, Field
 from pydantic_ai import Agent
-from pydantic_ai.models.openai import OpenAIChatModel
-from pydantic_ai.providers.ollama import OllamaProvider
 
 from app.domain.schemas import TicketPriority, TicketStatus
 from app.agents.json_runner import run_json_agent
+from app.agents.llm_cache import make_cache_key
+from app.agents.llm_clients import OLLAMA_MODEL
+from app.services.similar_tickets import SimilarHit, format_examples, examples_key
 
 logger = logging.getLogger("priority_agent")
 
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
-OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
-
-_http_client = httpx.AsyncClient(timeout=httpx.Timeout(connect=5.0, read=120.0, write=30.0, pool=5.0))
-_provider = OllamaProvider(base_url=OLLAMA_BASE_URL, http_client=_http_client)
-_model = OpenAIChatModel(model_name=OLLAMA_MODEL, provider=_provider)
+# à incrémenter dès que le system prompt / le format du prompt change (invalide le cache)
+PROMPT_VERSION = "2"
 
 
 class PrioritySuggestion(BaseModel):
@@ -29,7 +24,6 @@ class PrioritySuggestion(BaseModel):
 
 
 _agent = Agent(
-    _model,
     output_type=str,
     system_prompt=(
         "Tu es un agent de priorisation.\n"
@@ -46,14 +40,29 @@ _agent = Agent(
 )
 
 
-async def prioritize_ticket(title: str, description: str, category_name: str) -> PrioritySuggestion:
+async def prioritize_ticket(
+    title: str,
+    description: str,
+    category_name: Optional[str] = None,
+    examples: Sequence[SimilarHit] = (),
+) -> PrioritySuggestion:
     desc = (description or "")[:1500]
-    prompt = (
-        f"Catégorie déjà choisie: {json.dumps(category_name, ensure_ascii=False)}\n\n"
-        f"Ticket:\nTitle: {title}\nDescription: {desc}\n"
+    # category_name est un simple indice: absent en mode parallèle (classify tourne en même temps)
+    if category_name is not None:
+        context = f"Catégorie déjà choisie: {json.dumps(category_name, ensure_ascii=False)}\n\n"
+    else:
+        context = "Catégorie: non encore déterminée (base-toi uniquement sur le ticket).\n\n"
+    prompt = context + format_examples(examples) + f"Ticket:\nTitle: {title}\nDescription: {desc}\n"
+    cache_key = make_cache_key(
+        "prioritize",
+        PROMPT_VERSION,
+        OLLAMA_MODEL,
+        title=title,
+        description=desc,
+        category_name=category_name,
+        examples=examples_key(examples),
+    )
+    return await run_json_agent(
+        _agent, prompt, PrioritySuggestion, temperature=0.2, max_tokens=200, cache_key=cache_key
     )
-    return await run_json_agent(_agent, prompt, PrioritySuggestion, temperature=0.2, max_tokens=200)
-
 
-async def close_client():
-    await _http_client.aclose()
@@ -1,25 +1,19 @@
-import os
 import json
-import httpx
 import logging
 from typing import Optional
 
 from pydantic import BaseModel, Field
 from pydantic_ai import Agent
-from pydantic_ai.models.openai import OpenAIChatModel
-from pydantic_ai.providers.ollama import OllamaProvider
 
 from app.domain.schemas import TicketPriority
 from app.agents.json_runner import run_json_agent
+from app.agents.llm_cache import make_cache_key
+from app.agents.llm_clients import OLLAMA_MODEL
 
 logger = logging.getLogger("reply_agent")
 
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
-OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
-
-_http_client = httpx.AsyncClient(timeout=httpx.Timeout(connect=5.0, read=120.0, write=30.0, pool=5.0))
-_provider = OllamaProvider(base_url=OLLAMA_BASE_URL, http_client=_http_client)
-_model = OpenAIChatModel(model_name=OLLAMA_MODEL, provider=_provider)
+# à incrémenter dès que le system prompt / le format du prompt change (invalide le cache)
+PROMPT_VERSION = "1"
 
 
 class ReplySuggestion(BaseModel):
@@ -27,7 +21,6 @@ class ReplySuggestion(BaseModel):
 
 
 _agent = Agent(
-    _model,
     output_type=str,
     system_prompt=(
         "Tu es un agent de rédaction de réponse support.\n"
@@ -50,8 +43,16 @@ async def draft_reply(title: str, description: str, category_name: str, priority
         f"- priority: {priority.value}\n\n"
         f"Ticket:\nTitle: {title}\nDescription: {desc}\n"
     )
-    return await run_json_agent(_agent, prompt, ReplySuggestion, temperature=0.2, max_tokens=180)
-
+    cache_key = make_cache_key(
+        "reply",
+        PROMPT_VERSION,
+        OLLAMA_MODEL,
+        title=title,
+        description=desc,
+        category_name=category_name,
+        priority=priority.value,
+    )
+    return await run_json_agent(
+        _agent, prompt, ReplySuggestion, temperature=0.2, max_tokens=180, cache_key=cache_key
+    )
 
-async def close_client():
-    await _http_client.aclose()
@@ -1,29 +1,29 @@
-import os
 import json
 import time
 import logging
-from typing import List, Optional
+from typing import List, Optional, Sequence
 
-import httpx
 from pydantic import BaseModel, Field, ValidationError
 
 from pydantic_ai import Agent
-from pydantic_ai.models.openai import OpenAIChatModel
-from pydantic_ai.providers.ollama import OllamaProvider
 
 from app.domain.schemas import TicketPriority, TicketStatus
+from app.agents.llm_cache import llm_cache, make_cache_key, LLM_CACHE_ENABLED
+from app.agents.llm_clients import get_llm_model, OLLAMA_MODEL
+from app.agents.json_runner import (
+    run_agent_text,
+    constrained_schema,
+    record_parse,
+    _extract_first_json_object,
+    LLM_CONSTRAINED_OUTPUT,
+)
+from app.services.similar_tickets import SimilarHit, SimilarLookup, lookup, format_examples, examples_key
+from app.services.duplicate_tickets import CanonicalDecision, shared_triage
 
 logger = logging.getLogger("triage_agent")
 
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
-OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1:8b")  # override possible via env
-
-# Timeouts HTTP vers Ollama (évite les “hang” infinis)
-_http_timeout = httpx.Timeout(connect=5.0, read=120.0, write=30.0, pool=5.0)
-_http_client = httpx.AsyncClient(timeout=_http_timeout)
-
-_provider = OllamaProvider(base_url=OLLAMA_BASE_URL, http_client=_http_client)
-_model = OpenAIChatModel(model_name=OLLAMA_MODEL, provider=_provider)
+# à incrémenter dès que le system prompt / le format du prompt change (invalide le cache)
+PROMPT_VERSION = "2"
 
 
 class TriageSuggestion(BaseModel):
@@ -41,7 +41,6 @@ class TriageParseError(Exception):
         self.raw_output = raw_output
 
 _agent = Agent(
-    _model,
     output_type=str,
     system_prompt=(
         "Tu es un agent de triage de tickets support.\n"
@@ -61,37 +60,14 @@ _agent = Agent(
 )
 
 
-def _extract_first_json_object(text: str) -> str:
-    s = text.strip()
-    start = s.find("{")
-    if start == -1:
-        raise ValueError("Aucun '{' trouvé, pas de JSON.")
-    in_str = False
-    escape = False
-    depth = 0
-    for i in range(start, len(s)):
-        ch = s[i]
-        if in_str:
-            if escape:
-                escape = False
-            elif ch == "\\":
-                escape = True
-            elif ch == '"':
-                in_str = False
-        else:
-            if ch == '"':
-                in_str = True
-            elif ch == "{":
-                depth += 1
-            elif ch == "}":
-                depth -= 1
-                if depth == 0:
-                    return s[start : i + 1]
-    raise ValueError("JSON incomplet: '}' manquant.")
-
-
-def _build_prompt(title: str, desc: str, allowed_categories: List[str]) -> str:
-    allowed = json.dumps(allowed_categories, ensure_ascii=False)
+def _build_prompt(
+    title: str,
+    desc: str,
+    allowed_categories: List[str],
+    allowed_json: Optional[str] = None,
+    examples: Sequence[SimilarHit] = (),
+) -> str:
+    allowed = allowed_json or json.dumps(allowed_categories, ensure_ascii=False)
 
     desc = (desc or "")[:1500]
 
@@ -106,6 +82,7 @@ def _build_prompt(title: str, desc: str, allowed_categories: List[str]) -> str:
 
     return (
         f"Catégories autorisées (liste stricte): {allowed}\n\n"
+        f"{format_examples(examples)}"
         f"Ticket:\nTitle: {title}\nDescription: {desc}\n\n"
         f"Réponds UNIQUEMENT avec un JSON objet conforme.\n"
         f"Exemple de forme (ne pas copier, juste respecter les clés):\n"
@@ -113,48 +90,174 @@ def _build_prompt(title: str, desc: str, allowed_categories: List[str]) -> str:
     )
 
 
-async def suggest_triage(title: str, description: str, allowed_categories: List[str]) -> TriageSuggestion:
-    prompt = _build_prompt(title, description, allowed_categories)
+def reused_suggestion(hit: SimilarHit, title: str) -> TriageSuggestion:
+    """
+    Décision d'un ticket déjà trié, reprise telle quelle (les guardrails s'appliquent ensuite).
+    title: titre du ticket courant (résumé), pas celui du voisin.
+    """
+    return TriageSuggestion(
+        category_name=hit.category_name,
+        priority=hit.priority,
+        status=hit.status,
+        summary=title[:200],
+        rationale=[f"Ticket similaire #{hit.ticket_id} déjà trié (similarité {hit.score:.2f})"],
+        draft_reply=None,
+    )
+
+
+def copied_suggestion(decision: CanonicalDecision, title: str) -> TriageSuggestion:
+    """Doublon: décision de son ticket canonique déjà trié (les guardrails s'appliquent ensuite)."""
+    return TriageSuggestion(
+        category_name=decision.category_name,
+        priority=decision.priority,
+        status=decision.status,
+        summary=title[:200],
+        rationale=[f"Doublon du ticket #{decision.ticket_id} déjà trié"],
+        draft_reply=None,
+    )
+
+
+async def suggest_triage(
+    title: str,
+    description: str,
+    allowed_categories: List[str],
+    allowed_json: Optional[str] = None,
+    *,
+    ticket_id: Optional[int] = None,
+    similar: Optional[SimilarLookup] = None,
+    duplicate_group: Optional[int] = None,
+    canonical: Optional[CanonicalDecision] = None,
+) -> TriageSuggestion:
+    """
+    allowed_json: liste déjà sérialisée (CategoryCatalog.allowed_json), évite un json.dumps par appel.
+    similar: voisins déjà calculés (graphe), sinon recherchés ici (ticket_id exclu des voisins).
+    Voisin au-delà de SIMILAR_REUSE_THRESHOLD: sa décision est reprise sans appel LLM;
+    sinon les voisins proches sont passés en exemples few-shot.
+    canonical / duplicate_group (TicketSnapshot): un doublon reprend la décision de son canonique
+    déjà trié; sinon le groupe partage un seul appel (shared_triage).
+    """
+    if canonical is not None:
+        return copied_suggestion(canonical, title)
+    if duplicate_group is not None:
+        return await shared_triage(
+            duplicate_group,
+            ("triage", tuple(allowed_categories)),
+            lambda: _suggest_triage(title, description, allowed_categories, allowed_json, ticket_id, similar),
+        )
+    return await _suggest_triage(title, description, allowed_categories, allowed_json, ticket_id, similar)
+
+
+async def _suggest_triage(
+    title: str,
+    description: str,
+    allowed_categories: List[str],
+    allowed_json: Optional[str],
+    ticket_id: Optional[int],
+    similar: Optional[SimilarLookup],
+) -> TriageSuggestion:
+    if similar is None:
+        similar = lookup(title, description, allowed_categories, exclude_id=ticket_id)
+    if similar.reuse is not None:
+        return reused_suggestion(similar.reuse, title)
+    examples = similar.examples
+
+    if not LLM_CACHE_ENABLED:
+        return await _suggest_triage_uncached(title, description, allowed_categories, allowed_json, examples)
+
+    cache_key = make_cache_key(
+        "triage",
+        PROMPT_VERSION,
+        OLLAMA_MODEL,
+        title=title,
+        description=(description or "")[:1500],
+        allowed_categories=allowed_categories,
+        examples=examples_key(examples),
+    )
+    cached = await llm_cache.aget(cache_key)
+    if cached is not None:
+        try:
+            return TriageSuggestion.model_validate_json(cached)
+        except ValidationError:
+            logger.warning("cache entry invalide pour triage, ignorée")
+
+    suggestion = await _suggest_triage_uncached(title, description, allowed_categories, allowed_json, examples)
+    await llm_cache.aset(cache_key, suggestion.model_dump_json())
+    return suggestion
+
+
+async def _suggest_triage_uncached(
+    title: str,
+    description: str,
+    allowed_categories: List[str],
+    allowed_json: Optional[str] = None,
+    examples: Sequence[SimilarHit] = (),
+) -> TriageSuggestion:
+    allowed_json = allowed_json or json.dumps(allowed_categories, ensure_ascii=False)
+    prompt = _build_prompt(title, description, allowed_categories, allowed_json, examples)
+
+    # mode contraint: category_name restreint aux catégories en base directement dans le schéma
+    schema = (
+        constrained_schema(TriageSuggestion, {"category_name": allowed_categories})
+        if LLM_CONSTRAINED_OUTPUT
+        else None
+    )
+    constrained = schema is not None
 
     t0 = time.perf_counter()
-    raw = (await _agent.run(prompt, model_settings={"temperature": 0.2, "max_tokens": 260})).output
+    raw = await run_agent_text(
+        _agent, prompt, temperature=0.2, max_tokens=260, json_schema=schema, schema_name="TriageSuggestion"
+    )
     logger.info("LLM raw done in %.2fs", time.perf_counter() - t0)
 
     # 1ère tentative: parse + validate
     try:
         js = _extract_first_json_object(raw)
-        return TriageSuggestion.model_validate_json(js)
+        suggestion = TriageSuggestion.model_validate_json(js)
+        record_parse("TriageSuggestion", constrained, first_pass_ok=True)
+        return suggestion
     except Exception as e1:
         # 2ème tentative: “repair” guidé
         repair_prompt = (
             "Ton output précédent n'était pas valide/parseable.\n"
             "Corrige et renvoie UNIQUEMENT un JSON objet valide (aucun texte).\n"
             f"Erreur: {str(e1)}\n"
-            f"Catégories autorisées: {json.dumps(allowed_categories, ensure_ascii=False)}\n"
+            f"Catégories autorisées: {allowed_json}\n"
             "Output précédent:\n"
             f"{raw}"
         )
         t1 = time.perf_counter()
-        raw2 = (await _agent.run(repair_prompt, model_settings={"temperature": 0.0, "max_tokens": 260})).output
+        raw2 = await run_agent_text(
+            _agent,
+            repair_prompt,
+            temperature=0.0,
+            max_tokens=260,
+            json_schema=schema,
+            schema_name="TriageSuggestion",
+            kind="repair",
+        )
         logger.info("LLM repair done in %.2fs", time.perf_counter() - t1)
 
         try:
             js2 = _extract_first_json_object(raw2)
-            return TriageSuggestion.model_validate_json(js2)
+            suggestion = TriageSuggestion.model_validate_json(js2)
+            record_parse("TriageSuggestion", constrained, first_pass_ok=False, repair_ok=True)
+            return suggestion
         except ValidationError as ve:
+            record_parse("TriageSuggestion", constrained, first_pass_ok=False, repair_ok=False)
             raise TriageParseError(f"Validation Pydantic impossible: {ve}", raw2) from ve
         except Exception as e2:
+            record_parse("TriageSuggestion", constrained, first_pass_ok=False, repair_ok=False)
             raise TriageParseError(f"Parsing JSON impossible: {e2}", raw2) from e2
 
 
 async def warmup_llm() -> None:
     try:
         logger.info("Warmup LLM (%s)...", OLLAMA_MODEL)
-        _ = await _agent.run("Réponds uniquement: {\"ok\": true}", model_settings={"temperature": 0.0, "max_tokens": 20})
+        _ = await _agent.run(
+            "Réponds uniquement: {\"ok\": true}",
+            model=get_llm_model(),
+            model_settings={"temperature": 0.0, "max_tokens": 20},
+        )
         logger.info("Warmup OK")
     except Exception as e:
         logger.warning("Warmup échoué: %s", e)
-
-
-async def close_llm_clients() -> None:
-    await _http_client.aclose()
@@ -1,36 +1,86 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 
-from app.db.engine import init_db
+from app.db.engine import init_db, engine, read_engine, new_read_session
+from app.db.executor import run_in_session, shutdown_db_executor
 from app.api.routers.categories import router as categories_router
 from app.api.routers.tickets import router as tickets_router
 from app.api.routers.triage import router as triage_router
+from app.api.routers.metrics import router as metrics_router
+from app.api.routers.admin import router as admin_router
 
-from app.agents.triage_agent import warmup_llm, close_llm_clients
+from app.agents.triage_agent import warmup_llm
+from app.agents.llm_clients import llm_clients, close_llm_clients
+from app.graphs.triage_graph import build_triage_graph
+from app.graphs.triage_graph_multi import build_triage_graph_multi
+from app.graphs.triage_graph_multi import TRIAGE_MULTI_PARALLEL
+from app.services.triage_jobs import TriageJobQueue
+from app.services.similar_tickets import build_similar_index, SIMILAR_INDEX_ENABLED
+from app.services.duplicate_tickets import build_duplicate_index, DUPLICATE_DETECTION_ENABLED
 from app.mcp.server import mcp
+from app.observability.metrics import MetricsMiddleware, instrument_engine
+from app.observability.tracing import TracingMiddleware, exporter
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     init_db()
+
+    # graphes LangGraph compilés une seule fois (la session DB passe par la config)
+    app.state.triage_graph = build_triage_graph()
+    app.state.triage_graph_multi = {
+        True: build_triage_graph_multi(parallel=True),
+        False: build_triage_graph_multi(parallel=False),
+    }
+
+    # index des tickets similaires déjà triés (mis à jour ensuite à chaque triage appliqué)
+    if SIMILAR_INDEX_ENABLED:
+        await run_in_session(build_similar_index, session_factory=new_read_session)
+    # signatures MinHash des tickets (doublons): rechargées depuis SQLite, manquantes calculées
+    if DUPLICATE_DETECTION_ENABLED:
+        await run_in_session(build_duplicate_index)
+
+    await llm_clients.open()
     await warmup_llm()
 
+    # workers de triage asynchrone (POST /triage/jobs)
+    app.state.triage_jobs = TriageJobQueue(
+        graphs={
+            "graph": app.state.triage_graph,
+            "multi": app.state.triage_graph_multi[TRIAGE_MULTI_PARALLEL],
+        }
+    )
+    await app.state.triage_jobs.start()
+
     # MCP session manager
     async with mcp.session_manager.run():
         try:
             yield
         finally:
             # Shutdown
+            await app.state.triage_jobs.stop()
             await close_llm_clients()
+            shutdown_db_executor()
+            exporter.close()
 
 
 def create_app() -> FastAPI:
     app = FastAPI(title="Agentic Ticket Triage", lifespan=lifespan)
 
+    # métriques Prometheus: durée par route + label endpoint pour les couches LLM/DB
+    app.add_middleware(MetricsMiddleware)
+    # traces locales: span racine par requête, consultables via GET /admin/traces
+    app.add_middleware(TracingMiddleware)
+    instrument_engine(engine, "write")
+    if read_engine is not engine:
+        instrument_engine(read_engine, "read")
+
     app.include_router(categories_router)
     app.include_router(tickets_router)
     app.include_router(triage_router)
+    app.include_router(metrics_router)
+    app.include_router(admin_router)
 
     # MCP accessible sur http://localhost:8000/mcp
     app.mount("/mcp", mcp.streamable_http_app())
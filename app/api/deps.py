@@ -1,4 +1,6 @@
-from app.db.engine import get_session
+from app.db.engine import get_session, get_read_session
 
 # ajout de auth, user context, etc. plus tard.
 SessionDep = get_session
+# endpoints list/get: engine lecture seule si DB_READ_ENGINE=1
+ReadSessionDep = get_read_session
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, HTTPException
+
+from app.observability.tracing import exporter
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+
+@router.get("/traces")
+def get_traces(limit: int = 50):
+    """Dernières traces du ring buffer (span racine, nb de spans), plus récentes d'abord."""
+    return exporter.traces(limit=max(1, min(limit, 500)))
+
+
+@router.get("/traces/{trace_id}")
+def get_trace(trace_id: str):
+    """Spans d'une trace, triés par début (parent_id pour reconstruire l'arbre)."""
+    spans = exporter.spans(trace_id=trace_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail="Trace introuvable (absente ou sortie du buffer)")
+    return {"trace_id": trace_id, "spans": sorted(spans, key=lambda s: s["start"])}
+
+
+@router.delete("/traces")
+def delete_traces():
+    exporter.clear()
+    return {"ok": True}
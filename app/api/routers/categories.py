@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session
 
-from app.api.deps import SessionDep
+from app.api.deps import SessionDep, ReadSessionDep
 from app.domain.models import Category
 from app.domain.schemas import CategoryCreate
 from app.services.category_service import create_category, list_categories
@@ -18,5 +18,5 @@ def post_category(payload: CategoryCreate, session: Session = Depends(SessionDep
 
 
 @router.get("", response_model=list[Category])
-def get_categories(session: Session = Depends(SessionDep)):
+def get_categories(session: Session = Depends(ReadSessionDep)):
     return list_categories(session)
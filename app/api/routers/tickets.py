@@ -1,33 +1,155 @@
-from fastapi import APIRouter, Depends, HTTPException
+import io
+import csv
+import json
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session
 
-from app.api.deps import SessionDep
+from app.api.deps import SessionDep, ReadSessionDep
+from app.db.engine import new_read_session
 from app.domain.models import Ticket
-from app.domain.schemas import TicketCreate, TicketUpdate
+from app.domain.schemas import (
+    TicketCreate, TicketCreated, TicketUpdate, TicketListPage, TicketStatus, TicketPriority, TicketBulkFormat,
+    TriageJobGraph,
+)
 from app.services.ticket_service import (
-    create_ticket, list_tickets, get_ticket, update_ticket, delete_ticket
+    create_ticket, list_tickets_page, get_ticket, update_ticket, delete_ticket,
+    iter_tickets_export, EXPORT_FIELDS,
 )
+from app.services.ticket_import import TICKETS_BULK_BATCH_SIZE, import_tickets
+from app.services.duplicate_tickets import duplicate_fields
 
 router = APIRouter(prefix="/tickets", tags=["Tickets"])
 
 
-@router.post("", response_model=Ticket)
+@router.post("", response_model=TicketCreated)
 def post_ticket(payload: TicketCreate, session: Session = Depends(SessionDep)):
-    return create_ticket(
+    """Création; un quasi-doublon d'un ticket existant est signalé (duplicate_of, duplicate_similarity)."""
+    t = create_ticket(
         session,
         title=payload.title,
         description=payload.description,
         category_id=payload.category_id
     )
+    return {**t.model_dump(), **duplicate_fields(t.id)}
+
+
+@router.post("/bulk")
+async def post_tickets_bulk(
+    request: Request,
+    format: TicketBulkFormat | None = None,
+    batch_size: int = TICKETS_BULK_BATCH_SIZE,
+    triage: bool = False,
+    graph: TriageJobGraph = TriageJobGraph.GRAPH,
+):
+    """
+    Import en masse depuis un corps NDJSON (une ligne = un TicketCreate) ou CSV
+    (en-tête title,description[,category_id]), lu en flux et inséré par lots.
+    Format: ?format=, sinon déduit du Content-Type (text/csv => CSV, sinon NDJSON).
+    triage=true: les tickets créés sont mis dans la file de triage asynchrone (/triage/jobs).
+    """
+    if format is None:
+        ctype = request.headers.get("content-type", "")
+        format = TicketBulkFormat.CSV if "csv" in ctype else TicketBulkFormat.NDJSON
+
+    queued = skipped = 0
+
+    async def enqueue(ids: list[int]) -> None:
+        nonlocal queued, skipped
+        jobs, rejected = await request.app.state.triage_jobs.submit_many(ids, graph.value)
+        queued += len(jobs)
+        skipped += rejected
+
+    summary = await import_tickets(
+        request.stream(), format.value, batch_size=batch_size, on_batch=enqueue if triage else None
+    )
+    if triage:
+        summary["triage"] = {"queued": queued, "skipped_queue_full": skipped}
+    return summary
+
+
+@router.get("", response_model=TicketListPage)
+def get_tickets(
+    limit: int | None = None,
+    cursor: str | None = None,
+    status: TicketStatus | None = None,
+    priority: TicketPriority | None = None,
+    category_id: int | None = None,
+    updated_from: datetime | None = None,
+    updated_to: datetime | None = None,
+    session: Session = Depends(ReadSessionDep),
+):
+    """Tickets du plus récent au plus ancien, par pages (next_cursor -> ?cursor=)."""
+    try:
+        page = list_tickets_page(
+            session,
+            limit=limit,
+            cursor=cursor,
+            status=status,
+            priority=priority,
+            category_id=category_id,
+            updated_from=updated_from,
+            updated_to=updated_to,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    items = [{**t.model_dump(), "category_name": name} for t, name in zip(page.items, page.category_names)]
+    return {"items": items, "next_cursor": page.next_cursor}
+
+
+def _export_value(v):
+    return v.isoformat() if isinstance(v, datetime) else v
+
+
+def _export_chunk(rows: list[dict], fmt: TicketBulkFormat) -> str:
+    if fmt == TicketBulkFormat.CSV:
+        buf = io.StringIO()
+        csv.writer(buf).writerows([[_export_value(r[f]) for f in EXPORT_FIELDS] for r in rows])
+        return buf.getvalue()
+    return "".join(
+        json.dumps({k: _export_value(v) for k, v in r.items()}, ensure_ascii=False) + "\n" for r in rows
+    )
+
 
+# déclarée avant /{ticket_id}: sinon "export" serait lu comme un ticket_id
+@router.get("/export")
+def export_tickets(
+    format: TicketBulkFormat = TicketBulkFormat.NDJSON,
+    status: TicketStatus | None = None,
+    priority: TicketPriority | None = None,
+    category_id: int | None = None,
+    updated_from: datetime | None = None,
+    updated_to: datetime | None = None,
+):
+    """Export complet (mêmes filtres que GET /tickets) streamé en NDJSON ou CSV, par blocs."""
+    filters = {
+        "status": status,
+        "priority": priority,
+        "category_id": category_id,
+        "updated_from": updated_from,
+        "updated_to": updated_to,
+    }
 
-@router.get("", response_model=list[Ticket])
-def get_tickets(session: Session = Depends(SessionDep)):
-    return list_tickets(session)
+    # générateur sync: itéré dans le threadpool par Starlette, la session vit le temps du stream
+    def generate():
+        if format == TicketBulkFormat.CSV:
+            yield ",".join(EXPORT_FIELDS) + "\r\n"
+        with new_read_session() as s:
+            for rows in iter_tickets_export(s, **filters):
+                yield _export_chunk(rows, format)
+
+    media_type = "text/csv" if format == TicketBulkFormat.CSV else "application/x-ndjson"
+    return StreamingResponse(
+        generate(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="tickets.{format.value}"'},
+    )
 
 
 @router.get("/{ticket_id}", response_model=Ticket)
-def get_one_ticket(ticket_id: int, session: Session = Depends(SessionDep)):
+def get_one_ticket(ticket_id: int, session: Session = Depends(ReadSessionDep)):
     t = get_ticket(session, ticket_id)
     if not t:
         raise HTTPException(status_code=404, detail="Ticket introuvable")
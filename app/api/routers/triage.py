@@ -1,46 +1,98 @@
 import os
+import json
 import time
 import asyncio
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 
-from app.api.deps import SessionDep
-from app.services.ticket_service import get_ticket
-from app.services.category_service import list_categories
+from app.db.engine import new_session
+from app.domain.schemas import TriageBatchRequest, TriageJobCreate
+from app.services.ticket_service import aget_ticket
+from app.services.triage_service import aload_triage_context, aload_triage_batch, acommit_triage_patches
 from app.agents.triage_agent import suggest_triage, TriageParseError
-from app.services.triage_policy import apply_guardrails
-from app.graphs.triage_graph import build_triage_graph
-from app.graphs.triage_graph_multi import build_triage_graph_multi
+from app.agents.llm_cache import llm_cache
+from app.agents.llm_clients import llm_clients
+from app.agents.json_runner import llm_run_stats
+from app.services.triage_policy import apply_guardrails, scan_tickets
+from app.services.similar_tickets import similar_index
+from app.services.duplicate_tickets import duplicate_index
+from app.graphs.triage_graph_multi import TRIAGE_MULTI_PARALLEL
+from app.services.triage_jobs import QueueFullError, job_json
+from app.observability.metrics import record_timeout, record_category_mismatch
 
 logger = logging.getLogger("triage_router")
 router = APIRouter(prefix="/triage", tags=["Triage (LLM)"])
 
 LLM_TIMEOUT_SECONDS = int(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
 
+# Batch: nb d'appels LLM simultanés + taille des transactions en mode apply
+TRIAGE_BATCH_CONCURRENCY = int(os.getenv("TRIAGE_BATCH_CONCURRENCY", "4"))
+TRIAGE_BATCH_MAX_CONCURRENCY = int(os.getenv("TRIAGE_BATCH_MAX_CONCURRENCY", "16"))
+TRIAGE_BATCH_COMMIT_SIZE = int(os.getenv("TRIAGE_BATCH_COMMIT_SIZE", "50"))
+# plafond de tickets par appel (liste d'ids ou `limit` d'un filtre)
+TRIAGE_BATCH_MAX_TICKETS = int(os.getenv("TRIAGE_BATCH_MAX_TICKETS", "500"))
+
+# Long-poll GET /triage/jobs/{id}/wait
+TRIAGE_JOB_MAX_WAIT_SECONDS = float(os.getenv("TRIAGE_JOB_MAX_WAIT_SECONDS", "60"))
+
+
+@router.get("/cache/stats")
+def triage_cache_stats():
+    return llm_cache.stats()
+
+
+@router.get("/llm/pool")
+def triage_llm_pool():
+    return llm_clients.pool_stats()
+
+
+@router.get("/similar/stats")
+def triage_similar_stats():
+    # index des tickets similaires déjà triés (réutilisation de décision / few-shot)
+    return similar_index.stats()
+
+
+@router.get("/duplicates/stats")
+def triage_duplicates_stats():
+    # index des doublons (MinHash/LSH): tickets signés, canoniques, doublons rattachés
+    return duplicate_index.stats()
+
+
+@router.get("/llm/stats")
+def triage_llm_stats():
+    # tokens / ms moyens par appel, mode complet vs streaming avec arrêt anticipé
+    return llm_run_stats()
+
 
 @router.post("/{ticket_id}/suggest")
-async def triage_suggest(ticket_id: int, session: Session = Depends(SessionDep)):
+async def triage_suggest(ticket_id: int):
     t0 = time.perf_counter()
     logger.info("triage_suggest start ticket_id=%s", ticket_id)
 
-    ticket = get_ticket(session, ticket_id)
+    # lecture courte: aucune connexion DB retenue pendant l'appel LLM
+    ticket, catalog = await aload_triage_context(ticket_id)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket introuvable")
-
-    cats = list_categories(session)
-    if not cats:
+    if catalog.is_empty:
         raise HTTPException(status_code=400, detail="Aucune catégorie en base. Crée des catégories d'abord.")
 
-    allowed_names = [c.name for c in cats]
-
     try:
         suggestion = await asyncio.wait_for(
-            suggest_triage(ticket.title, ticket.description, allowed_names),
+            suggest_triage(
+                ticket.title,
+                ticket.description,
+                list(catalog.names),
+                catalog.allowed_json,
+                ticket_id=ticket.id,
+                duplicate_group=ticket.duplicate_group,
+                canonical=ticket.canonical_decision,
+            ),
             timeout=LLM_TIMEOUT_SECONDS,
         )
     except asyncio.TimeoutError:
+        record_timeout()
         logger.error("LLM timeout after %ss (ticket_id=%s)", LLM_TIMEOUT_SECONDS, ticket_id)
         raise HTTPException(status_code=504, detail=f"Timeout LLM après {LLM_TIMEOUT_SECONDS}s.")
     except TriageParseError as e:
@@ -52,34 +104,34 @@ async def triage_suggest(ticket_id: int, session: Session = Depends(SessionDep))
         logger.exception("LLM error: %s", e)
         raise HTTPException(status_code=502, detail=f"Erreur LLM/Ollama: {e}")
 
-    matched = next((c for c in cats if c.name == suggestion.category_name), None)
-    if not matched:
+    category_id = catalog.name_to_id.get(suggestion.category_name)
+    if category_id is None:
+        record_category_mismatch()
         raise HTTPException(
             status_code=422,
             detail={
                 "message": "category_name hors liste exacte.",
-                "allowed_categories": allowed_names,
+                "allowed_categories": list(catalog.names),
                 "got": suggestion.category_name,
             },
         )
 
     patch = {
-        "category_id": matched.id,
+        "category_id": category_id,
         "priority": suggestion.priority.value,
         "status": suggestion.status.value,
     }
-    name_to_id = {c.name: c.id for c in cats}
-    patch = apply_guardrails(ticket, patch, category_name_to_id=name_to_id)
+    patch = apply_guardrails(ticket, patch, category_name_to_id=catalog.name_to_id)
 
     logger.info("triage_suggest done in %.2fs", time.perf_counter() - t0)
     return {"ticket_id": ticket_id, "suggestion": suggestion.model_dump(), "patch_to_apply": patch}
 
 @router.post("/{ticket_id}/suggest-graph")
-async def triage_suggest_graph(ticket_id: int, session: Session = Depends(SessionDep)):
-    graph = build_triage_graph(session)
+async def triage_suggest_graph(ticket_id: int, request: Request):
+    graph = request.app.state.triage_graph
 
     try:
-        out = await graph.ainvoke({"ticket_id": ticket_id})
+        out = await graph.ainvoke({"ticket_id": ticket_id}, config={"configurable": {"session_factory": new_session}})
         return out["response"]
     except ValueError as e:
         msg = str(e)
@@ -88,14 +140,199 @@ async def triage_suggest_graph(ticket_id: int, session: Session = Depends(Sessio
         raise HTTPException(status_code=400, detail=msg)
 
 @router.post("/{ticket_id}/suggest-multi")
-async def triage_suggest_multi(ticket_id: int, session: Session = Depends(SessionDep)):
-    graph = build_triage_graph_multi(session)
+async def triage_suggest_multi(
+    ticket_id: int,
+    request: Request,
+    parallel: bool | None = None,
+):
+    graph = request.app.state.triage_graph_multi[TRIAGE_MULTI_PARALLEL if parallel is None else parallel]
 
     try:
-        out = await graph.ainvoke({"ticket_id": ticket_id})
+        out = await graph.ainvoke({"ticket_id": ticket_id}, config={"configurable": {"session_factory": new_session}})
         return out["response"]
     except ValueError as e:
         msg = str(e)
         if "introuvable" in msg:
             raise HTTPException(status_code=404, detail=msg)
         raise HTTPException(status_code=400, detail=msg)
+
+
+def _ndjson(obj: dict) -> str:
+    return json.dumps(obj, ensure_ascii=False) + "\n"
+
+
+async def _iter_batch(tickets, missing_ids, catalog, *, apply: bool, concurrency: int):
+    allowed_names = list(catalog.names)
+    name_to_id = catalog.name_to_id
+    snapshots = {t.id: t for t in tickets}
+
+    async def commit(patches: dict[int, dict]) -> list[int]:
+        # transaction courte; guardrails recalculés pour les tickets modifiés pendant le batch
+        return [t.id for t in await acommit_triage_patches(snapshots, patches, name_to_id)]
+
+    sem = asyncio.Semaphore(concurrency)
+    # guardrails: tous les tickets scannés d'un coup par le moteur de règles
+    scans = dict(zip((t.id for t in tickets), scan_tickets(tickets)))
+
+    async def run_one(ticket) -> dict:
+        async with sem:
+            try:
+                suggestion = await asyncio.wait_for(
+                    suggest_triage(
+                        ticket.title,
+                        ticket.description,
+                        allowed_names,
+                        catalog.allowed_json,
+                        ticket_id=ticket.id,
+                        duplicate_group=ticket.duplicate_group,
+                        canonical=ticket.canonical_decision,
+                    ),
+                    timeout=LLM_TIMEOUT_SECONDS,
+                )
+            except asyncio.TimeoutError:
+                record_timeout()
+                logger.error("LLM timeout after %ss (ticket_id=%s)", LLM_TIMEOUT_SECONDS, ticket.id)
+                return {"ticket_id": ticket.id, "error": f"Timeout LLM après {LLM_TIMEOUT_SECONDS}s."}
+            except TriageParseError as e:
+                logger.error("Triage parse error (ticket_id=%s): %s", ticket.id, e)
+                return {"ticket_id": ticket.id, "error": str(e), "raw_output_preview": (e.raw_output or "")[:1200]}
+            except Exception as e:
+                logger.exception("LLM error (ticket_id=%s): %s", ticket.id, e)
+                return {"ticket_id": ticket.id, "error": f"Erreur LLM/Ollama: {e}"}
+
+        if suggestion.category_name not in name_to_id:
+            record_category_mismatch()
+            return {
+                "ticket_id": ticket.id,
+                "error": "category_name hors liste exacte.",
+                "got": suggestion.category_name,
+            }
+
+        patch = {
+            "category_id": name_to_id[suggestion.category_name],
+            "priority": suggestion.priority.value,
+            "status": suggestion.status.value,
+        }
+        patch = apply_guardrails(ticket, patch, category_name_to_id=name_to_id, scan=scans[ticket.id])
+        return {"ticket_id": ticket.id, "suggestion": suggestion.model_dump(mode="json"), "patch_to_apply": patch}
+
+    t0 = time.perf_counter()
+    ok = errors = applied = 0
+
+    for ticket_id in missing_ids:
+        errors += 1
+        yield _ndjson({"ticket_id": ticket_id, "error": "Ticket introuvable"})
+
+    tasks = [asyncio.create_task(run_one(t)) for t in tickets]
+    pending: dict[int, dict] = {}
+    try:
+        for fut in asyncio.as_completed(tasks):
+            item = await fut
+            if "error" in item:
+                errors += 1
+            else:
+                ok += 1
+                if apply:
+                    pending[item["ticket_id"]] = item["patch_to_apply"]
+            yield _ndjson(item)
+
+            # apply: une transaction par chunk, pas un commit par ticket
+            if pending and len(pending) >= TRIAGE_BATCH_COMMIT_SIZE:
+                ids = await commit(pending)
+                applied += len(ids)
+                pending = {}
+                yield _ndjson({"applied_ticket_ids": ids})
+
+        if pending:
+            ids = await commit(pending)
+            applied += len(ids)
+            yield _ndjson({"applied_ticket_ids": ids})
+    finally:
+        # client déconnecté / erreur: on n'appelle plus le LLM pour rien
+        for task in tasks:
+            task.cancel()
+
+    logger.info("triage_batch done: %s ok, %s errors in %.2fs", ok, errors, time.perf_counter() - t0)
+    yield _ndjson({"summary": {"total": ok + errors, "ok": ok, "errors": errors, "applied": applied}})
+
+
+@router.post("/batch")
+async def triage_batch(payload: TriageBatchRequest):
+    """
+    Triage de plusieurs tickets (liste d'ids ou filtre status/priority/category_id).
+    Les résultats sont streamés en NDJSON au fil de l'eau (ordre de fin, pas d'entrée).
+    """
+    has_filter = any(v is not None for v in (payload.status, payload.priority, payload.category_id))
+    if not payload.ticket_ids and not has_filter:
+        raise HTTPException(
+            status_code=422, detail="Préciser ticket_ids ou au moins un filtre (status, priority, category_id)"
+        )
+    if payload.ticket_ids and len(payload.ticket_ids) > TRIAGE_BATCH_MAX_TICKETS:
+        raise HTTPException(
+            status_code=422,
+            detail={"message": f"Maximum {TRIAGE_BATCH_MAX_TICKETS} tickets par appel", "got": len(payload.ticket_ids)},
+        )
+
+    # liste d'ids: déjà plafonnée, `limit` ignoré; filtre: `limit` plafonné
+    limit = None
+    if not payload.ticket_ids:
+        limit = max(1, min(payload.limit or TRIAGE_BATCH_MAX_TICKETS, TRIAGE_BATCH_MAX_TICKETS))
+
+    # snapshots détachés: aucune connexion DB retenue pendant le stream
+    tickets, catalog = await aload_triage_batch(
+        ticket_ids=payload.ticket_ids,
+        status=payload.status,
+        priority=payload.priority,
+        category_id=payload.category_id,
+        limit=limit,
+    )
+    if catalog.is_empty:
+        raise HTTPException(status_code=400, detail="Aucune catégorie en base. Crée des catégories d'abord.")
+
+    found = {t.id for t in tickets}
+    missing_ids = [i for i in dict.fromkeys(payload.ticket_ids or []) if i not in found]
+
+    concurrency = payload.concurrency or TRIAGE_BATCH_CONCURRENCY
+    concurrency = max(1, min(concurrency, TRIAGE_BATCH_MAX_CONCURRENCY))
+
+    logger.info("triage_batch start: %s tickets, concurrency=%s, apply=%s", len(tickets), concurrency, payload.apply)
+    return StreamingResponse(
+        _iter_batch(tickets, missing_ids, catalog, apply=payload.apply, concurrency=concurrency),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.post("/jobs", status_code=202)
+async def triage_job_create(payload: TriageJobCreate, request: Request):
+    """Triage asynchrone: retourne immédiatement un job_id, le résultat est à lire sur GET /triage/jobs/{id}."""
+    if not await aget_ticket(payload.ticket_id):
+        raise HTTPException(status_code=404, detail="Ticket introuvable")
+
+    try:
+        job = await request.app.state.triage_jobs.submit(payload.ticket_id, payload.graph.value)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"job_id": job.id, "status": job.status, "ticket_id": job.ticket_id}
+
+
+@router.get("/jobs/stats")
+def triage_job_stats(request: Request):
+    return request.app.state.triage_jobs.stats()
+
+
+@router.get("/jobs/{job_id}")
+def triage_job_get(job_id: str, request: Request):
+    job = request.app.state.triage_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    return job_json(job)
+
+
+@router.get("/jobs/{job_id}/wait")
+async def triage_job_wait(job_id: str, request: Request, timeout: float = 30.0):
+    """Long-poll: répond dès que le job est terminé (DONE/ERROR) ou après `timeout` secondes."""
+    timeout = max(0.0, min(timeout, TRIAGE_JOB_MAX_WAIT_SECONDS))
+    job = await request.app.state.triage_jobs.wait(job_id, timeout)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    return job_json(job)
@@ -1,15 +1,131 @@
+import os
+import logging
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from sqlalchemy import event
 from sqlmodel import SQLModel, Session, create_engine
 
-DB_URL = "sqlite:///./tickets.db"
+logger = logging.getLogger("db")
+
+DB_URL = os.getenv("DB_URL", "sqlite:///./tickets.db")
+
+# Profil SQLite appliqué à chaque connexion (PRAGMA): "wal" (défaut) ou "legacy" (réglages SQLite d'origine).
+# Chaque pragma est surchargeable individuellement (SQLITE_SYNCHRONOUS=FULL, ...).
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "wal")
+
+# Pool: doit couvrir l'executor DB + le threadpool des routes sync sans attente prolongée
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+# Engine lecture seule (query_only) pour les endpoints list/get; sinon ils utilisent l'engine principal
+DB_READ_ENGINE = os.getenv("DB_READ_ENGINE", "0") == "1"
+
+
+@dataclass(frozen=True)
+class SqliteProfile:
+    journal_mode: Optional[str] = None  # None: on ne touche pas au réglage SQLite
+    synchronous: Optional[str] = None
+    cache_size: Optional[int] = None  # négatif = KiB (-65536 => 64 Mo)
+    mmap_size: Optional[int] = None  # octets
+    busy_timeout_ms: Optional[int] = None
+    temp_store: Optional[str] = None
+
+    def pragmas(self, readonly: bool = False) -> list[str]:
+        out = []
+        if self.busy_timeout_ms is not None:
+            out.append(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        if self.journal_mode and not readonly:
+            out.append(f"PRAGMA journal_mode={self.journal_mode}")
+        if self.synchronous:
+            out.append(f"PRAGMA synchronous={self.synchronous}")
+        if self.cache_size is not None:
+            out.append(f"PRAGMA cache_size={int(self.cache_size)}")
+        if self.mmap_size is not None:
+            out.append(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        if self.temp_store:
+            out.append(f"PRAGMA temp_store={self.temp_store}")
+        if readonly:
+            out.append("PRAGMA query_only=ON")
+        return out
+
+
+SQLITE_PROFILES = {
+    "legacy": SqliteProfile(),
+    # WAL: lecteurs non bloqués par l'écrivain; NORMAL: pas de fsync à chaque commit en WAL (durable au checkpoint)
+    "wal": SqliteProfile(
+        journal_mode="WAL",
+        synchronous="NORMAL",
+        cache_size=-65536,
+        mmap_size=256 * 1024 * 1024,
+        busy_timeout_ms=5000,
+        temp_store="MEMORY",
+    ),
+}
+
+
+def _env_int(name: str) -> Optional[int]:
+    v = os.getenv(name)
+    return int(v) if v not in (None, "") else None
 
-engine = create_engine(
-    DB_URL,
-    connect_args={"check_same_thread": False},
-)
+
+def sqlite_profile_from_env(name: str = SQLITE_PROFILE) -> SqliteProfile:
+    if name not in SQLITE_PROFILES:
+        raise ValueError(f"SQLITE_PROFILE inconnu: {name} ({', '.join(SQLITE_PROFILES)})")
+    overrides = {
+        "journal_mode": os.getenv("SQLITE_JOURNAL_MODE"),
+        "synchronous": os.getenv("SQLITE_SYNCHRONOUS"),
+        "cache_size": _env_int("SQLITE_CACHE_SIZE"),
+        "mmap_size": _env_int("SQLITE_MMAP_SIZE"),
+        "busy_timeout_ms": _env_int("SQLITE_BUSY_TIMEOUT_MS"),
+        "temp_store": os.getenv("SQLITE_TEMP_STORE"),
+    }
+    return replace(SQLITE_PROFILES[name], **{k: v for k, v in overrides.items() if v not in (None, "")})
+
+
+def make_engine(url: str = DB_URL, profile: Optional[SqliteProfile] = None, *, readonly: bool = False):
+    profile = profile if profile is not None else sqlite_profile_from_env()
+    kwargs = {}
+    if url.startswith("sqlite") and ":memory:" not in url and url.rstrip("/") != "sqlite:":
+        # fichier: QueuePool dimensionné (SQLite en mémoire garde son pool mono-connexion)
+        kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+
+    eng = create_engine(url, connect_args={"check_same_thread": False}, **kwargs)
+    pragmas = profile.pragmas(readonly=readonly)
+
+    if pragmas:
+        @event.listens_for(eng, "connect")
+        def _set_pragmas(dbapi_conn, _record):
+            cur = dbapi_conn.cursor()
+            try:
+                for p in pragmas:
+                    cur.execute(p)
+            finally:
+                cur.close()
+
+    return eng
+
+
+engine = make_engine(DB_URL)
+read_engine = make_engine(DB_URL, readonly=True) if DB_READ_ENGINE else engine
 
 def init_db() -> None:
     SQLModel.metadata.create_all(engine)
+    logger.info("DB %s (profil SQLite=%s, engine lecture seule=%s)", DB_URL, SQLITE_PROFILE, DB_READ_ENGINE)
+
+def new_session() -> Session:
+    # session courte hors FastAPI (graphes, MCP, workers): à utiliser dans un `with`
+    return Session(engine)
+
+def new_read_session() -> Session:
+    # lecture seule (list/get): engine dédié si DB_READ_ENGINE=1
+    return Session(read_engine)
 
 def get_session():
     with Session(engine) as session:
         yield session
+
+def get_read_session():
+    with Session(read_engine) as session:
+        yield session
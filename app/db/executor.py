@@ -0,0 +1,72 @@
+import os
+import time
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from sqlmodel import Session
+
+from app.db.engine import new_session
+from app.observability.tracing import span
+
+T = TypeVar("T")
+
+# Accès DB synchrone (SQLite) depuis le code async: exécuté sur un pool de threads borné,
+# jamais sur la boucle d'événements. Borné pour ne pas dépasser le pool de connexions.
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "4"))
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+    return _executor
+
+
+async def run_db(fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Exécute fn(*args, **kwargs) sur l'executor DB (contextvars propagées).
+    Span "db.executor": queue_ms = attente d'un thread libre avant l'exécution.
+    """
+    loop = asyncio.get_running_loop()
+    with span("db.executor", "db", fn=getattr(fn, "__qualname__", type(fn).__name__)) as s:
+        submitted = time.perf_counter()
+
+        def call():
+            if s is not None:
+                s.set(queue_ms=round((time.perf_counter() - submitted) * 1000, 3))
+            return fn(*args, **kwargs)
+
+        # contexte copié après l'ouverture du span: les spans du thread DB en sont les enfants
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(_get_executor(), functools.partial(ctx.run, call))
+
+
+async def run_in_session(
+    fn: Callable[..., T],
+    *args,
+    session_factory: Callable[[], Session] = new_session,
+    **kwargs,
+) -> T:
+    """
+    Exécute fn(session, *args, **kwargs) dans une session courte, sur l'executor DB.
+    Les objets retournés sont détachés mais lisibles (pas d'expiration au commit).
+    """
+    @functools.wraps(fn)
+    def call():
+        with session_factory() as s:
+            s.expire_on_commit = False
+            return fn(s, *args, **kwargs)
+
+    return await run_db(call)
+
+
+def shutdown_db_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
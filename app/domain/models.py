@@ -24,3 +24,25 @@ class Ticket(SQLModel, table=True):
 
     created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
     updated_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+class TicketFingerprint(SQLModel, table=True):
+    # signature MinHash du ticket (détection de doublons, cf. duplicate_tickets) + lien vers son canonique
+    ticket_id: int = Field(primary_key=True, foreign_key="ticket.id")
+    signature: bytes  # num_perm x uint32; vide si le texte n'a aucun mot
+    duplicate_of: Optional[int] = Field(default=None, index=True)
+    similarity: Optional[float] = None  # Jaccard estimé au moment du rattachement
+
+
+class TriageJob(SQLModel, table=True):
+    # job de triage asynchrone (POST /triage/jobs), persistant pour survivre à un redémarrage
+    id: str = Field(primary_key=True)
+    ticket_id: int = Field(index=True)
+    graph: str = Field(default="graph")
+
+    status: str = Field(default="QUEUED", index=True)
+    result: Optional[str] = None  # JSON de la réponse du graphe
+    error: Optional[str] = None
+
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -1,6 +1,8 @@
 from enum import Enum
 from typing import Any
 
+from datetime import datetime
+
 from pydantic import BaseModel
 
 
@@ -18,6 +20,23 @@ class TicketPriority(str, Enum):
     URGENT = "URGENT"
 
 
+class TicketBulkFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+class TriageJobStatus(str, Enum):
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    ERROR = "ERROR"
+
+
+class TriageJobGraph(str, Enum):
+    GRAPH = "graph"
+    MULTI = "multi"
+
+
 class CategoryCreate(BaseModel):
     name: str
     description: str | None = None
@@ -29,6 +48,29 @@ class TicketCreate(BaseModel):
     category_id: int | None = None
 
 
+class TicketRead(BaseModel):
+    id: int
+    title: str
+    description: str
+    status: str
+    priority: str
+    category_id: int | None = None
+    category_name: str | None = None  # jointure category, pas de 2e appel côté client
+    created_at: datetime
+    updated_at: datetime
+
+
+class TicketCreated(TicketRead):
+    # détection de doublons à la création: ticket canonique + similarité de Jaccard estimée
+    duplicate_of: int | None = None
+    duplicate_similarity: float | None = None
+
+
+class TicketListPage(BaseModel):
+    items: list[TicketRead]
+    next_cursor: str | None = None  # à repasser en ?cursor= pour la page suivante
+
+
 class TicketUpdate(BaseModel):
     title: str | None = None
     description: str | None = None
@@ -47,4 +89,21 @@ class McpTriageSuggestion(BaseModel):
 class McpTriageResult(BaseModel):
     ticket_id: int
     suggestion: McpTriageSuggestion
-    patch_to_apply: dict[str, Any]
\ No newline at end of file
+    patch_to_apply: dict[str, Any]
+
+
+class TriageBatchRequest(BaseModel):
+    # soit une liste d'ids, soit un filtre (status/priority/category_id)
+    ticket_ids: list[int] | None = None
+    status: TicketStatus | None = None
+    priority: TicketPriority | None = None
+    category_id: int | None = None
+    limit: int | None = None
+
+    apply: bool = False
+    concurrency: int | None = None
+
+
+class TriageJobCreate(BaseModel):
+    ticket_id: int
+    graph: TriageJobGraph = TriageJobGraph.GRAPH
@@ -1,26 +1,38 @@
+from dataclasses import asdict
 from typing import TypedDict, List, Dict, Any
 
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
 
-from app.services.ticket_service import get_ticket
-from app.services.category_service import list_categories
-from app.agents.triage_agent import suggest_triage
-from app.services.triage_policy import apply_guardrails
+from app.db.engine import new_session
+from app.services.triage_service import aload_triage_context
+from app.agents.triage_agent import suggest_triage, reused_suggestion, copied_suggestion, TriageSuggestion
+from app.services.similar_tickets import lookup
+from app.services.triage_policy import apply_guardrails, rules_decision, default_status_for
+from app.observability.metrics import observe_node, record_category_mismatch
+from app.observability.tracing import trace_node
 
 
 class TriageState(TypedDict, total=False):
     ticket_id: int
 
-    # données ticket
+    # données ticket (TicketSnapshot détaché)
     ticket: Any
     title: str
     description: str
 
-    # catégories
-    cats: List[Any]
+    # catégories (snapshot CategoryCatalog)
+    catalog: Any
     allowed_names: List[str]
 
-    # sortie LLM
+    # décision pré-LLM (RuleDecision | None) + chemin pris: "duplicate", "rules", "similar" ou "llm"
+    rules: Any
+    path: str
+
+    # tickets similaires déjà triés (SimilarLookup): décision reprise ou exemples few-shot
+    similar: Any
+
+    # sortie LLM (ou synthétisée par les règles)
     suggestion: Any
 
     # sortie finale
@@ -28,69 +40,127 @@ class TriageState(TypedDict, total=False):
     response: Dict[str, Any]
 
 
-def build_triage_graph(session):
-    # Node 1: fetch ticket + catégories
-    def fetch(state: TriageState) -> dict:
-        ticket_id = state["ticket_id"]
+def _session_factory(config: RunnableConfig):
+    # fabrique de sessions courtes, surchargeable par l'appelant (config["configurable"]["session_factory"]):
+    # aucune session n'est gardée ouverte pendant les appels LLM
+    return (config.get("configurable") or {}).get("session_factory", new_session)
+
+
+def build_triage_graph():
+    """
+    Compilé une seule fois (lifespan). Le node fetch lit un snapshot du ticket dans une session
+    courte; la suite (LLM) tourne sans connexion DB:
+    graph.ainvoke({"ticket_id": ...}, config={"configurable": {"session_factory": new_session}})
+    """
 
-        ticket = get_ticket(session, ticket_id)
+    # Node 1: fetch snapshot ticket + catégories (executor DB, session fermée en sortie de node)
+    async def fetch(state: TriageState, config: RunnableConfig) -> dict:
+        ticket, catalog = await aload_triage_context(state["ticket_id"], _session_factory(config))
         if not ticket:
             raise ValueError("Ticket introuvable")
-
-        cats = list_categories(session)
-        if not cats:
+        if catalog.is_empty:
             raise ValueError("Aucune catégorie en base")
 
         return {
             "ticket": ticket,
             "title": ticket.title,
             "description": ticket.description,
-            "cats": cats,
-            "allowed_names": [c.name for c in cats],
+            "catalog": catalog,
+            "allowed_names": list(catalog.names),
         }
 
-    # Node 2: appel LLM (agent PydanticAI)
-    async def llm_suggest(state: TriageState) -> dict:
+    # Node 2: doublon d'un ticket déjà trié (décision du canonique reprise), sinon fast-path règles
+    # (pas d'appel LLM si catégorie + priorité sûres), sinon ticket similaire déjà trié (au-delà du seuil)
+    def rules(state: TriageState, config: RunnableConfig) -> dict:
+        canonical = state["ticket"].canonical_decision
+        if canonical is not None:
+            return {"rules": None, "path": "duplicate", "suggestion": copied_suggestion(canonical, state["title"])}
+
+        decision = rules_decision(state["ticket"], state["catalog"].name_to_id)
+        if decision is None or decision.priority is None:
+            similar = lookup(
+                state["title"], state["description"], state["allowed_names"], exclude_id=state["ticket_id"]
+            )
+            if similar.reuse is not None:
+                return {
+                    "rules": decision,
+                    "path": "similar",
+                    "similar": similar,
+                    "suggestion": reused_suggestion(similar.reuse, state["title"]),
+                }
+            return {"rules": decision, "path": "llm", "similar": similar}
+
+        suggestion = TriageSuggestion(
+            category_name=decision.category_name,
+            priority=decision.priority,
+            status=default_status_for(decision.priority),
+            summary=state["title"][:200],
+            rationale=[f"Règle mots-clés {decision.category_name}: {', '.join(decision.keywords)}"],
+            draft_reply=None,
+        )
+        return {"rules": decision, "path": "rules", "suggestion": suggestion}
+
+    def route_after_rules(state: TriageState) -> str:
+        return "llm_suggest" if state["path"] == "llm" else "apply_policy_and_format"
+
+    # Node 3: appel LLM (agent PydanticAI)
+    async def llm_suggest(state: TriageState, config: RunnableConfig) -> dict:
         suggestion = await suggest_triage(
             state["title"],
             state["description"],
             state["allowed_names"],
+            state["catalog"].allowed_json,
+            ticket_id=state["ticket_id"],
+            similar=state.get("similar"),
+            duplicate_group=state["ticket"].duplicate_group,
         )
         return {"suggestion": suggestion}
 
-    # Node 3: mapping category + guardrails + build response
-    def apply_policy_and_format(state: TriageState) -> dict:
+    # Node 4: mapping category + guardrails + build response
+    def apply_policy_and_format(state: TriageState, config: RunnableConfig) -> dict:
         suggestion = state["suggestion"]
-        cats = state["cats"]
+        catalog = state["catalog"]
         ticket = state["ticket"]
 
-        matched = next((c for c in cats if c.name == suggestion.category_name), None)
-        if not matched:
+        category_id = catalog.name_to_id.get(suggestion.category_name)
+        if category_id is None:
+            record_category_mismatch(graph="graph")
             raise ValueError("category_name hors liste exacte")
 
         patch = {
-            "category_id": matched.id,
+            "category_id": category_id,
             "priority": suggestion.priority.value,
             "status": suggestion.status.value,
         }
 
-        name_to_id = {c.name: c.id for c in cats}
-        patch = apply_guardrails(ticket, patch, category_name_to_id=name_to_id)
+        patch = apply_guardrails(ticket, patch, category_name_to_id=catalog.name_to_id)
 
+        similar = state.get("similar")
         response = {
             "ticket_id": state["ticket_id"],
             "suggestion": suggestion.model_dump(),
             "patch_to_apply": patch,
+            "path": state["path"],
+            "rules": asdict(state["rules"]) if state.get("rules") else None,
+            "similar": asdict(similar.reuse) if similar is not None and similar.reuse else None,
+            # doublon: trié sur le texte de son ticket canonique (cf. triage_service)
+            "duplicate_of": ticket.duplicate_of,
         }
         return {"patch": patch, "response": response}
 
     g = StateGraph(TriageState)
-    g.add_node("fetch", fetch)
-    g.add_node("llm_suggest", llm_suggest)
-    g.add_node("apply_policy_and_format", apply_policy_and_format)
+    # chaque node alimente l'histogramme triage_graph_node_seconds{graph="graph"} et ouvre un span de trace
+    for name, fn in (
+        ("fetch", fetch),
+        ("rules", rules),
+        ("llm_suggest", llm_suggest),
+        ("apply_policy_and_format", apply_policy_and_format),
+    ):
+        g.add_node(name, observe_node("graph", name, trace_node("graph", name, fn)))
 
     g.add_edge(START, "fetch")
-    g.add_edge("fetch", "llm_suggest")
+    g.add_edge("fetch", "rules")
+    g.add_conditional_edges("rules", route_after_rules, ["llm_suggest", "apply_policy_and_format"])
     g.add_edge("llm_suggest", "apply_policy_and_format")
     g.add_edge("apply_policy_and_format", END)
 
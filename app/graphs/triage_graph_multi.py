@@ -1,26 +1,69 @@
-from typing import TypedDict, Any, List, Dict
+import os
+import time
+import inspect
+import functools
+from dataclasses import asdict
+from typing import TypedDict, Annotated, Any, List, Dict
 
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
 
-from app.services.ticket_service import get_ticket
-from app.services.category_service import list_categories
-from app.services.triage_policy import apply_guardrails
+from app.db.engine import new_session
+from app.services.triage_service import aload_triage_context
+from app.services.triage_policy import apply_guardrails, rules_decision, default_status_for
+from app.services.similar_tickets import lookup
+from app.services.duplicate_tickets import shared_triage
+from app.observability.metrics import observe_node, record_category_mismatch
+from app.observability.tracing import trace_node
 
-from app.agents.classify_agent import classify_ticket
-from app.agents.priority_agent import prioritize_ticket
+from app.agents.classify_agent import classify_ticket, CategorySuggestion
+from app.agents.priority_agent import prioritize_ticket, PrioritySuggestion
 from app.agents.reply_agent import draft_reply
 
+# classify et prioritize en parallèle (défaut) ou en séquence (classify -> prioritize -> reply)
+TRIAGE_MULTI_PARALLEL = os.getenv("TRIAGE_MULTI_PARALLEL", "1") == "1"
+
+
+def _merge_timings(a: Dict[str, float], b: Dict[str, float]) -> Dict[str, float]:
+    # reducer: les nodes parallèles écrivent chacun leur timing dans le même superstep
+    return {**(a or {}), **(b or {})}
+
+
+def _timed(name: str, fn):
+    """Enregistre la durée (ms) du node dans state["timings"] (et dans triage_graph_node_seconds + span de trace)."""
+    fn = observe_node("multi", name, trace_node("multi", name, fn))
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(state, config: RunnableConfig):
+            t0 = time.perf_counter()
+            out = await fn(state, config)
+            return {**out, "timings": {name: round((time.perf_counter() - t0) * 1000, 1)}}
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(state, config: RunnableConfig):
+        t0 = time.perf_counter()
+        out = fn(state, config)
+        return {**out, "timings": {name: round((time.perf_counter() - t0) * 1000, 1)}}
+    return wrapper
+
 
 class TriageState(TypedDict, total=False):
     ticket_id: int
+    started_at: float
 
-    ticket: Any
+    ticket: Any  # TicketSnapshot détaché
     title: str
     description: str
 
-    cats: List[Any]
+    catalog: Any
     allowed_names: List[str]
 
+    # décision pré-LLM (RuleDecision | None): peut remplacer classify (et prioritize)
+    rules: Any
+    # tickets similaires déjà triés (SimilarLookup): décision reprise ou exemples few-shot
+    similar: Any
+
     cat_suggestion: Any
     prio_suggestion: Any
     reply_suggestion: Any
@@ -28,67 +71,163 @@ class TriageState(TypedDict, total=False):
     patch: Dict[str, Any]
     response: Dict[str, Any]
 
+    timings: Annotated[Dict[str, float], _merge_timings]
+
+
+def _examples(state) -> tuple:
+    similar = state.get("similar")
+    return similar.examples if similar is not None else ()
+
+
+def _shared(state, scope: tuple, make):
+    # groupe de doublons: un seul appel LLM par étape pour le canonique et ses doublons
+    group = state["ticket"].duplicate_group
+    return make() if group is None else shared_triage(group, ("multi", *scope), make)
+
+
+def _session_factory(config: RunnableConfig):
+    # fabrique de sessions courtes, surchargeable par l'appelant (config["configurable"]["session_factory"]):
+    # aucune session n'est gardée ouverte pendant les appels LLM
+    return (config.get("configurable") or {}).get("session_factory", new_session)
 
-def build_triage_graph_multi(session):
-    def fetch(state: TriageState) -> dict:
-        ticket_id = state["ticket_id"]
-        ticket = get_ticket(session, ticket_id)
+
+def build_triage_graph_multi(parallel: bool = TRIAGE_MULTI_PARALLEL):
+    """Compilé une seule fois par mode (lifespan). Invocation: cf. build_triage_graph."""
+
+    async def fetch(state: TriageState, config: RunnableConfig) -> dict:
+        started_at = time.perf_counter()
+        ticket, catalog = await aload_triage_context(state["ticket_id"], _session_factory(config))
         if not ticket:
             raise ValueError("Ticket introuvable")
-
-        cats = list_categories(session)
-        if not cats:
+        if catalog.is_empty:
             raise ValueError("Aucune catégorie en base")
 
         return {
+            "started_at": started_at,
             "ticket": ticket,
             "title": ticket.title,
             "description": ticket.description,
-            "cats": cats,
-            "allowed_names": [c.name for c in cats],
+            "catalog": catalog,
+            "allowed_names": list(catalog.names),
         }
 
-    async def classify(state: TriageState) -> dict:
-        cat_suggestion = await classify_ticket(state["title"], state["description"], state["allowed_names"])
+    def rules(state: TriageState, config: RunnableConfig) -> dict:
+        canonical = state["ticket"].canonical_decision
+        if canonical is not None:
+            # doublon d'un ticket déjà trié: décision du canonique reprise, seule la réponse reste à rédiger
+            why = f"Doublon du ticket #{canonical.ticket_id} déjà trié"
+            return {
+                "rules": None,
+                "cat_suggestion": CategorySuggestion(
+                    category_name=canonical.category_name, summary=state["title"][:200], rationale=[why]
+                ),
+                "prio_suggestion": PrioritySuggestion(
+                    priority=canonical.priority, status=canonical.status, rationale=[why]
+                ),
+            }
+
+        decision = rules_decision(state["ticket"], state["catalog"].name_to_id)
+        out: dict = {"rules": decision}
+        if decision is not None:
+            why = f"Règle mots-clés {decision.category_name}: {', '.join(decision.keywords)}"
+            out["cat_suggestion"] = CategorySuggestion(
+                category_name=decision.category_name,
+                summary=state["title"][:200],
+                rationale=[why],
+            )
+            if decision.priority is not None:
+                out["prio_suggestion"] = PrioritySuggestion(
+                    priority=decision.priority,
+                    status=default_status_for(decision.priority),
+                    rationale=[why],
+                )
+        if "prio_suggestion" in out:
+            return out
+
+        # ticket similaire déjà trié: complète ce que les règles n'ont pas décidé, sinon exemples few-shot
+        similar = lookup(state["title"], state["description"], state["allowed_names"], exclude_id=state["ticket_id"])
+        out["similar"] = similar
+        hit = similar.reuse
+        if hit is not None:
+            why = f"Ticket similaire #{hit.ticket_id} déjà trié (similarité {hit.score:.2f})"
+            if "cat_suggestion" not in out:
+                out["cat_suggestion"] = CategorySuggestion(
+                    category_name=hit.category_name, summary=state["title"][:200], rationale=[why]
+                )
+            out["prio_suggestion"] = PrioritySuggestion(priority=hit.priority, status=hit.status, rationale=[why])
+        return out
+
+    def _llm_nodes_needed(state: TriageState) -> list[str]:
+        needed = []
+        if state.get("cat_suggestion") is None:
+            needed.append("classify")
+        if state.get("prio_suggestion") is None:
+            needed.append("prioritize")
+        return needed
+
+    def route_after_rules(state: TriageState):
+        needed = _llm_nodes_needed(state)
+        if not needed:
+            return "reply"
+        return needed if parallel else needed[0]
+
+    def route_after_classify(state: TriageState) -> str:
+        return "prioritize" if state.get("prio_suggestion") is None else "reply"
+
+    async def classify(state: TriageState, config: RunnableConfig) -> dict:
+        cat_suggestion = await _shared(
+            state,
+            ("classify", tuple(state["allowed_names"])),
+            lambda: classify_ticket(
+                state["title"],
+                state["description"],
+                state["allowed_names"],
+                state["catalog"].allowed_json,
+                examples=_examples(state),
+            ),
+        )
         return {"cat_suggestion": cat_suggestion}
 
-    async def prioritize(state: TriageState) -> dict:
-        prio_suggestion = await prioritize_ticket(
-            state["title"],
-            state["description"],
-            state["cat_suggestion"].category_name,
+    async def prioritize(state: TriageState, config: RunnableConfig) -> dict:
+        # en parallèle, la catégorie n'est pas encore connue: la priorisation s'en passe
+        cat = state.get("cat_suggestion")
+        category_name = cat.category_name if cat is not None else None
+        prio_suggestion = await _shared(
+            state,
+            ("prioritize", category_name),
+            lambda: prioritize_ticket(state["title"], state["description"], category_name, examples=_examples(state)),
         )
         return {"prio_suggestion": prio_suggestion}
 
-    async def reply(state: TriageState) -> dict:
-        reply_suggestion = await draft_reply(
-            state["title"],
-            state["description"],
-            state["cat_suggestion"].category_name,
-            state["prio_suggestion"].priority,
+    async def reply(state: TriageState, config: RunnableConfig) -> dict:
+        category_name, priority = state["cat_suggestion"].category_name, state["prio_suggestion"].priority
+        reply_suggestion = await _shared(
+            state,
+            ("reply", category_name, priority),
+            lambda: draft_reply(state["title"], state["description"], category_name, priority),
         )
         return {"reply_suggestion": reply_suggestion}
 
-    def policy_and_format(state: TriageState) -> dict:
+    def policy_and_format(state: TriageState, config: RunnableConfig) -> dict:
         ticket = state["ticket"]
-        cats = state["cats"]
+        catalog = state["catalog"]
 
         cat = state["cat_suggestion"]
         pr = state["prio_suggestion"]
         rep = state["reply_suggestion"]
 
-        matched = next((c for c in cats if c.name == cat.category_name), None)
-        if not matched:
+        category_id = catalog.name_to_id.get(cat.category_name)
+        if category_id is None:
+            record_category_mismatch(graph="multi")
             raise ValueError("category_name hors liste exacte")
 
         patch = {
-            "category_id": matched.id,
+            "category_id": category_id,
             "priority": pr.priority.value,
             "status": pr.status.value,
         }
 
-        name_to_id = {c.name: c.id for c in cats}
-        patch = apply_guardrails(ticket, patch, category_name_to_id=name_to_id)
+        patch = apply_guardrails(ticket, patch, category_name_to_id=catalog.name_to_id)
 
         # Fusion “suggestion” finale (multi-agents)
         rationale = (cat.rationale or []) + (pr.rationale or [])
@@ -103,20 +242,57 @@ def build_triage_graph_multi(session):
             "draft_reply": rep.draft_reply,
         }
 
-        response = {"ticket_id": state["ticket_id"], "suggestion": suggestion, "patch_to_apply": patch}
+        timings = dict(state.get("timings") or {})
+        timings["total"] = round((time.perf_counter() - state["started_at"]) * 1000, 1)
+
+        decision = state.get("rules")
+        similar = state.get("similar")
+        reused = similar.reuse if similar is not None else None
+        if ticket.canonical_decision is not None:
+            path = "duplicate"
+        elif decision is None:
+            path = "similar" if reused is not None else "llm"
+        elif decision.priority is None:
+            # catégorie par règles, priorité par LLM (ou reprise d'un ticket similaire)
+            path = "rules+similar" if reused is not None else "rules+llm"
+        else:
+            path = "rules"
+
+        response = {
+            "ticket_id": state["ticket_id"],
+            "suggestion": suggestion,
+            "patch_to_apply": patch,
+            "mode": "parallel" if parallel else "sequential",
+            "path": path,
+            "rules": asdict(decision) if decision else None,
+            "similar": asdict(reused) if reused is not None else None,
+            "duplicate_of": ticket.duplicate_of,
+            "timings_ms": timings,
+        }
         return {"patch": patch, "response": response}
 
     g = StateGraph(TriageState)
-    g.add_node("fetch", fetch)
-    g.add_node("classify", classify)
-    g.add_node("prioritize", prioritize)
-    g.add_node("reply", reply)
-    g.add_node("policy_and_format", policy_and_format)
+    g.add_node("fetch", _timed("fetch", fetch))
+    g.add_node("rules", _timed("rules", rules))
+    g.add_node("classify", _timed("classify", classify))
+    g.add_node("prioritize", _timed("prioritize", prioritize))
+    g.add_node("reply", _timed("reply", reply))
+    g.add_node(
+        "policy_and_format",
+        observe_node("multi", "policy_and_format", trace_node("multi", "policy_and_format", policy_and_format)),
+    )
 
     g.add_edge(START, "fetch")
-    g.add_edge("fetch", "classify")
-    g.add_edge("classify", "prioritize")
-    g.add_edge("prioritize", "reply")
+    g.add_edge("fetch", "rules")
+    g.add_conditional_edges("rules", route_after_rules, ["classify", "prioritize", "reply"])
+    if parallel:
+        # fan-out classify || prioritize (même superstep): reply démarre une fois, dès que les deux sont prêts.
+        # Pas de jointure stricte: l'une des branches peut être court-circuitée par les règles.
+        g.add_edge("classify", "reply")
+        g.add_edge("prioritize", "reply")
+    else:
+        g.add_conditional_edges("classify", route_after_classify, ["prioritize", "reply"])
+        g.add_edge("prioritize", "reply")
     g.add_edge("reply", "policy_and_format")
     g.add_edge("policy_and_format", END)
 
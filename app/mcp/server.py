@@ -1,18 +1,42 @@
 from __future__ import annotations
 
+import os
 import json
-from typing import Optional, Any, Annotated
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional, Any, Annotated, Mapping
 
 from mcp.server.fastmcp import FastMCP
 from mcp.types import CallToolResult, TextContent
 from sqlmodel import Session, select
 
-from app.db.engine import engine
+from app.db.engine import new_read_session
+from app.db.executor import run_in_session
 from app.domain.schemas import TicketPriority, TicketStatus, McpTriageResult
 from app.domain.models import Ticket, Category
 
-from app.agents.triage_agent import suggest_triage
+from app.agents.triage_agent import suggest_triage, TriageParseError
+from app.services.ticket_service import (
+    aget_ticket_with_category, aupdate_ticket, alist_tickets_page, alist_tickets_for_triage, apply_triage_patches,
+)
+from app.services.category_service import CategoryCatalog, aget_category_catalog
 from app.services.triage_policy import apply_guardrails
+from app.services.duplicate_tickets import commit_with_fingerprints, duplicate_fields
+from app.services.triage_service import (
+    TicketSnapshot, aload_triage_context, aload_triage_batch, acommit_triage_patch, acommit_triage_patches,
+)
+
+from app.observability.metrics import record_timeout, record_category_mismatch
+
+logger = logging.getLogger("mcp_server")
+
+LLM_TIMEOUT_SECONDS = int(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+
+# tools *_many: appels LLM simultanés (défaut / plafond) et nb max de tickets par appel
+MCP_TRIAGE_CONCURRENCY = int(os.getenv("MCP_TRIAGE_CONCURRENCY", "4"))
+MCP_TRIAGE_MAX_CONCURRENCY = int(os.getenv("MCP_TRIAGE_MAX_CONCURRENCY", "16"))
+MCP_BATCH_MAX_TICKETS = int(os.getenv("MCP_BATCH_MAX_TICKETS", "50"))
 
 
 # Streamable HTTP + stateless + JSON response (scalable)
@@ -21,76 +45,80 @@ mcp = FastMCP(
     stateless_http=True,
     json_response=True,
     instructions=(
-        "Serveur MCP exposant des tools CRUD Tickets/Categories et un tool de triage LLM "
-        "(Ollama/PydanticAI)."
+        "Serveur MCP exposant des tools CRUD Tickets/Categories et des tools de triage LLM "
+        "(Ollama/PydanticAI). Pour plusieurs tickets, préférer triage_suggest_many / "
+        "triage_apply_many / update_tickets (un seul appel)."
     ),
 )
 
 mcp.settings.streamable_http_path = "/"
 
 
-def _session() -> Session:
-    return Session(engine)
+def _ticket_row(t: Ticket, category_name: Optional[str]) -> dict:
+    return {**t.model_dump(mode="json"), "category_name": category_name}
+
 
-def _cats_by_id(session: Session) -> dict[int, str]:
-    cats = session.exec(select(Category).order_by(Category.id)).all()
-    return {c.id: c.name for c in cats}
+def _ticket_json(t: Ticket, cats_map: Mapping[int, str]) -> dict:
+    # nom via le catalogue en mémoire (pas de requête) quand le ticket vient d'une écriture
+    return _ticket_row(t, cats_map.get(t.category_id) if t.category_id is not None else None)
 
-def _ticket_json(t: Ticket, cats_map: dict[int, str]) -> dict:
-    d = t.model_dump(mode="json")
-    cid = d.get("category_id")
-    d["category_name"] = cats_map.get(cid) if cid is not None else None
-    return d
+# Tools async: tout accès DB passe par l'executor DB (run_in_session), jamais sur la boucle.
 
 @mcp.tool()
-def list_categories() -> list[dict[str, Any]]:
+async def list_categories() -> list[dict[str, Any]]:
     """Lister les catégories."""
-    with _session() as s:
+    def query(s: Session):
         cats = s.exec(select(Category).order_by(Category.id)).all()
         return [{"id": c.id, "name": c.name, "description": c.description} for c in cats]
 
+    return await run_in_session(query, session_factory=new_read_session)
+
 
 @mcp.tool()
-def list_tickets(
+async def list_tickets(
     limit: int = 20,
-    offset: int = 0,
+    cursor: Optional[str] = None,
     status: Optional[TicketStatus] = None,
     priority: Optional[TicketPriority] = None,
     category_id: Optional[int] = None,
-) -> list[dict[str, Any]]:
-    """Lister les tickets (filtrable)."""
-    with _session() as s:
-        q = select(Ticket).order_by(Ticket.id).offset(offset).limit(limit)
-        if status is not None:
-            q = q.where(Ticket.status == status.value)
-        if priority is not None:
-            q = q.where(Ticket.priority == priority.value)
-        if category_id is not None:
-            q = q.where(Ticket.category_id == category_id)
-        rows = s.exec(q).all()
-        return [t.model_dump(mode="json") for t in rows]
+    updated_from: Optional[datetime] = None,
+    updated_to: Optional[datetime] = None,
+) -> dict[str, Any]:
+    """Lister les tickets (filtrables, avec category_name), plus récents d'abord. Suite: cursor=next_cursor."""
+    try:
+        page = await alist_tickets_page(
+            limit=limit,
+            cursor=cursor,
+            status=status,
+            priority=priority,
+            category_id=category_id,
+            updated_from=updated_from,
+            updated_to=updated_to,
+        )
+    except ValueError as e:
+        return {"error": str(e), "cursor": cursor}
+    items = [_ticket_row(t, name) for t, name in zip(page.items, page.category_names)]
+    return {"items": items, "next_cursor": page.next_cursor}
 
 
 @mcp.tool()
-def get_ticket(ticket_id: int) -> dict:
-    with _session() as s:
-        t = s.get(Ticket, ticket_id)
-        if not t:
-            return {"error": "Ticket introuvable", "ticket_id": ticket_id}
-        cats_map = _cats_by_id(s)
-        return _ticket_json(t, cats_map)
+async def get_ticket(ticket_id: int) -> dict:
+    row = await aget_ticket_with_category(ticket_id)  # une seule requête (LEFT JOIN category)
+    if not row:
+        return {"error": "Ticket introuvable", "ticket_id": ticket_id}
+    return _ticket_row(*row)
 
 
 @mcp.tool()
-def create_ticket(
+async def create_ticket(
     title: str,
     description: str,
     priority: TicketPriority = TicketPriority.MEDIUM,
     status: TicketStatus = TicketStatus.OPEN,
     category_id: Optional[int] = None,
 ) -> dict[str, Any]:
-    """Créer un ticket."""
-    with _session() as s:
+    """Créer un ticket. Un quasi-doublon d'un ticket existant est signalé (duplicate_of)."""
+    def create(s: Session):
         t = Ticket(
             title=title,
             description=description,
@@ -99,151 +127,275 @@ def create_ticket(
             category_id=category_id,
         )
         s.add(t)
-        s.commit()
+        s.flush()
+        commit_with_fingerprints(s, [t])
         s.refresh(t)
-        return t.model_dump(mode="json")
+        return {**t.model_dump(mode="json"), **duplicate_fields(t.id)}
+
+    return await run_in_session(create)
 
 
 @mcp.tool()
-def update_ticket(
+async def update_ticket(
     ticket_id: int,
     priority: Optional[TicketPriority] = None,
     status: Optional[TicketStatus] = None,
     category_id: Optional[int] = None,
 ) -> dict[str, Any]:
     """Mettre à jour un ticket (patch simple)."""
-    with _session() as s:
-        t = s.get(Ticket, ticket_id)
-        if not t:
-            return {"error": "Ticket introuvable", "ticket_id": ticket_id}
-
-        if priority is not None:
-            t.priority = priority.value
-        if status is not None:
-            t.status = status.value
-        if category_id is not None:
-            t.category_id = category_id
-
-        s.add(t)
-        s.commit()
-        s.refresh(t)
+    # via le service: updated_at est mis à jour (détection de conflit du triage en phases)
+    try:
+        t = await aupdate_ticket(ticket_id, priority=priority, status=status, category_id=category_id)
+    except ValueError:
+        return {"error": "Ticket introuvable", "ticket_id": ticket_id}
+
+    catalog = await aget_category_catalog()
+    return _ticket_json(t, catalog.id_to_name)
+
+
+def _tool_result(structured: dict, is_error: bool = False) -> CallToolResult:
+    return CallToolResult(
+        content=[TextContent(type="text", text=json.dumps(structured, ensure_ascii=False))],
+        structuredContent=structured,
+        isError=is_error,
+    )
+
+
+async def _suggest_for(t: TicketSnapshot, catalog: CategoryCatalog) -> dict:
+    """Appel LLM (sans session ouverte) + guardrails. Le dict contient "error" si la sortie est inutilisable."""
+    ticket_id = t.id
+    allowed_names = list(catalog.names)
+    suggestion = await suggest_triage(
+        t.title,
+        t.description,
+        allowed_names,
+        catalog.allowed_json,
+        ticket_id=ticket_id,
+        duplicate_group=t.duplicate_group,
+        canonical=t.canonical_decision,
+    )
+
+    category_id = catalog.name_to_id.get(suggestion.category_name)
+    if category_id is None:
+        record_category_mismatch()
+        return {
+            "ticket_id": ticket_id,
+            "error": "category_name hors liste exacte",
+            "allowed_categories": allowed_names,
+            "got": suggestion.category_name,
+        }
 
-        cats_map = _cats_by_id(s)
-        return _ticket_json(t, cats_map)
+    patch = {
+        "category_id": category_id,
+        "priority": suggestion.priority.value,
+        "status": suggestion.status.value,
+    }
+    patch = apply_guardrails(t, patch, category_name_to_id=catalog.name_to_id)
+    return {
+        "ticket_id": ticket_id,
+        "suggestion": suggestion.model_dump(),
+        "patch_to_apply": patch,
+    }
+
+
+async def _triage_patch(ticket_id: int) -> tuple[Optional[TicketSnapshot], Any, dict]:
+    """
+    Lecture courte (snapshot + catalogue), puis appel LLM sans session ouverte.
+    Retourne (snapshot, catalogue, structured): structured contient "error" en cas d'échec.
+    """
+    t, catalog = await aload_triage_context(ticket_id)
+    if not t:
+        return None, catalog, {"ticket_id": ticket_id, "error": "Ticket introuvable"}
+    if catalog.is_empty:
+        return t, catalog, {"ticket_id": ticket_id, "error": "Aucune catégorie en base"}
+    return t, catalog, await _suggest_for(t, catalog)
 
 
 @mcp.tool()
 async def triage_suggest(ticket_id: int) -> Annotated[CallToolResult, McpTriageResult]:
-    with Session(engine) as s:
-        t = s.get(Ticket, ticket_id)
-        if not t:
-            structured = {"ticket_id": ticket_id, "error": "Ticket introuvable"}
-            return CallToolResult(
-                content=[TextContent(type="text", text=json.dumps(structured, ensure_ascii=False))],
-                structuredContent=structured,
-                isError=True,
-            )
+    _, _, structured = await _triage_patch(ticket_id)
+    return _tool_result(structured, is_error="error" in structured)
 
-        cats = s.exec(select(Category).order_by(Category.id)).all()
-        allowed_names = [c.name for c in cats]
-
-        suggestion = await suggest_triage(t.title, t.description, allowed_names)
-
-        matched = next((c for c in cats if c.name == suggestion.category_name), None)
-        if not matched:
-            structured = {
-                "ticket_id": ticket_id,
-                "error": "category_name hors liste exacte",
-                "allowed_categories": allowed_names,
-                "got": suggestion.category_name,
-            }
-            return CallToolResult(
-                content=[TextContent(type="text", text=json.dumps(structured, ensure_ascii=False))],
-                structuredContent=structured,
-                isError=True,
-            )
+@mcp.tool()
+async def triage_apply(ticket_id: int) -> CallToolResult:
+    t, catalog, structured = await _triage_patch(ticket_id)
+    if "error" in structured:
+        return _tool_result(structured, is_error=True)
+
+    # écriture courte: ticket relu, guardrails recalculés s'il a changé pendant l'appel LLM
+    updated = await acommit_triage_patch(t, structured["patch_to_apply"], catalog.name_to_id)
+    if updated is None:
+        return _tool_result({"ticket_id": ticket_id, "error": "Ticket introuvable"}, is_error=True)
+
+    applied = {k: getattr(updated, k) for k in ("category_id", "priority", "status")}
+    return _tool_result({
+        "ticket_id": ticket_id,
+        "applied_patch": applied,
+        "updated_ticket": _ticket_json(updated, catalog.id_to_name),
+    })
+
+
+# ---------- tools batch: un seul appel MCP pour N tickets ----------
+
+async def _select_tickets(
+    ticket_ids: Optional[list[int]],
+    status: Optional[TicketStatus],
+    priority: Optional[TicketPriority],
+    category_id: Optional[int],
+    limit: int,
+) -> tuple[list[TicketSnapshot], CategoryCatalog, list[int]] | dict:
+    """Snapshots + catalogue partagé (une seule lecture) et ids introuvables; dict d'erreur si sélection invalide."""
+    if not ticket_ids and status is None and priority is None and category_id is None:
+        return {"error": "Préciser ticket_ids ou au moins un filtre (status, priority, category_id)"}
+    if ticket_ids:
+        ticket_ids = list(dict.fromkeys(ticket_ids))
+        if len(ticket_ids) > MCP_BATCH_MAX_TICKETS:
+            return {"error": f"Maximum {MCP_BATCH_MAX_TICKETS} tickets par appel", "got": len(ticket_ids)}
+
+    tickets, catalog = await aload_triage_batch(
+        ticket_ids=ticket_ids or None,
+        status=status,
+        priority=priority,
+        category_id=category_id,
+        # liste d'ids: déjà plafonnée; filtre: `limit`
+        limit=None if ticket_ids else max(1, min(limit, MCP_BATCH_MAX_TICKETS)),
+    )
+    found = {t.id for t in tickets}
+    missing = [i for i in (ticket_ids or []) if i not in found]
+    return tickets, catalog, missing
+
+
+async def _suggest_many(
+    tickets: list[TicketSnapshot], catalog: CategoryCatalog, concurrency: Optional[int]
+) -> list[dict]:
+    concurrency = max(1, min(concurrency or MCP_TRIAGE_CONCURRENCY, MCP_TRIAGE_MAX_CONCURRENCY))
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(t: TicketSnapshot) -> dict:
+        async with sem:
+            try:
+                return await asyncio.wait_for(_suggest_for(t, catalog), timeout=LLM_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                record_timeout()
+                return {"ticket_id": t.id, "error": f"Timeout LLM après {LLM_TIMEOUT_SECONDS}s."}
+            except TriageParseError as e:
+                return {"ticket_id": t.id, "error": str(e)}
+            except Exception as e:
+                logger.exception("triage MCP ticket_id=%s: %s", t.id, e)
+                return {"ticket_id": t.id, "error": f"Erreur LLM/Ollama: {e}"}
+
+    return await asyncio.gather(*(one(t) for t in tickets))
+
+
+def _compact(item: dict) -> dict:
+    # résumé par ticket: la décision, sans rationale/brouillon (cf. triage_suggest pour le détail)
+    if "error" in item:
+        return {"ticket_id": item["ticket_id"], "error": item["error"]}
+    patch = item["patch_to_apply"]
+    return {
+        "ticket_id": item["ticket_id"],
+        "category_name": item["suggestion"]["category_name"],
+        "category_id": patch["category_id"],
+        "priority": patch["priority"],
+        "status": patch["status"],
+    }
+
+
+async def _triage_many(ticket_ids, status, priority, category_id, limit, concurrency, *, apply: bool) -> CallToolResult:
+    selected = await _select_tickets(ticket_ids, status, priority, category_id, limit)
+    if isinstance(selected, dict):
+        return _tool_result(selected, is_error=True)
+    tickets, catalog, missing = selected
+    if catalog.is_empty:
+        return _tool_result({"error": "Aucune catégorie en base"}, is_error=True)
+
+    results = await _suggest_many(tickets, catalog, concurrency)
+    items = [_compact(r) for r in results] + [{"ticket_id": i, "error": "Ticket introuvable"} for i in missing]
+
+    summary = {"total": len(items), "ok": sum("error" not in i for i in items)}
+    summary["errors"] = summary["total"] - summary["ok"]
+
+    if apply:
+        patches = {r["ticket_id"]: r["patch_to_apply"] for r in results if "error" not in r}
+        # une seule transaction; guardrails recalculés pour les tickets modifiés pendant les appels LLM
+        updated = await acommit_triage_patches({t.id: t for t in tickets}, patches, catalog.name_to_id)
+        fresh = {t.id: t for t in updated}
+        for i in items:
+            t = fresh.get(i["ticket_id"])
+            if t is not None:
+                i.update(applied=True, category_id=t.category_id, priority=t.priority, status=t.status)
+        summary["applied"] = len(updated)
+
+    is_error = summary["total"] > 0 and summary["ok"] == 0
+    return _tool_result({"summary": summary, "results": items}, is_error=is_error)
 
-        patch = {
-            "category_id": matched.id,
-            "priority": suggestion.priority.value,
-            "status": suggestion.status.value,
-        }
-        name_to_id = {c.name: c.id for c in cats}
-        patch = apply_guardrails(t, patch, category_name_to_id=name_to_id)
 
-        structured = {
-            "ticket_id": ticket_id,
-            "suggestion": suggestion.model_dump(),
-            "patch_to_apply": patch,
-        }
+@mcp.tool()
+async def triage_suggest_many(
+    ticket_ids: Optional[list[int]] = None,
+    status: Optional[TicketStatus] = None,
+    priority: Optional[TicketPriority] = None,
+    category_id: Optional[int] = None,
+    limit: int = 20,
+    concurrency: Optional[int] = None,
+) -> CallToolResult:
+    """Suggérer le triage de plusieurs tickets (liste d'ids ou filtre), appels LLM en parallèle. Rien n'est écrit."""
+    return await _triage_many(ticket_ids, status, priority, category_id, limit, concurrency, apply=False)
 
-        return CallToolResult(
-            content=[TextContent(type="text", text=json.dumps(structured, ensure_ascii=False))],
-            structuredContent=structured,
-        )
 
 @mcp.tool()
-async def triage_apply(ticket_id: int) -> CallToolResult:
-    with Session(engine) as s:
-        t = s.get(Ticket, ticket_id)
-        if not t:
-            structured = {"ticket_id": ticket_id, "error": "Ticket introuvable"}
-            return CallToolResult(
-                content=[TextContent(type="text", text=json.dumps(structured, ensure_ascii=False))],
-                structuredContent=structured,
-                isError=True,
-            )
+async def triage_apply_many(
+    ticket_ids: Optional[list[int]] = None,
+    status: Optional[TicketStatus] = None,
+    priority: Optional[TicketPriority] = None,
+    category_id: Optional[int] = None,
+    limit: int = 20,
+    concurrency: Optional[int] = None,
+) -> CallToolResult:
+    """Trier et appliquer le triage de plusieurs tickets (liste d'ids ou filtre) en une seule transaction."""
+    return await _triage_many(ticket_ids, status, priority, category_id, limit, concurrency, apply=True)
 
-        cats = s.exec(select(Category).order_by(Category.id)).all()
-        if not cats:
-            structured = {"ticket_id": ticket_id, "error": "Aucune catégorie en base"}
-            return CallToolResult(
-                content=[TextContent(type="text", text=json.dumps(structured, ensure_ascii=False))],
-                structuredContent=structured,
-                isError=True,
-            )
 
-        allowed_names = [c.name for c in cats]
-        suggestion = await suggest_triage(t.title, t.description, allowed_names)
-
-        matched = next((c for c in cats if c.name == suggestion.category_name), None)
-        if not matched:
-            structured = {
-                "ticket_id": ticket_id,
-                "error": "category_name hors liste exacte",
-                "allowed_categories": allowed_names,
-                "got": suggestion.category_name,
-            }
-            return CallToolResult(
-                content=[TextContent(type="text", text=json.dumps(structured, ensure_ascii=False))],
-                structuredContent=structured,
-                isError=True,
+@mcp.tool()
+async def update_tickets(
+    ticket_ids: Optional[list[int]] = None,
+    where_status: Optional[TicketStatus] = None,
+    where_priority: Optional[TicketPriority] = None,
+    where_category_id: Optional[int] = None,
+    limit: int = 20,
+    priority: Optional[TicketPriority] = None,
+    status: Optional[TicketStatus] = None,
+    category_id: Optional[int] = None,
+) -> CallToolResult:
+    """Mettre à jour plusieurs tickets (liste d'ids ou filtre where_*) avec le même patch, en une transaction."""
+    fields = {"priority": priority, "status": status, "category_id": category_id}
+    fields = {k: v for k, v in fields.items() if v is not None}
+    if not fields:
+        return _tool_result({"error": "Aucun champ à mettre à jour (priority, status, category_id)"}, is_error=True)
+
+    if not ticket_ids:
+        if where_status is None and where_priority is None and where_category_id is None:
+            return _tool_result({"error": "Préciser ticket_ids ou au moins un filtre where_*"}, is_error=True)
+        rows = await alist_tickets_for_triage(
+            status=where_status,
+            priority=where_priority,
+            category_id=where_category_id,
+            limit=max(1, min(limit, MCP_BATCH_MAX_TICKETS)),
+        )
+        ticket_ids = [t.id for t in rows]
+    else:
+        ticket_ids = list(dict.fromkeys(ticket_ids))
+        if len(ticket_ids) > MCP_BATCH_MAX_TICKETS:
+            return _tool_result(
+                {"error": f"Maximum {MCP_BATCH_MAX_TICKETS} tickets par appel", "got": len(ticket_ids)}, is_error=True
             )
 
-        patch = {
-            "category_id": matched.id,
-            "priority": suggestion.priority.value,
-            "status": suggestion.status.value,
-        }
-        name_to_id = {c.name: c.id for c in cats}
-        patch = apply_guardrails(t, patch, category_name_to_id=name_to_id)
-
-        # appliquer en DB
-        t.category_id = patch.get("category_id")
-        t.priority = patch.get("priority")
-        t.status = patch.get("status")
-
-        s.add(t)
-        s.commit()
-        s.refresh(t)
-
-        cats_map = _cats_by_id(s)
-        structured = {
-            "ticket_id": ticket_id,
-            "applied_patch": patch,
-            "updated_ticket": _ticket_json(t, cats_map),
-        }
-        return CallToolResult(
-            content=[TextContent(type="text", text=json.dumps(structured, ensure_ascii=False))],
-            structuredContent=structured,
-        )
\ No newline at end of file
+    updated = await run_in_session(apply_triage_patches, {i: fields for i in ticket_ids})
+    updated_ids = {t.id for t in updated}
+    structured = {
+        "updated": len(updated_ids),
+        "ticket_ids": sorted(updated_ids),
+        "missing": [i for i in ticket_ids if i not in updated_ids],
+        "patch": {k: getattr(v, "value", v) for k, v in fields.items()},
+    }
+    return _tool_result(structured)
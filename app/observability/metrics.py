@@ -0,0 +1,254 @@
+"""
+Métriques in-process au format texte Prometheus (GET /metrics), sans dépendance externe.
+
+Compteurs et histogrammes thread-safe (les accès DB tournent sur l'executor DB), labels libres.
+Le label `endpoint` est porté par une contextvar posée par le middleware HTTP (ou le worker
+de jobs): les couches basses (LLM, DB) n'ont pas à le connaître.
+"""
+import os
+import time
+import inspect
+import functools
+import threading
+import contextvars
+from typing import Callable, Iterable
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# secondes; couvre de la requête SQL (ms) à l'appel LLM lent (minutes)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# str (ex: "job") ou scope ASGI de la requête en cours: la route n'est connue qu'après le routage,
+# le label est donc lu à la demande dans le scope (que FastAPI complète avec scope["route"])
+_endpoint: contextvars.ContextVar = contextvars.ContextVar("metrics_endpoint", default="")
+
+
+def current_endpoint() -> str:
+    src = _endpoint.get()
+    return _route_label(src) if isinstance(src, dict) else src
+
+
+def set_endpoint(label: str) -> contextvars.Token:
+    return _endpoint.set(label)
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(v: float) -> str:
+    return "+Inf" if v == float("inf") else repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        out += [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, list] = {}  # key -> [counts par bucket..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for b, n in zip(self.buckets, series):
+                cumulative += n
+                le = 'le="%s"' % _fmt(b)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            out.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {series[-1]}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(series[-2])}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}")
+        return out
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list = []
+        # collecteurs: fonctions appelées au rendu (valeurs déjà tenues ailleurs, ex: stats du cache LLM)
+        self._collectors: list[Callable[[], list[str]]] = []
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        m = Counter(name, help, labelnames)
+        self._metrics.append(m)
+        return m
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        m = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(m)
+        return m
+
+    def add_collector(self, fn: Callable[[], list[str]]) -> None:
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for m in self._metrics:
+            lines += m.render()
+        for fn in self._collectors:
+            lines += fn()
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_request_seconds = registry.histogram(
+    "http_request_seconds", "Durée des requêtes HTTP", ("endpoint", "method", "status")
+)
+graph_node_seconds = registry.histogram(
+    "triage_graph_node_seconds", "Durée par node de graphe de triage", ("graph", "node", "endpoint")
+)
+llm_call_seconds = registry.histogram(
+    "llm_call_seconds", "Durée des appels LLM (kind=raw: 1er appel, repair: relance de correction)",
+    ("model", "output", "kind", "endpoint"),
+)
+llm_parse_failures_total = registry.counter(
+    "llm_parse_failures_total", "Sorties LLM non parsables (stage=first_pass|repair)",
+    ("model", "output", "stage", "endpoint"),
+)
+llm_timeouts_total = registry.counter("llm_timeouts_total", "Appels LLM en timeout", ("endpoint",))
+category_mismatch_total = registry.counter(
+    "triage_category_mismatch_total", "category_name hors liste renvoyée par le LLM", ("endpoint", "graph")
+)
+db_query_seconds = registry.histogram(
+    "db_query_seconds", "Durée des requêtes SQL", ("engine", "statement", "endpoint")
+)
+
+
+def record_timeout() -> None:
+    llm_timeouts_total.inc(endpoint=current_endpoint())
+
+
+def record_category_mismatch(graph: str = "") -> None:
+    category_mismatch_total.inc(endpoint=current_endpoint(), graph=graph)
+
+
+def observe_node(graph: str, node: str, fn):
+    """Enveloppe un node LangGraph (sync ou async, signature (state, config)) et mesure sa durée."""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(state, config):
+            t0 = time.perf_counter()
+            try:
+                return await fn(state, config)
+            finally:
+                graph_node_seconds.observe(
+                    time.perf_counter() - t0, graph=graph, node=node, endpoint=current_endpoint()
+                )
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(state, config):
+        t0 = time.perf_counter()
+        try:
+            return fn(state, config)
+        finally:
+            graph_node_seconds.observe(
+                time.perf_counter() - t0, graph=graph, node=node, endpoint=current_endpoint()
+            )
+    return wrapper
+
+
+def instrument_engine(engine, name: str) -> None:
+    """Durée de chaque requête SQL (événements SQLAlchemy), label statement = SELECT/INSERT/..."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_metrics_t0", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("_metrics_t0")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+        db_query_seconds.observe(elapsed, engine=name, statement=verb, endpoint=current_endpoint())
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: pose current_endpoint (chemin de la route, pas l'URL brute) et mesure la requête."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+        token = _endpoint.set(scope)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_seconds.observe(
+                time.perf_counter() - t0,
+                endpoint=_route_label(scope),
+                method=scope.get("method", ""),
+                status=status["code"],
+            )
+            _endpoint.reset(token)
+
+
+def _route_label(scope) -> str:
+    # après routage FastAPI, scope["route"].path est le gabarit (/tickets/{ticket_id}): cardinalité bornée
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    path = scope.get("path", "")
+    return "/mcp" if path.startswith("/mcp") else "other"
+
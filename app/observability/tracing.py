@@ -0,0 +1,237 @@
+"""
+Tracing local par spans (sans collecteur externe).
+
+Un span = une opération chronométrée (requête HTTP, node LangGraph, appel LLM, appel DB),
+rattachée à son parent via une contextvar: les tâches asyncio et l'executor DB héritent du
+contexte, l'arbre d'une requête est donc reconstitué même avec des nodes en parallèle.
+
+Export: ring buffer en mémoire (GET /admin/traces) et/ou fichier JSONL. Le fichier est écrit par
+un thread dédié (file bornée, handle gardé ouvert): aucun I/O disque sur la boucle d'événements.
+"""
+import os
+import json
+import time
+import uuid
+import queue
+import inspect
+import logging
+import functools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Any, Optional
+
+logger = logging.getLogger("tracing")
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "1") == "1"
+# "memory" (ring buffer), "jsonl" (fichier) ou "both"
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "memory")
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "5000"))
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", "./traces.jsonl")
+# spans en attente d'écriture JSONL; au-delà ils sont perdus (comptés dans jsonl_dropped)
+TRACE_JSONL_QUEUE_SIZE = int(os.getenv("TRACE_JSONL_QUEUE_SIZE", "10000"))
+
+
+@dataclass
+class Span:
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    name: str
+    kind: str  # http | graph | llm | db | job | internal
+    start: float  # epoch (s)
+    duration_ms: Optional[float] = None
+    status: str = "ok"
+    error: Optional[str] = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+    def set(self, **attrs) -> None:
+        self.attributes.update(attrs)
+
+
+class SpanExporter:
+    def __init__(self, mode: str = TRACE_EXPORT, size: int = TRACE_BUFFER_SIZE, path: str = TRACE_JSONL_PATH):
+        self.mode = mode
+        self.path = path
+        self._buffer: deque[dict] = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._pending: queue.Queue[Optional[dict]] = queue.Queue(maxsize=TRACE_JSONL_QUEUE_SIZE)
+        self._writer: Optional[threading.Thread] = None
+        self.jsonl_dropped = 0
+
+    def export(self, span: Span) -> None:
+        d = asdict(span)
+        if self.mode in ("memory", "both"):
+            with self._lock:
+                self._buffer.append(d)
+        if self.mode in ("jsonl", "both"):
+            if self._writer is None:
+                self._start_writer()
+            try:
+                self._pending.put_nowait(d)
+            except queue.Full:
+                self.jsonl_dropped += 1
+
+    def _start_writer(self) -> None:
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="trace-jsonl", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        f = None
+        stop = False
+        while not stop:
+            batch = [self._pending.get()]
+            while True:  # ce qui s'est accumulé pendant l'écriture précédente: un seul flush
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None  # sentinelle posée par close(), toujours en dernier
+            lines = [json.dumps(d, ensure_ascii=False, default=str) + "\n" for d in batch if d is not None]
+            if not lines:
+                continue
+            try:
+                if f is None:
+                    f = open(self.path, "a", encoding="utf-8")
+                f.writelines(lines)
+                f.flush()
+            except OSError as e:
+                logger.warning("trace jsonl non écrite (%s): %s", self.path, e)
+                if f is not None:
+                    f.close()  # rouvert au lot suivant
+                    f = None
+        if f is not None:
+            f.close()
+
+    def close(self) -> None:
+        """Écrit les spans en attente et ferme le fichier JSONL (arrêt de l'app)."""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._pending.put(None)
+            writer.join(timeout=5)
+
+    def spans(self, trace_id: Optional[str] = None, limit: Optional[int] = None) -> list[dict]:
+        with self._lock:
+            items = [s for s in self._buffer if trace_id is None or s["trace_id"] == trace_id]
+        return items[-limit:] if limit else items
+
+    def traces(self, limit: int = 50) -> list[dict]:
+        """Résumé des dernières traces (span racine + nb de spans), plus récentes d'abord."""
+        with self._lock:
+            items = list(self._buffer)
+        by_trace: dict[str, dict] = {}
+        for s in items:
+            t = by_trace.setdefault(s["trace_id"], {"trace_id": s["trace_id"], "spans": 0, "root": None})
+            t["spans"] += 1
+            if s["parent_id"] is None:
+                t["root"] = {k: s[k] for k in ("name", "kind", "start", "duration_ms", "status")}
+        return list(reversed(list(by_trace.values())))[:limit]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buffer.clear()
+
+
+exporter = SpanExporter()
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes):
+    """Ouvre un span enfant du span courant (ou racine d'une nouvelle trace)."""
+    if not TRACE_ENABLED:
+        yield None
+        return
+
+    parent = _current.get()
+    s = Span(
+        trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+        span_id=uuid.uuid4().hex[:16],
+        parent_id=parent.span_id if parent else None,
+        name=name,
+        kind=kind,
+        start=time.time(),
+        attributes=dict(attributes),
+    )
+    token = _current.set(s)
+    t0 = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.status = "error"
+        s.error = f"{type(e).__name__}: {e}"[:500]
+        raise
+    finally:
+        s.duration_ms = round((time.perf_counter() - t0) * 1000, 3)
+        _current.reset(token)
+        exporter.export(s)
+
+
+def traced(name: Optional[str] = None, kind: str = "internal"):
+    """Décorateur: un span par appel (fonctions sync ou async)."""
+    def deco(fn):
+        span_name = name or fn.__name__
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, kind):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name, kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def trace_node(graph: str, node: str, fn):
+    """Span par node LangGraph (signature (state, config)), avec ticket_id en attribut."""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(state, config):
+            with span(f"{graph}.{node}", "graph", graph=graph, node=node, ticket_id=state.get("ticket_id")):
+                return await fn(state, config)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(state, config):
+        with span(f"{graph}.{node}", "graph", graph=graph, node=node, ticket_id=state.get("ticket_id")):
+            return fn(state, config)
+    return wrapper
+
+
+class TracingMiddleware:
+    """Middleware ASGI: span racine par requête HTTP (nom = gabarit de route, connu après routage)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACE_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        with span(f"{scope.get('method', '')} {scope.get('path', '')}", "http", path=scope.get("path")) as s:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    s.set(status_code=message["status"])
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if route is not None and getattr(route, "path", None):
+                    s.name = f"{scope.get('method', '')} {route.path}"
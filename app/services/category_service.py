@@ -1,14 +1,117 @@
+import os
+import json
+import time
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+from sqlalchemy import func
 from sqlmodel import Session, select
+from app.db.engine import new_read_session
+from app.db.executor import run_in_session
+from app.observability.tracing import traced
 from app.domain.models import Category
 
+# délai max avant de revérifier (requête légère) que la table n'a pas changé dans un autre worker
+CATEGORY_CATALOG_CHECK_SECONDS = float(os.getenv("CATEGORY_CATALOG_CHECK_SECONDS", "5"))
+
+
+@dataclass(frozen=True)
+class CategoryCatalog:
+    """Snapshot immuable des catégories, partagé par tous les chemins de triage."""
+    version: int
+    signature: tuple[int, int]  # (count, max(id)) en base au moment du snapshot
+    names: tuple[str, ...]
+    id_to_name: Mapping[int, str]
+    name_to_id: Mapping[str, int]
+    allowed_json: str  # liste des noms déjà sérialisée pour les prompts
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.names
+
+
+_catalog: CategoryCatalog | None = None
+_catalog_checked_at = 0.0
+_catalog_version = 0
+_catalog_lock = threading.Lock()
 
+
+@traced("db.create_category", "db")
 def create_category(session: Session, name: str, description: str | None = None) -> Category:
     category = Category(name=name, description=description)
     session.add(category)
     session.commit()
     session.refresh(category)
+    invalidate_category_catalog()
     return category
 
 
+@traced("db.list_categories", "db")
 def list_categories(session: Session) -> list[Category]:
     return session.exec(select(Category).order_by(Category.name)).all()
+
+
+def invalidate_category_catalog() -> None:
+    global _catalog
+    with _catalog_lock:
+        _catalog = None
+
+
+def _catalog_signature(session: Session) -> tuple[int, int]:
+    count, max_id = session.exec(select(func.count(Category.id), func.max(Category.id))).one()
+    return count or 0, max_id or 0
+
+
+def _fresh_catalog() -> CategoryCatalog | None:
+    # snapshot utilisable sans requête (vérifié il y a moins de CATEGORY_CATALOG_CHECK_SECONDS)
+    catalog = _catalog
+    if catalog is not None and time.monotonic() - _catalog_checked_at < CATEGORY_CATALOG_CHECK_SECONDS:
+        return catalog
+    return None
+
+
+@traced("db.get_category_catalog", "db")
+def get_category_catalog(session: Session) -> CategoryCatalog:
+    """
+    Retourne le snapshot courant; reconstruit seulement si invalidé (create_category)
+    ou si la signature en base a changé (catégorie créée par un autre worker).
+    """
+    global _catalog, _catalog_checked_at, _catalog_version
+
+    catalog = _fresh_catalog()
+    if catalog is not None:
+        return catalog
+
+    now = time.monotonic()
+    with _catalog_lock:
+        signature = _catalog_signature(session)
+        if _catalog is not None and _catalog.signature == signature:
+            _catalog_checked_at = now
+            return _catalog
+
+        cats = list_categories(session)
+        names = tuple(c.name for c in cats)
+        _catalog_version += 1
+        _catalog = CategoryCatalog(
+            version=_catalog_version,
+            signature=signature,
+            names=names,
+            id_to_name=MappingProxyType({c.id: c.name for c in cats}),
+            name_to_id=MappingProxyType({c.name: c.id for c in cats}),
+            allowed_json=json.dumps(list(names), ensure_ascii=False),
+        )
+        _catalog_checked_at = now
+        return _catalog
+
+
+# ---------- accès async (executor DB borné) ----------
+
+async def alist_categories() -> list[Category]:
+    return await run_in_session(list_categories, session_factory=new_read_session)
+
+
+async def aget_category_catalog() -> CategoryCatalog:
+    # cas courant: snapshot frais, aucun aller-retour vers l'executor
+    return _fresh_catalog() or await run_in_session(get_category_catalog)
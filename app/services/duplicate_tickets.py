@@ -0,0 +1,390 @@
+"""
+Détection des doublons dès la création: MinHash sur n-grammes de mots (crc32, stable entre processus)
++ LSH par bandes sur les seuls tickets canoniques, retenu au-delà de DUPLICATE_THRESHOLD (Jaccard estimé).
+Signatures et liens persistés dans ticketfingerprint, rechargés au démarrage.
+Triage: un doublon reprend la décision de son canonique déjà trié, sinon le groupe partage un appel (shared_triage).
+"""
+import os
+import re
+import zlib
+import time
+import asyncio
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, Mapping, Optional, Sequence, TypeVar
+
+import numpy as np
+from sqlalchemy import func, update, delete
+from sqlmodel import Session, select
+
+from app.domain.models import Ticket, TicketFingerprint
+from app.services.similar_tickets import ticket_text
+
+logger = logging.getLogger("duplicate_tickets")
+
+DUPLICATE_DETECTION_ENABLED = os.getenv("DUPLICATE_DETECTION_ENABLED", "1") == "1"
+DUPLICATE_NUM_PERM = int(os.getenv("DUPLICATE_NUM_PERM", "64"))
+DUPLICATE_BANDS = int(os.getenv("DUPLICATE_BANDS", "16"))  # diviseur de DUPLICATE_NUM_PERM
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.75"))  # Jaccard estimé
+DUPLICATE_SHINGLE_SIZE = int(os.getenv("DUPLICATE_SHINGLE_SIZE", "2"))
+DUPLICATE_BUILD_CHUNK_SIZE = int(os.getenv("DUPLICATE_BUILD_CHUNK_SIZE", "2000"))
+# triage partagé au sein d'un groupe de doublons (shared_triage)
+DUPLICATE_SHARE_TTL_SECONDS = float(os.getenv("DUPLICATE_SHARE_TTL_SECONDS", "300"))
+DUPLICATE_SHARE_MAX_ENTRIES = int(os.getenv("DUPLICATE_SHARE_MAX_ENTRIES", "1024"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_MERSENNE = np.uint64((1 << 61) - 1)
+_MASK32 = np.uint64(0xFFFFFFFF)
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class DuplicateMatch:
+    canonical_id: int
+    similarity: float  # Jaccard estimé avec le ticket le plus proche du groupe
+
+
+@dataclass(frozen=True)
+class CanonicalDecision:
+    """Triage déjà appliqué au ticket canonique d'un doublon, repris tel quel (sans appel LLM)."""
+    ticket_id: int
+    category_name: str
+    priority: str
+    status: str
+
+
+def _shingles(text: str, size: int = DUPLICATE_SHINGLE_SIZE) -> set[str]:
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    words = _TOKEN_RE.findall("".join(c for c in text if not unicodedata.combining(c)))
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def _bucket_add(bucket: dict, key: int, ticket_id: int) -> None:
+    # un seul ticket par bucket dans la grande majorité des cas: int plutôt qu'une liste
+    cur = bucket.get(key)
+    if cur is None:
+        bucket[key] = ticket_id
+    elif isinstance(cur, list):
+        cur.append(ticket_id)
+    else:
+        bucket[key] = [cur, ticket_id]
+
+
+def _bucket_remove(bucket: dict, key: int, ticket_id: int) -> None:
+    cur = bucket.get(key)
+    if cur == ticket_id:
+        del bucket[key]
+    elif isinstance(cur, list) and ticket_id in cur:
+        cur.remove(ticket_id)
+        if len(cur) == 1:
+            bucket[key] = cur[0]
+
+
+class DuplicateIndex:
+    def __init__(self, num_perm: int = DUPLICATE_NUM_PERM, bands: int = DUPLICATE_BANDS, seed: int = 1):
+        if bands <= 0 or num_perm % bands:
+            raise ValueError("DUPLICATE_NUM_PERM doit être un multiple de DUPLICATE_BANDS")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        # graine fixe: mêmes permutations à chaque démarrage (signatures persistées comparables)
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._band_mix = rng.integers(1, 1 << 63, size=self.rows, dtype=np.uint64) | np.uint64(1)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._sigs: dict[int, bytes] = {}  # tous les tickets (promotion d'un doublon en canonique)
+        self._buckets: list[dict] = [{} for _ in range(self.bands)]  # canoniques seulement
+        self._canonical: dict[int, DuplicateMatch] = {}  # doublon -> canonique
+        self._members: dict[int, set[int]] = {}  # canonique -> doublons
+
+    def __len__(self) -> int:
+        return len(self._sigs)
+
+    # ---------- signatures ----------
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """Signature MinHash (uint32, num_perm) ou None si le texte n'a aucun mot."""
+        shingles = _shingles(text)
+        if not shingles:
+            return None
+        h = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        hashed = (np.outer(h, self._a) + self._b) % _MERSENNE & _MASK32
+        return hashed.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, sig: np.ndarray) -> list[int]:
+        # (multiplications modulo 2^64 voulues)
+        return (sig.reshape(self.bands, self.rows).astype(np.uint64) * self._band_mix).sum(axis=1).tolist()
+
+    def _similarity(self, sig: np.ndarray, other: bytes) -> float:
+        return int(np.count_nonzero(np.frombuffer(other, dtype=np.uint32) == sig)) / self.num_perm
+
+    # ---------- écriture (verrou pris par l'appelant) ----------
+
+    def _add_canonical(self, ticket_id: int, sig: np.ndarray, raw: bytes) -> None:
+        self._sigs[ticket_id] = raw
+        for bucket, key in zip(self._buckets, self._band_keys(sig)):
+            _bucket_add(bucket, key, ticket_id)
+
+    def _link(self, ticket_id: int, raw: bytes, match: DuplicateMatch) -> None:
+        self._sigs[ticket_id] = raw
+        self._canonical[ticket_id] = match
+        self._members.setdefault(match.canonical_id, set()).add(ticket_id)
+
+    def _match(self, sig: np.ndarray) -> Optional[DuplicateMatch]:
+        candidates = set()
+        for bucket, key in zip(self._buckets, self._band_keys(sig)):
+            cur = bucket.get(key)
+            if isinstance(cur, list):
+                candidates.update(cur)
+            elif cur is not None:
+                candidates.add(cur)
+        best: Optional[DuplicateMatch] = None
+        for cid in candidates:
+            sim = self._similarity(sig, self._sigs[cid])
+            if sim >= DUPLICATE_THRESHOLD and (best is None or sim > best.similarity):
+                best = DuplicateMatch(cid, sim)
+        return best
+
+    def add_many(self, items: Iterable[tuple[int, Optional[np.ndarray]]]) -> list[Optional[DuplicateMatch]]:
+        """items: (ticket_id, signature | None) dans l'ordre de création -> canonique le plus proche | None."""
+        out = []
+        with self._lock:
+            for ticket_id, sig in items:
+                if sig is None or ticket_id in self._sigs:
+                    out.append(self._canonical.get(ticket_id))
+                    continue
+                match = self._match(sig)
+                if match is None:
+                    self._add_canonical(ticket_id, sig, sig.tobytes())
+                else:
+                    self._link(ticket_id, sig.tobytes(), match)
+                out.append(match)
+        return out
+
+    def load_many(self, rows: Iterable[tuple[int, bytes, Optional[int], Optional[float]]]) -> int:
+        """Rechargement depuis ticketfingerprint (ordre des ids): liens repris tels quels, sans recherche."""
+        n = 0
+        with self._lock:
+            for ticket_id, raw, duplicate_of, similarity in rows:
+                if len(raw) != self.num_perm * 4:
+                    continue
+                # canonique absent (supprimé hors de l'API): le ticket redevient canonique
+                if duplicate_of is not None and duplicate_of in self._sigs and duplicate_of not in self._canonical:
+                    self._link(ticket_id, raw, DuplicateMatch(duplicate_of, similarity or 0.0))
+                else:
+                    self._add_canonical(ticket_id, np.frombuffer(raw, dtype=np.uint32), raw)
+                n += 1
+        return n
+
+    def successor(self, ticket_id: int) -> Optional[int]:
+        """Doublon qui remplacera ce canonique s'il est supprimé (le plus ancien)."""
+        members = self._members.get(ticket_id)
+        return min(members) if members else None
+
+    def discard(self, ticket_id: int) -> None:
+        with self._lock:
+            raw = self._sigs.pop(ticket_id, None)
+            if raw is None:
+                return
+            match = self._canonical.pop(ticket_id, None)
+            if match is not None:
+                members = self._members.get(match.canonical_id)
+                if members is not None:
+                    members.discard(ticket_id)
+                    if not members:
+                        del self._members[match.canonical_id]
+                return
+            for bucket, key in zip(self._buckets, self._band_keys(np.frombuffer(raw, dtype=np.uint32))):
+                _bucket_remove(bucket, key, ticket_id)
+            members = self._members.pop(ticket_id, set())
+            if not members:
+                return
+            new_id = min(members)
+            members.discard(new_id)
+            del self._canonical[new_id]
+            new_raw = self._sigs[new_id]
+            self._add_canonical(new_id, np.frombuffer(new_raw, dtype=np.uint32), new_raw)
+            for m in members:
+                self._canonical[m] = DuplicateMatch(new_id, self._canonical[m].similarity)
+            if members:
+                self._members[new_id] = members
+
+    def discard_many(self, ticket_ids: Iterable[int]) -> None:
+        for ticket_id in ticket_ids:
+            self.discard(ticket_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    # ---------- lecture ----------
+
+    def canonical_of(self, ticket_id: int) -> Optional[DuplicateMatch]:
+        return self._canonical.get(ticket_id)
+
+    def has_duplicates(self, ticket_id: int) -> bool:
+        return bool(self._members.get(ticket_id))
+
+    def stats(self) -> dict:
+        return {
+            "tickets": len(self._sigs),
+            "canonical": len(self._sigs) - len(self._canonical),
+            "duplicates": len(self._canonical),
+            "num_perm": self.num_perm,
+            "bands": self.bands,
+            "threshold": DUPLICATE_THRESHOLD,
+        }
+
+
+duplicate_index = DuplicateIndex()
+
+
+def duplicate_fields(ticket_id: int, index: DuplicateIndex = duplicate_index) -> dict:
+    """Champs ajoutés aux réponses de création (REST / MCP)."""
+    match = index.canonical_of(ticket_id)
+    return {
+        "duplicate_of": match.canonical_id if match else None,
+        "duplicate_similarity": round(match.similarity, 3) if match else None,
+    }
+
+
+def _fingerprint(session: Session, tickets: Sequence[Ticket], index: DuplicateIndex) -> list[Optional[DuplicateMatch]]:
+    sigs = [index.signature(ticket_text(t.title, t.description)) for t in tickets]  # hors verrou
+    matches = index.add_many(zip((t.id for t in tickets), sigs))
+    session.add_all(
+        # texte sans mot: signature vide, jamais doublon (la ligne évite de le recalculer au démarrage)
+        TicketFingerprint(
+            ticket_id=t.id,
+            signature=sig.tobytes() if sig is not None else b"",
+            duplicate_of=m.canonical_id if m else None,
+            similarity=m.similarity if m else None,
+        )
+        for t, sig, m in zip(tickets, sigs, matches)
+    )
+    return matches
+
+
+def commit_with_fingerprints(
+    session: Session, tickets: Sequence[Ticket], index: DuplicateIndex = duplicate_index
+) -> list[Optional[DuplicateMatch]]:
+    """Commit de tickets flushés + leurs signatures (même transaction); index nettoyé si le commit échoue."""
+    if not DUPLICATE_DETECTION_ENABLED:
+        session.commit()
+        return [None] * len(tickets)
+    ids = [t.id for t in tickets]
+    matches = _fingerprint(session, tickets, index)
+    try:
+        session.commit()
+    except Exception:
+        index.discard_many(ids)
+        raise
+    return matches
+
+
+def forget_fingerprint(session: Session, ticket_id: int, index: DuplicateIndex = duplicate_index) -> None:
+    """Suppression (transaction de l'appelant): les doublons sont rattachés au plus ancien d'entre eux."""
+    new_id = index.successor(ticket_id)
+    session.exec(delete(TicketFingerprint).where(TicketFingerprint.ticket_id == ticket_id))
+    if new_id is not None:
+        session.exec(
+            update(TicketFingerprint)
+            .where(TicketFingerprint.ticket_id == new_id)
+            .values(duplicate_of=None, similarity=None)
+        )
+        session.exec(
+            update(TicketFingerprint).where(TicketFingerprint.duplicate_of == ticket_id).values(duplicate_of=new_id)
+        )
+
+
+def get_canonicals(
+    session: Session, ticket_ids: Iterable[int], index: DuplicateIndex = duplicate_index
+) -> dict[int, Ticket]:
+    """{id du doublon: ticket canonique} pour les tickets de la liste qui sont des doublons (une requête)."""
+    links = {tid: m.canonical_id for tid in ticket_ids if (m := index.canonical_of(tid)) is not None}
+    if not links:
+        return {}
+    canon = session.exec(select(Ticket).where(Ticket.id.in_(set(links.values())))).all()
+    by_id = {t.id: t for t in canon}
+    return {tid: by_id[cid] for tid, cid in links.items() if cid in by_id}
+
+
+def canonical_decision(canonical: Ticket, id_to_name: Mapping[int, str]) -> Optional[CanonicalDecision]:
+    """Décision du canonique s'il a déjà été trié (catégorie connue du catalogue), sinon None."""
+    category_name = id_to_name.get(canonical.category_id)
+    if category_name is None:
+        return None
+    return CanonicalDecision(canonical.id, category_name, canonical.priority, canonical.status)
+
+
+_shared: "OrderedDict[tuple, tuple[float, asyncio.Future]]" = OrderedDict()
+
+
+async def shared_triage(group: int, scope: tuple, make: Callable[[], Awaitable[T]]) -> T:
+    """Un triage par (canonique, scope), repris pendant DUPLICATE_SHARE_TTL_SECONDS; un abandon ne l'annule pas."""
+    key = (group, *scope)
+    entry = _shared.get(key)
+    if entry is not None:
+        expires_at, task = entry
+        stale = task.get_loop() is not asyncio.get_running_loop() or (
+            task.done() and (time.monotonic() > expires_at or task.cancelled() or task.exception() is not None)
+        )
+        if stale:
+            entry = None
+    if entry is None:
+        task = asyncio.ensure_future(make())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())  # exception toujours récupérée
+        _shared[key] = (time.monotonic() + DUPLICATE_SHARE_TTL_SECONDS, task)
+        _shared.move_to_end(key)
+        while len(_shared) > DUPLICATE_SHARE_MAX_ENTRIES:
+            _shared.popitem(last=False)
+    return await asyncio.shield(task)
+
+
+def build_duplicate_index(session: Session, index: DuplicateIndex = duplicate_index) -> int:
+    """Recharge l'index depuis ticketfingerprint et calcule les signatures manquantes, par blocs."""
+    index.clear()
+    nbytes = index.num_perm * 4
+    size = func.length(TicketFingerprint.signature)
+    session.exec(delete(TicketFingerprint).where(size != nbytes, size > 0))
+    session.commit()
+
+    q = select(
+        TicketFingerprint.ticket_id,
+        TicketFingerprint.signature,
+        TicketFingerprint.duplicate_of,
+        TicketFingerprint.similarity,
+    ).order_by(TicketFingerprint.ticket_id)
+    loaded = 0
+    for rows in session.exec(q.execution_options(yield_per=DUPLICATE_BUILD_CHUNK_SIZE)).partitions():
+        loaded += index.load_many(rows)
+
+    backfilled, last_id = 0, 0
+    while True:
+        tickets = session.exec(
+            select(Ticket)
+            .outerjoin(TicketFingerprint, TicketFingerprint.ticket_id == Ticket.id)
+            .where(TicketFingerprint.ticket_id.is_(None), Ticket.id > last_id)
+            .order_by(Ticket.id)
+            .limit(DUPLICATE_BUILD_CHUNK_SIZE)
+        ).all()
+        if not tickets:
+            break
+        last_id = tickets[-1].id
+        commit_with_fingerprints(session, tickets, index)
+        backfilled += len(tickets)
+
+    logger.info(
+        "index doublons: %s signatures rechargées, %s calculées (%s doublons)",
+        loaded, backfilled, index.stats()["duplicates"],
+    )
+    return loaded + backfilled
@@ -0,0 +1,194 @@
+import os
+import re
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Iterable, Mapping, Optional
+
+logger = logging.getLogger("guardrail_rules")
+
+# JSON: [{"category_name": "Access", "keywords": ["403", ...], "priority": "HIGH"}, ...]
+# (ordre significatif: en cas de match multiple, la dernière règle gagne; "priority" optionnel)
+GUARDRAIL_RULES_FILE = os.getenv("GUARDRAIL_RULES_FILE")
+
+ACCESS_KEYWORDS = (
+    "403", "401", "forbidden", "unauthorized",
+    "permission", "permissions",
+    "role", "roles", "rôle", "rôles",
+    "auth", "token", "jwt",
+    "access denied", "denied", "droit", "droits",
+)
+
+DATA_KEYWORDS = (
+    "csv", "export", "exports",
+    "colonne", "colonnes",
+    "separator", "séparateur", "separateur",
+    "encoding", "encodage",
+    "delimiter", "délimiteur", "delimiteur",
+    "import", "importer",
+    "rapport", "rapports",
+    "montant",
+)
+
+
+@dataclass(frozen=True)
+class GuardrailRule:
+    category_name: str
+    keywords: tuple[str, ...]
+    priority: Optional[str] = None  # LOW|MEDIUM|HIGH|URGENT, utilisé par le fast-path sans LLM
+
+
+DEFAULT_RULES = (
+    GuardrailRule("Access", ACCESS_KEYWORDS),
+    GuardrailRule("Data", DATA_KEYWORDS),
+)
+
+
+@dataclass
+class RuleScan:
+    """Résultat d'un scan: index de règle -> occurrences distinctes trouvées dans le texte."""
+    hits: dict[int, set[str]] = field(default_factory=dict)
+
+    def matched(self, rule_index: int) -> bool:
+        return rule_index in self.hits
+
+
+@dataclass(frozen=True)
+class RuleDecision:
+    """Décision déterministe (pré-LLM) du moteur de règles."""
+    category_name: str
+    category_id: int
+    priority: Optional[str]
+    confidence: float
+    keywords: tuple[str, ...]
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    # regex factorisée par préfixes (forbidden|format -> fo(?:rbidden|rmat)): bien plus rapide
+    # qu'une alternance plate avec le moteur `re`. Les quantificateurs `?` sont gloutons:
+    # à une position donnée, c'est le mot-clé le plus long qui est capturé.
+    trie: dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        end = "" in node
+        alts = [re.escape(ch) + build(sub) for ch, sub in sorted(node.items()) if ch != ""]
+        if not alts:
+            return ""
+        if len(alts) == 1 and not end:
+            return alts[0]
+        body = "(?:" + "|".join(alts) + ")"
+        return body + "?" if end else body
+
+    return build(trie)
+
+
+class RuleEngine:
+    """
+    Toutes les règles mots-clés -> catégorie compilées en UNE regex:
+    un seul passage sur le texte du ticket, quel que soit le nombre de règles.
+    """
+
+    def __init__(self, rules: Iterable[GuardrailRule]):
+        self.rules = tuple(rules)
+
+        kw_rules: dict[str, set[int]] = {}
+        for idx, rule in enumerate(self.rules):
+            for kw in rule.keywords:
+                kw = kw.lower()
+                if kw:
+                    kw_rules.setdefault(kw, set()).add(idx)
+
+        # La regex consomme le mot-clé le plus long: on y rattache les règles des mots-clés
+        # qu'il contient ("permissions" => "permission", "access denied" => "denied"), ce qui
+        # redonne la sémantique `k in text` (hors mots-clés collés qui se chevauchent).
+        self._expansion: dict[str, frozenset[int]] = {
+            kw: frozenset(idx for p in kw_rules if p in kw for idx in kw_rules[p])
+            for kw in kw_rules
+        }
+
+        self._pattern = re.compile(_trie_pattern(kw_rules)) if kw_rules else None
+
+    def scan(self, text: str) -> RuleScan:
+        scan = RuleScan()
+        if self._pattern is None or not text:
+            return scan
+        for found in set(self._pattern.findall(text.lower())):
+            for idx in self._expansion[found]:
+                scan.hits.setdefault(idx, set()).add(found)
+        return scan
+
+    def scan_many(self, texts: Iterable[str]) -> list[RuleScan]:
+        return [self.scan(t) for t in texts]
+
+    def category_override(self, scan: RuleScan, category_name_to_id: Mapping[str, int]) -> Optional[int]:
+        """category_id imposé par les règles (la dernière règle qui matche gagne), sinon None."""
+        out = None
+        for idx in sorted(scan.hits):
+            name = self.rules[idx].category_name
+            if name in category_name_to_id:
+                out = category_name_to_id[name]
+        return out
+
+    def decide(self, scan: RuleScan, category_name_to_id: Mapping[str, int]) -> Optional[RuleDecision]:
+        """
+        Catégorie (et priorité éventuelle) déduite des seuls mots-clés, avec une confiance:
+        - croît avec le nb d'occurrences distinctes (1 -> 0.5, 2 -> 0.75, 3 -> 0.875, ...)
+        - divisée par 2 pour chaque autre catégorie qui matche aussi (ticket ambigu)
+        """
+        matched = [idx for idx in sorted(scan.hits) if self.rules[idx].category_name in category_name_to_id]
+        if not matched:
+            return None
+
+        # même règle de priorité que category_override: la dernière gagne
+        winner = matched[-1]
+        rule = self.rules[winner]
+        others = {self.rules[i].category_name for i in matched} - {rule.category_name}
+        evidence = {kw for i in matched if self.rules[i].category_name == rule.category_name for kw in scan.hits[i]}
+
+        confidence = (1 - 0.5 ** len(evidence)) * (0.5 ** len(others))
+        priority = next(
+            (self.rules[i].priority for i in reversed(matched)
+             if self.rules[i].category_name == rule.category_name and self.rules[i].priority),
+            None,
+        )
+        return RuleDecision(
+            category_name=rule.category_name,
+            category_id=category_name_to_id[rule.category_name],
+            priority=priority.upper() if priority else None,
+            confidence=round(confidence, 4),
+            keywords=tuple(sorted(evidence)),
+        )
+
+
+def load_rules(path: Optional[str] = GUARDRAIL_RULES_FILE) -> tuple[GuardrailRule, ...]:
+    if not path:
+        return DEFAULT_RULES
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    rules = tuple(
+        GuardrailRule(r["category_name"], tuple(r.get("keywords") or ()), r.get("priority"))
+        for r in raw
+    )
+    logger.info("Guardrail rules chargées depuis %s (%s règles)", path, len(rules))
+    return rules
+
+
+_engine: Optional[RuleEngine] = None
+
+
+def get_rule_engine() -> RuleEngine:
+    global _engine
+    if _engine is None:
+        _engine = RuleEngine(load_rules())
+    return _engine
+
+
+def reload_rule_engine(rules: Optional[Iterable[GuardrailRule]] = None) -> RuleEngine:
+    global _engine
+    _engine = RuleEngine(rules if rules is not None else load_rules())
+    return _engine
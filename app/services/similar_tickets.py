@@ -0,0 +1,367 @@
+"""
+Index de tickets similaires déjà triés: TF-IDF hashé (NumPy), cosinus par produit scalaire,
+listes inversées (k-means) au-delà de SIMILAR_IVF_MIN_TICKETS. Mis à jour à chaque écriture de ticket,
+reconstruit au démarrage. Au-delà de SIMILAR_REUSE_THRESHOLD la décision du voisin est reprise sans LLM,
+sinon les voisins servent d'exemples few-shot.
+"""
+import os
+import re
+import json
+import zlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+from sqlmodel import Session, select
+
+from app.domain.models import Ticket, Category
+
+logger = logging.getLogger("similar_tickets")
+
+SIMILAR_INDEX_ENABLED = os.getenv("SIMILAR_INDEX_ENABLED", "1") == "1"
+SIMILAR_DIM = int(os.getenv("SIMILAR_DIM", "256"))  # puissance de 2
+SIMILAR_REUSE_THRESHOLD = float(os.getenv("SIMILAR_REUSE_THRESHOLD", "0.9"))  # > 1 = jamais de réutilisation
+SIMILAR_FEWSHOT_K = int(os.getenv("SIMILAR_FEWSHOT_K", "3"))  # 0 = pas d'exemples dans le prompt
+SIMILAR_FEWSHOT_MIN_SCORE = float(os.getenv("SIMILAR_FEWSHOT_MIN_SCORE", "0.2"))
+SIMILAR_REWEIGHT_GROWTH = float(os.getenv("SIMILAR_REWEIGHT_GROWTH", "1.5"))
+SIMILAR_BUILD_CHUNK_SIZE = int(os.getenv("SIMILAR_BUILD_CHUNK_SIZE", "2000"))
+# recherche approchée (listes inversées); 0 = toujours exacte
+SIMILAR_IVF_MIN_TICKETS = int(os.getenv("SIMILAR_IVF_MIN_TICKETS", "20000"))
+SIMILAR_IVF_PROBE = int(os.getenv("SIMILAR_IVF_PROBE", "10"))
+SIMILAR_IVF_TRAIN_ITERS = int(os.getenv("SIMILAR_IVF_TRAIN_ITERS", "5"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+@dataclass(frozen=True)
+class SimilarHit:
+    ticket_id: int
+    score: float
+    title: str
+    category_name: Optional[str]
+    priority: str
+    status: str
+
+
+@dataclass(frozen=True)
+class SimilarLookup:
+    """reuse: voisin assez proche pour reprendre sa décision; examples: voisins pour le few-shot."""
+    reuse: Optional[SimilarHit] = None
+    examples: tuple[SimilarHit, ...] = field(default_factory=tuple)
+
+
+def _features(text: str) -> list[str]:
+    words = [w for w in _TOKEN_RE.findall((text or "").lower()) if len(w) > 1 or w.isdigit()]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class SimilarTicketIndex:
+    def __init__(self, dim: int = SIMILAR_DIM, capacity: int = 1024):
+        if dim & (dim - 1):
+            raise ValueError("SIMILAR_DIM doit être une puissance de 2")
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._generation = 0  # incrémenté par _reset: invalide une repondération en cours (clear)
+        self._reset(capacity)
+
+    def _reset(self, capacity: int) -> None:
+        dim = self.dim
+        self._n = 0  # lignes occupées (y compris supprimées)
+        self._live = 0
+        self._tf = np.zeros((capacity, dim), dtype=np.float16)  # tf signé sous-linéaire (pour repondérer)
+        self._vec = np.zeros((capacity, dim), dtype=np.float32)  # tf * idf normalisé
+        self._df = np.zeros(dim, dtype=np.int64)
+        self._idf = np.ones(dim, dtype=np.float32)
+        self._weighted_at = 0  # nb de tickets lors de la dernière pondération complète
+        self._row_of: dict[int, int] = {}
+        self._ids = np.full(capacity, -1, dtype=np.int64)
+        self._meta: list[Optional[tuple[str, Optional[str], str, str]]] = [None] * capacity
+        self._centroids: Optional[np.ndarray] = None  # (nlist, dim) normalisés, None = recherche exacte
+        self._list = np.full(capacity, -1, dtype=np.int32)  # liste (centroïde) de chaque ligne
+        self._generation += 1
+        self._dirty: Optional[set[int]] = None  # lignes modifiées pendant la repondération en cours
+
+    def __len__(self) -> int:
+        return self._live
+
+    # ---------- vectorisation ----------
+
+    def _tf_row(self, text: str) -> np.ndarray:
+        row = np.zeros(self.dim, dtype=np.float32)
+        mask = self.dim - 1
+        for feat in _features(text):
+            h = zlib.crc32(feat.encode("utf-8"))
+            row[h & mask] += 1.0 if h & 0x80000000 else -1.0
+        return np.sign(row) * np.log1p(np.abs(row))
+
+    def _weigh(self, tf: np.ndarray, idf: Optional[np.ndarray] = None) -> np.ndarray:
+        v = tf.astype(np.float32) * (self._idf if idf is None else idf)
+        norm = np.linalg.norm(v, axis=-1, keepdims=True)
+        return v / np.where(norm == 0, 1, norm)
+
+    @staticmethod
+    def _idf_of(df: np.ndarray, live: int) -> np.ndarray:
+        n = max(live, 1)
+        return (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+
+    def _grow(self, needed: int) -> None:
+        cap = len(self._ids)
+        if needed <= cap:
+            return
+        new_cap = max(needed, cap * 2)
+        self._tf = np.concatenate([self._tf, np.zeros((new_cap - cap, self.dim), dtype=np.float16)])
+        self._vec = np.concatenate([self._vec, np.zeros((new_cap - cap, self.dim), dtype=np.float32)])
+        self._ids = np.concatenate([self._ids, np.full(new_cap - cap, -1, dtype=np.int64)])
+        self._list = np.concatenate([self._list, np.full(new_cap - cap, -1, dtype=np.int32)])
+        self._meta.extend([None] * (new_cap - cap))
+
+    # ---------- quantificateur grossier ----------
+
+    def _assign(self, vecs: np.ndarray, centroids: Optional[np.ndarray] = None, chunk: int = 8192) -> np.ndarray:
+        centroids = self._centroids if centroids is None else centroids
+        out = np.empty(len(vecs), dtype=np.int32)
+        for start in range(0, len(vecs), chunk):
+            out[start : start + chunk] = np.argmax(vecs[start : start + chunk] @ centroids.T, axis=1)
+        return out
+
+    def _train_ivf(self, vec: np.ndarray, live: np.ndarray) -> tuple[Optional[np.ndarray], np.ndarray]:
+        """k-means sphérique sur un échantillon -> (centroïdes | None = recherche exacte, liste par ligne)."""
+        lists = np.full(len(vec), -1, dtype=np.int32)
+        if SIMILAR_IVF_MIN_TICKETS <= 0 or len(live) < SIMILAR_IVF_MIN_TICKETS:
+            return None, lists
+        nlist = max(16, int(np.sqrt(len(live))))
+        rng = np.random.default_rng(0)
+        sample = vec[rng.choice(live, size=min(len(live), nlist * 40), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(SIMILAR_IVF_TRAIN_ITERS):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            centroids = np.where(empty[:, None], centroids, sums / np.where(norms == 0, 1, norms))
+        centroids = centroids.astype(np.float32)
+        lists[live] = self._assign(vec[live], centroids)
+        return centroids, lists
+
+    # ---------- écriture ----------
+
+    def _drop_row(self, row: int) -> None:
+        self._df -= (self._tf[row] != 0)
+        self._tf[row] = 0
+        self._vec[row] = 0
+        self._ids[row] = -1
+        self._list[row] = -1
+        self._meta[row] = None
+        self._live -= 1
+        if self._dirty is not None:
+            self._dirty.add(row)
+
+    def add_many(self, items: Iterable[tuple[int, str, str, Optional[str], str, str]]) -> int:
+        """items: (ticket_id, texte, titre, category_name, priority, status). Un ticket déjà indexé est remplacé."""
+        items = list(items)
+        if not items:
+            return 0
+        tfs = [self._tf_row(text) for _, text, *_ in items]  # hors verrou: le coût est ici
+        with self._lock:
+            self._grow(self._n + len(items))
+            rows = []
+            for (ticket_id, _, title, category_name, priority, status), tf in zip(items, tfs):
+                row = self._row_of.get(ticket_id)
+                if row is not None:
+                    self._drop_row(row)
+                else:
+                    row = self._n
+                    self._n += 1
+                self._row_of[ticket_id] = row
+                self._tf[row] = tf
+                self._df += (tf != 0)
+                self._ids[row] = ticket_id
+                self._meta[row] = (title[:200], category_name, priority, status)
+                self._live += 1
+                rows.append(row)
+
+            # lignes cherchables tout de suite avec l'IDF courant
+            self._vec[rows] = self._weigh(self._tf[rows])
+            if self._centroids is not None:
+                self._list[rows] = self._assign(self._vec[rows])
+            if self._dirty is not None:
+                self._dirty.update(rows)
+
+            reweight = self._dirty is None and self._live >= max(self._weighted_at, 1) * SIMILAR_REWEIGHT_GROWTH
+            if reweight:
+                self._dirty = set()
+                generation, n, live_count = self._generation, self._n, self._live
+                tf, df = self._tf, self._df.copy()
+                live = np.flatnonzero(self._ids[:n] >= 0)
+
+        if reweight:
+            self._reweight(generation, n, live_count, tf, df, live)
+        return len(items)
+
+    def _reweight(
+        self, generation: int, n: int, live_count: int, tf: np.ndarray, df: np.ndarray, live: np.ndarray
+    ) -> None:
+        # IDF + listes recalculés hors verrou; lignes modifiées entre-temps (_dirty) refaites à la substitution
+        try:
+            idf = self._idf_of(df, live_count)
+            vec = self._weigh(tf[:n], idf)
+            centroids, lists = self._train_ivf(vec, live)
+        except BaseException:
+            with self._lock:
+                if self._generation == generation:
+                    self._dirty = None
+            raise
+
+        with self._lock:
+            if self._generation != generation:  # clear() entre-temps: résultat obsolète
+                return
+            dirty = np.fromiter(self._dirty, dtype=np.int64, count=len(self._dirty))
+            fix = np.concatenate([dirty, np.arange(n, self._n)]).astype(np.int64)
+            self._idf = idf
+            self._vec[:n] = vec
+            self._list[:n] = lists
+            self._centroids = centroids
+            if len(fix):
+                self._vec[fix] = self._weigh(self._tf[fix])
+                if centroids is not None:
+                    self._list[fix] = np.where(self._ids[fix] >= 0, self._assign(self._vec[fix]), -1)
+                else:
+                    self._list[fix] = -1
+            self._weighted_at = live_count
+            self._dirty = None
+
+    def add(self, ticket_id: int, text: str, title: str, category_name: Optional[str], priority: str, status: str):
+        self.add_many([(ticket_id, text, title, category_name, priority, status)])
+
+    def discard(self, ticket_id: int) -> None:
+        with self._lock:
+            row = self._row_of.pop(ticket_id, None)
+            if row is not None:
+                self._drop_row(row)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset(1024)
+
+    # ---------- lecture ----------
+
+    def search(self, text: str, k: int = 5, exclude_id: Optional[int] = None, exact: bool = False) -> list[SimilarHit]:
+        """Top-k voisins (cosinus décroissant); exact=True: balayage complet (mesure du rappel)."""
+        if k <= 0 or self._live == 0:
+            return []
+        tf = self._tf_row(text)
+        with self._lock:
+            q = self._weigh(tf)
+            n = self._n
+            if self._centroids is None or exact:
+                rows = np.arange(n)
+                scores = self._vec[:n] @ q
+            else:
+                nprobe = min(SIMILAR_IVF_PROBE, len(self._centroids))
+                probe = np.argpartition(-(self._centroids @ q), nprobe - 1)[:nprobe]
+                selected = np.zeros(len(self._centroids) + 1, dtype=bool)  # dernier = -1 (ligne supprimée)
+                selected[probe] = True
+                rows = np.flatnonzero(selected[self._list[:n]])
+                if len(rows) == 0:
+                    return []
+                scores = self._vec[rows] @ q
+            if exclude_id is not None and exclude_id in self._row_of:
+                scores[rows == self._row_of[exclude_id]] = -1.0
+            kk = min(k, len(rows))
+            top = np.argpartition(-scores, kk - 1)[:kk]
+            top = top[np.argsort(-scores[top])]
+            hits = []
+            for i in top:
+                row = rows[i]
+                if self._ids[row] < 0 or scores[i] <= 0:
+                    continue
+                title, category_name, priority, status = self._meta[row]
+                hits.append(SimilarHit(int(self._ids[row]), float(scores[i]), title, category_name, priority, status))
+            return hits
+
+    def stats(self) -> dict:
+        return {
+            "tickets": self._live,
+            "dim": self.dim,
+            "capacity": len(self._ids),
+            "weighted_at": self._weighted_at,
+            "ivf_lists": 0 if self._centroids is None else len(self._centroids),
+        }
+
+
+similar_index = SimilarTicketIndex()
+
+
+def ticket_text(title: str, description: str) -> str:
+    return f"{title}\n{(description or '')[:1500]}"
+
+
+def lookup(
+    title: str,
+    description: str,
+    allowed_categories: Sequence[str],
+    exclude_id: Optional[int] = None,
+    index: SimilarTicketIndex = similar_index,
+) -> SimilarLookup:
+    """Voisins du ticket: décision réutilisable (catégorie encore autorisée) et/ou exemples few-shot."""
+    if not SIMILAR_INDEX_ENABLED:
+        return SimilarLookup()
+    hits = index.search(ticket_text(title, description), k=max(SIMILAR_FEWSHOT_K, 1), exclude_id=exclude_id)
+    allowed = set(allowed_categories)
+    hits = [h for h in hits if h.category_name in allowed]
+    if hits and hits[0].score >= SIMILAR_REUSE_THRESHOLD:
+        return SimilarLookup(reuse=hits[0])
+    examples = tuple(h for h in hits[:SIMILAR_FEWSHOT_K] if h.score >= SIMILAR_FEWSHOT_MIN_SCORE)
+    return SimilarLookup(examples=examples)
+
+
+def format_examples(examples: Sequence[SimilarHit]) -> str:
+    """Bloc few-shot ajouté aux prompts (vide si aucun exemple)."""
+    if not examples:
+        return ""
+    lines = [
+        f"- {json.dumps(h.title, ensure_ascii=False)} -> "
+        f"category_name={h.category_name}, priority={h.priority}, status={h.status}"
+        for h in examples
+    ]
+    return "Tickets similaires déjà triés (indicatif, à adapter au ticket):\n" + "\n".join(lines) + "\n\n"
+
+
+def examples_key(examples: Sequence[SimilarHit]) -> list:
+    # clé de cache: mêmes exemples => même prompt
+    return [(h.ticket_id, h.category_name, h.priority, h.status) for h in examples]
+
+
+def index_triaged(tickets: Iterable, id_to_name) -> int:
+    """(Ré)indexe des tickets triés ou corrigés; sans catégorie connue, le ticket est retiré."""
+    if not SIMILAR_INDEX_ENABLED:
+        return 0
+    items = []
+    for t in tickets:
+        category_name = id_to_name.get(t.category_id)
+        if category_name is None:
+            similar_index.discard(t.id)
+            continue
+        items.append((t.id, ticket_text(t.title, t.description), t.title, category_name, t.priority, t.status))
+    return similar_index.add_many(items)
+
+
+def build_similar_index(session: Session, index: SimilarTicketIndex = similar_index) -> int:
+    """(Re)construit l'index depuis les tickets déjà catégorisés (lecture par blocs)."""
+    index.clear()
+    q = (
+        select(Ticket.id, Ticket.title, Ticket.description, Category.name, Ticket.priority, Ticket.status)
+        .join(Category, Category.id == Ticket.category_id)
+        .order_by(Ticket.id)
+    )
+    result = session.exec(q.execution_options(yield_per=SIMILAR_BUILD_CHUNK_SIZE))
+    total = 0
+    for rows in result.partitions():
+        total += index.add_many(
+            (tid, ticket_text(title, desc), title, cat, prio, status) for tid, title, desc, cat, prio, status in rows
+        )
+    logger.info("index tickets similaires: %s tickets (dim=%s)", total, index.dim)
+    return total
@@ -0,0 +1,170 @@
+import os
+import csv
+import json
+import codecs
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.domain.schemas import TicketCreate
+from app.services.ticket_service import acreate_tickets
+from app.services.category_service import aget_category_catalog
+from app.services.duplicate_tickets import duplicate_index
+
+logger = logging.getLogger("ticket_import")
+
+# POST /tickets/bulk: taille de lot (= une transaction), plafond, nb max d'erreurs détaillées
+TICKETS_BULK_BATCH_SIZE = int(os.getenv("TICKETS_BULK_BATCH_SIZE", "500"))
+TICKETS_BULK_MAX_BATCH_SIZE = int(os.getenv("TICKETS_BULK_MAX_BATCH_SIZE", "5000"))
+TICKETS_BULK_MAX_ERRORS = int(os.getenv("TICKETS_BULK_MAX_ERRORS", "1000"))
+# ids renvoyés dans la réponse (les compteurs restent exacts au-delà)
+TICKETS_BULK_MAX_IDS = int(os.getenv("TICKETS_BULK_MAX_IDS", "1000"))
+
+# (n° de ligne, ligne brute parsée | None, erreur | None)
+RawRow = tuple[int, Optional[dict], Optional[str]]
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, str]]:
+    """Découpe le flux en lignes au fil de l'eau (UTF-8, BOM toléré), sans bufferiser tout l'upload."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buf = ""
+    line_no = 0
+    async for chunk in chunks:
+        buf += decoder.decode(chunk)
+        *lines, buf = buf.split("\n")
+        for line in lines:
+            line_no += 1
+            yield line_no, line.rstrip("\r")
+    buf += decoder.decode(b"", final=True)
+    if buf:
+        yield line_no + 1, buf.rstrip("\r")
+
+
+async def _iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[RawRow]:
+    async for line_no, line in _iter_lines(chunks):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, None, f"JSON invalide: {e.msg}"
+            continue
+        if not isinstance(row, dict):
+            yield line_no, None, "Objet JSON attendu"
+            continue
+        yield line_no, row, None
+
+
+async def _iter_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[RawRow]:
+    # en-tête obligatoire (title,description[,category_id]); un champ entre guillemets peut
+    # contenir des retours à la ligne: on accumule tant que les guillemets sont déséquilibrés
+    header: Optional[list[str]] = None
+    record, start = "", 0
+    async for line_no, line in _iter_lines(chunks):
+        if not record:
+            start = line_no
+            if not line.strip():
+                continue
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            continue
+
+        values = next(csv.reader([record]))
+        record = ""
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        if len(values) != len(header):
+            yield start, None, f"{len(values)} colonnes, {len(header)} attendues"
+            continue
+        # cellule vide = valeur absente (category_id optionnel)
+        yield start, {k: (v if v != "" else None) for k, v in zip(header, values)}, None
+
+    if record:
+        yield start, None, "Guillemet non fermé en fin de fichier"
+
+
+async def import_tickets(
+    chunks: AsyncIterator[bytes],
+    fmt: str,
+    batch_size: int = TICKETS_BULK_BATCH_SIZE,
+    on_batch: Optional[Callable[[list[int]], Awaitable[None]]] = None,
+) -> dict:
+    """
+    Valide chaque ligne avec TicketCreate au fil du flux et insère par lots
+    (une transaction par lot). `on_batch(ids)` est appelé après chaque commit.
+    category_id inconnu: erreur sur la ligne. Lot refusé par la base: seul ce lot est annulé
+    (ses lignes sont en erreur), l'import continue.
+    Les quasi-doublons sont rattachés à leur ticket canonique à l'insertion (comptés dans "duplicates").
+    """
+    rows_iter = _iter_csv(chunks) if fmt == "csv" else _iter_ndjson(chunks)
+    batch_size = max(1, min(batch_size, TICKETS_BULK_MAX_BATCH_SIZE))
+
+    ticket_ids: list[int] = []
+    errors: list[dict] = []
+    n_created = n_errors = batches = failed_batches = duplicates = 0
+    pending: list[tuple[int, dict]] = []  # (n° de ligne, ticket validé)
+
+    def add_error(line_no: int, error: str) -> None:
+        nonlocal n_errors
+        n_errors += 1
+        if len(errors) < TICKETS_BULK_MAX_ERRORS:
+            errors.append({"line": line_no, "error": error})
+
+    async def flush() -> None:
+        nonlocal pending, n_created, batches, failed_batches, duplicates
+        rows, pending = pending, []
+        known = (await aget_category_catalog()).id_to_name
+        valid = []
+        for line_no, row in rows:
+            cid = row.get("category_id")
+            if cid is not None and cid not in known:
+                add_error(line_no, f"category_id inconnu: {cid}")
+            else:
+                valid.append((line_no, row))
+        if not valid:
+            return
+        try:
+            ids = await acreate_tickets([row for _, row in valid])
+        except SQLAlchemyError as e:
+            # transaction du lot annulée (session fermée sans commit), les lots précédents restent
+            logger.warning("bulk import: lot de %s ligne(s) refusé: %s", len(valid), e)
+            failed_batches += 1
+            for line_no, _ in valid:
+                add_error(line_no, f"lot refusé par la base: {type(e).__name__}")
+            return
+        batches += 1
+        n_created += len(ids)
+        ticket_ids.extend(ids[: TICKETS_BULK_MAX_IDS - len(ticket_ids)])
+        duplicates += sum(duplicate_index.canonical_of(i) is not None for i in ids)
+        if on_batch is not None:
+            await on_batch(ids)
+
+    async for line_no, raw, error in rows_iter:
+        if error is None:
+            try:
+                pending.append((line_no, TicketCreate.model_validate(raw).model_dump()))
+            except ValidationError as e:
+                error = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+        if error is not None:
+            add_error(line_no, error)
+            continue
+        if len(pending) >= batch_size:
+            await flush()
+
+    if pending:
+        await flush()
+
+    logger.info("bulk import (%s): %s créés en %s lot(s), %s erreur(s)", fmt, n_created, batches, n_errors)
+    return {
+        "created": n_created,
+        "ticket_ids": ticket_ids,  # TICKETS_BULK_MAX_IDS premiers ids créés
+        "ticket_ids_truncated": n_created > len(ticket_ids),
+        "batches": batches,
+        "failed_batches": failed_batches,
+        "duplicates": duplicates,  # quasi-doublons rattachés à un ticket existant (ou du même import)
+        "errors_count": n_errors,
+        "errors": errors,
+    }
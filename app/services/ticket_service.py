@@ -1,8 +1,31 @@
+import os
+import json
+import base64
+from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
+from typing import Callable, Iterator
+from sqlalchemy import tuple_
 from sqlmodel import Session, select
 
-from app.domain.models import Ticket
+from app.db.engine import new_read_session
+from app.db.executor import run_in_session
+from app.observability.tracing import traced
+from app.services.similar_tickets import similar_index, index_triaged
+from app.services.category_service import get_category_catalog
+from app.services.duplicate_tickets import duplicate_index, commit_with_fingerprints, forget_fingerprint
+from app.domain.models import Ticket, Category
+
+# GET /tickets et MCP list_tickets: taille de page par défaut / plafond
+TICKETS_PAGE_SIZE = int(os.getenv("TICKETS_PAGE_SIZE", "50"))
+TICKETS_MAX_PAGE_SIZE = int(os.getenv("TICKETS_MAX_PAGE_SIZE", "200"))
+# GET /tickets/export: lignes lues (et envoyées) par bloc
+TICKETS_EXPORT_CHUNK_SIZE = int(os.getenv("TICKETS_EXPORT_CHUNK_SIZE", "1000"))
+
+EXPORT_FIELDS = (
+    "id", "title", "description", "status", "priority",
+    "category_id", "category_name", "created_at", "updated_at",
+)
 
 
 def _normalize(v):
@@ -10,22 +33,176 @@ def _normalize(v):
     return v.value if isinstance(v, Enum) else v
 
 
+@traced("db.create_ticket", "db")
 def create_ticket(session: Session, title: str, description: str, category_id: int | None = None) -> Ticket:
+    """Les doublons sont rattachés à leur ticket canonique (duplicate_index.canonical_of(ticket.id))."""
     ticket = Ticket(title=title, description=description, category_id=category_id)
     session.add(ticket)
-    session.commit()
+    session.flush()
+    commit_with_fingerprints(session, [ticket])
     session.refresh(ticket)
     return ticket
 
 
+@traced("db.create_tickets", "db")
+def create_tickets(session: Session, rows: list[dict]) -> list[int]:
+    """
+    Insertion d'un lot en UNE transaction (pas de refresh par ticket). Retourne les ids créés.
+    Les doublons (y compris entre tickets du lot) sont rattachés dans la même transaction.
+    """
+    tickets = [Ticket(**row) for row in rows]
+    session.add_all(tickets)
+    session.flush()  # ids attribués ici, avant l'expiration au commit
+    ids = [t.id for t in tickets]
+    commit_with_fingerprints(session, tickets)
+    return ids
+
+
+@traced("db.list_tickets", "db")
 def list_tickets(session: Session) -> list[Ticket]:
     return session.exec(select(Ticket).order_by(Ticket.created_at.desc())).all()
 
 
+@dataclass
+class TicketPage:
+    items: list[Ticket]
+    next_cursor: str | None  # None: dernière page
+    category_names: list[str | None]  # aligné sur items (jointure category)
+
+
+def _encode_cursor(ticket: Ticket) -> str:
+    raw = json.dumps([ticket.created_at.isoformat(), ticket.id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, ticket_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(ticket_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Cursor invalide") from e
+
+
+def _filter_tickets(q, status=None, priority=None, category_id=None, updated_from=None, updated_to=None):
+    # filtres communs liste / export (colonnes indexées)
+    if status is not None:
+        q = q.where(Ticket.status == _normalize(status))
+    if priority is not None:
+        q = q.where(Ticket.priority == _normalize(priority))
+    if category_id is not None:
+        q = q.where(Ticket.category_id == category_id)
+    if updated_from is not None:
+        q = q.where(Ticket.updated_at >= updated_from)
+    if updated_to is not None:
+        q = q.where(Ticket.updated_at < updated_to)
+    return q
+
+
+def clamp_page_size(limit: int | None) -> int:
+    return max(1, min(limit or TICKETS_PAGE_SIZE, TICKETS_MAX_PAGE_SIZE))
+
+
+@traced("db.list_tickets_page", "db")
+def list_tickets_page(
+    session: Session,
+    limit: int | None = None,
+    cursor: str | None = None,
+    status: str | None = None,
+    priority: str | None = None,
+    category_id: int | None = None,
+    updated_from: datetime | None = None,
+    updated_to: datetime | None = None,
+) -> TicketPage:
+    """
+    Pagination keyset sur (created_at, id) décroissants: coût constant quelle que soit la page
+    (pas d'OFFSET). L'index SQLite sur created_at contient aussi le rowid (= id): il couvre le tri.
+    `updated_from` inclus, `updated_to` exclu.
+    """
+    limit = clamp_page_size(limit)
+    q = (
+        select(Ticket, Category.name)
+        .outerjoin(Category, Category.id == Ticket.category_id)
+        .order_by(Ticket.created_at.desc(), Ticket.id.desc())
+    )
+    if cursor:
+        created_at, ticket_id = _decode_cursor(cursor)
+        q = q.where(tuple_(Ticket.created_at, Ticket.id) < (created_at, ticket_id))
+    q = _filter_tickets(q, status, priority, category_id, updated_from, updated_to)
+
+    # une ligne de plus pour savoir s'il reste une page
+    rows = session.exec(q.limit(limit + 1)).all()
+    items = [t for t, _ in rows[:limit]]
+    next_cursor = _encode_cursor(items[-1]) if len(rows) > limit else None
+    return TicketPage(items=items, next_cursor=next_cursor, category_names=[name for _, name in rows[:limit]])
+
+
+def iter_tickets_export(
+    session: Session,
+    chunk_size: int = TICKETS_EXPORT_CHUNK_SIZE,
+    status: str | None = None,
+    priority: str | None = None,
+    category_id: int | None = None,
+    updated_from: datetime | None = None,
+    updated_to: datetime | None = None,
+) -> Iterator[list[dict]]:
+    """
+    Export par blocs de `chunk_size` lignes lues au fil du curseur (yield_per):
+    mémoire constante quel que soit le nombre de tickets. category_name via jointure,
+    colonnes seules (pas d'objets ORM ni d'identity map).
+    """
+    cols = [getattr(Ticket, f) for f in EXPORT_FIELDS if f != "category_name"]
+    q = (
+        select(*cols, Category.name.label("category_name"))
+        .outerjoin(Category, Category.id == Ticket.category_id)
+        .order_by(Ticket.created_at.desc(), Ticket.id.desc())
+    )
+    q = _filter_tickets(q, status, priority, category_id, updated_from, updated_to)
+    result = session.exec(q.execution_options(yield_per=chunk_size))
+    for rows in result.partitions():
+        yield [dict(row._mapping) for row in rows]
+
+
+@traced("db.list_tickets_for_triage", "db")
+def list_tickets_for_triage(
+    session: Session,
+    ticket_ids: list[int] | None = None,
+    status: str | None = None,
+    priority: str | None = None,
+    category_id: int | None = None,
+    limit: int | None = None,
+) -> list[Ticket]:
+    q = select(Ticket).order_by(Ticket.id)
+    if ticket_ids is not None:
+        q = q.where(Ticket.id.in_(ticket_ids))
+    if status is not None:
+        q = q.where(Ticket.status == _normalize(status))
+    if priority is not None:
+        q = q.where(Ticket.priority == _normalize(priority))
+    if category_id is not None:
+        q = q.where(Ticket.category_id == category_id)
+    if limit is not None:
+        q = q.limit(limit)
+    return session.exec(q).all()
+
+
+@traced("db.get_ticket", "db")
 def get_ticket(session: Session, ticket_id: int) -> Ticket | None:
     return session.get(Ticket, ticket_id)
 
 
+@traced("db.get_ticket_with_category", "db")
+def get_ticket_with_category(session: Session, ticket_id: int) -> tuple[Ticket, str | None] | None:
+    """Ticket + nom de sa catégorie en une seule requête (LEFT JOIN)."""
+    row = session.exec(
+        select(Ticket, Category.name)
+        .outerjoin(Category, Category.id == Ticket.category_id)
+        .where(Ticket.id == ticket_id)
+    ).first()
+    return (row[0], row[1]) if row else None
+
+
+@traced("db.update_ticket", "db")
 def update_ticket(session: Session, ticket_id: int, **fields) -> Ticket:
     ticket = session.get(Ticket, ticket_id)
     if not ticket:
@@ -41,12 +218,82 @@ def update_ticket(session: Session, ticket_id: int, **fields) -> Ticket:
     session.add(ticket)
     session.commit()
     session.refresh(ticket)
+    # correction manuelle (catégorie, priorité, titre...): remplace la décision réutilisable
+    index_triaged([ticket], get_category_catalog(session).id_to_name)
     return ticket
 
 
+@traced("db.apply_triage_patches", "db")
+def apply_triage_patches(
+    session: Session,
+    patches: dict[int, dict],
+    recheck: Callable[[Ticket, dict], dict] | None = None,
+) -> list[Ticket]:
+    """
+    Applique plusieurs patches de triage dans UNE seule transaction.
+    `recheck(ticket, patch)` permet de recalculer le patch sur l'état frais du ticket.
+    Retourne les tickets effectivement mis à jour (les tickets supprimés entre-temps sont ignorés).
+    Les tickets mis à jour sont réindexés dans l'index des tickets similaires.
+    """
+    if not patches:
+        return []
+
+    now = datetime.utcnow()
+    tickets = session.exec(select(Ticket).where(Ticket.id.in_(list(patches)))).all()
+    for ticket in tickets:
+        patch = patches[ticket.id]
+        if recheck is not None:
+            patch = recheck(ticket, patch)
+        for k, v in patch.items():
+            if v is None:
+                continue
+            if hasattr(ticket, k):
+                setattr(ticket, k, _normalize(v))
+        ticket.updated_at = now
+        session.add(ticket)
+
+    session.commit()
+    index_triaged(tickets, get_category_catalog(session).id_to_name)
+    return tickets
+
+
+@traced("db.delete_ticket", "db")
 def delete_ticket(session: Session, ticket_id: int) -> None:
     ticket = session.get(Ticket, ticket_id)
     if not ticket:
         return
     session.delete(ticket)
+    forget_fingerprint(session, ticket_id)
     session.commit()
+    similar_index.discard(ticket_id)
+    duplicate_index.discard(ticket_id)
+
+
+# ---------- accès async (executor DB borné, session courte par appel) ----------
+
+async def acreate_ticket(title: str, description: str, category_id: int | None = None) -> Ticket:
+    return await run_in_session(create_ticket, title, description, category_id)
+
+
+async def acreate_tickets(rows: list[dict]) -> list[int]:
+    return await run_in_session(create_tickets, rows)
+
+
+async def alist_tickets_for_triage(**filters) -> list[Ticket]:
+    return await run_in_session(list_tickets_for_triage, **filters)
+
+
+async def alist_tickets_page(**params) -> TicketPage:
+    return await run_in_session(list_tickets_page, session_factory=new_read_session, **params)
+
+
+async def aget_ticket(ticket_id: int) -> Ticket | None:
+    return await run_in_session(get_ticket, ticket_id, session_factory=new_read_session)
+
+
+async def aget_ticket_with_category(ticket_id: int) -> tuple[Ticket, str | None] | None:
+    return await run_in_session(get_ticket_with_category, ticket_id, session_factory=new_read_session)
+
+
+async def aupdate_ticket(ticket_id: int, **fields) -> Ticket:
+    return await run_in_session(update_ticket, ticket_id, **fields)
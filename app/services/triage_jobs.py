@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlmodel import Session, select
+
+from app.db.engine import engine, new_session
+from app.db.executor import run_db
+from app.domain.models import TriageJob
+from app.domain.schemas import TriageJobStatus
+from app.observability.metrics import record_timeout, set_endpoint
+from app.observability.tracing import span
+
+logger = logging.getLogger("triage_jobs")
+
+TRIAGE_JOB_WORKERS = int(os.getenv("TRIAGE_JOB_WORKERS", "2"))
+TRIAGE_JOB_QUEUE_SIZE = int(os.getenv("TRIAGE_JOB_QUEUE_SIZE", "1000"))
+LLM_TIMEOUT_SECONDS = int(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+
+TERMINAL_STATUSES = {TriageJobStatus.DONE.value, TriageJobStatus.ERROR.value}
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def job_json(job: TriageJob) -> dict:
+    d = job.model_dump(mode="json")
+    d["result"] = json.loads(job.result) if job.result else None
+    return d
+
+
+class TriageJobQueue:
+    """
+    File de jobs de triage traitée par un pool de workers asyncio dans l'app.
+    L'état des jobs est en SQLite (table triagejob): les jobs QUEUED/RUNNING
+    au moment d'un arrêt sont repris au démarrage suivant.
+    """
+
+    def __init__(
+        self,
+        graphs: dict[str, Any],
+        workers: int = TRIAGE_JOB_WORKERS,
+        maxsize: int = TRIAGE_JOB_QUEUE_SIZE,
+    ):
+        self.graphs = graphs  # "graph"/"multi" -> graphe compilé
+        self.workers = workers
+        self._queue: asyncio.Queue[str] = asyncio.Queue(maxsize=maxsize)
+        self._tasks: list[asyncio.Task] = []
+        self._reserved = 0  # places réservées par submit_many pendant l'insert en base
+        self._done_events: dict[str, set[asyncio.Event]] = {}
+
+    # ---------- persistance ----------
+
+    def _update(self, job_id: str, **fields) -> None:
+        with Session(engine) as s:
+            job = s.get(TriageJob, job_id)
+            if not job:
+                return
+            for k, v in fields.items():
+                setattr(job, k, v)
+            job.updated_at = datetime.utcnow()
+            s.add(job)
+            s.commit()
+
+    def get(self, job_id: str) -> Optional[TriageJob]:
+        with Session(engine) as s:
+            return s.get(TriageJob, job_id)
+
+    # ---------- cycle de vie ----------
+
+    async def start(self) -> None:
+        # reprise des jobs interrompus (RUNNING au moment de l'arrêt => relancés)
+        with Session(engine) as s:
+            pending = s.exec(
+                select(TriageJob)
+                .where(TriageJob.status.in_([TriageJobStatus.QUEUED.value, TriageJobStatus.RUNNING.value]))
+                .order_by(TriageJob.created_at)
+            ).all()
+            pending_ids = [j.id for j in pending]
+
+        requeued = 0
+        for job_id in pending_ids:
+            try:
+                self._queue.put_nowait(job_id)
+                requeued += 1
+            except asyncio.QueueFull:
+                break
+        if requeued:
+            logger.info("triage_jobs: %s job(s) repris au démarrage", requeued)
+        if requeued < len(pending_ids):
+            logger.warning("triage_jobs: file pleine, %s job(s) restent QUEUED", len(pending_ids) - requeued)
+
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ---------- API ----------
+
+    def _free_slots(self, wanted: int) -> int:
+        if self._queue.maxsize <= 0:
+            return wanted
+        return max(0, self._queue.maxsize - self._queue.qsize() - self._reserved)
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "queued": self._queue.qsize(), "max_queue": self._queue.maxsize}
+
+    async def submit(self, ticket_id: int, graph: str) -> TriageJob:
+        """À appeler depuis la boucle d'événements: asyncio.Queue n'est pas thread-safe."""
+        if graph not in self.graphs:
+            raise ValueError(f"Graphe inconnu: {graph}")
+        if not self._free_slots(1):
+            raise QueueFullError(f"File de triage pleine ({self._queue.maxsize} jobs)")
+
+        job = TriageJob(id=uuid.uuid4().hex, ticket_id=ticket_id, graph=graph)
+        self._reserved += 1
+        try:
+            await run_db(self._insert_many, [job])
+        finally:
+            self._reserved -= 1
+        self._queue.put_nowait(job.id)
+        return job
+
+    async def submit_many(self, ticket_ids: list[int], graph: str) -> tuple[list[TriageJob], int]:
+        """
+        Soumission groupée (import bulk): une seule transaction pour tous les jobs.
+        Retourne (jobs créés, nb de tickets non soumis faute de place dans la file).
+        """
+        if graph not in self.graphs:
+            raise ValueError(f"Graphe inconnu: {graph}")
+        # réservation synchrone (avant l'await): un submit concurrent ne peut pas
+        # prendre ces places pendant l'insert, put_nowait ne lèvera pas QueueFull
+        accepted = ticket_ids[:self._free_slots(len(ticket_ids))]
+        jobs = [TriageJob(id=uuid.uuid4().hex, ticket_id=tid, graph=graph) for tid in accepted]
+        if jobs:
+            self._reserved += len(jobs)
+            try:
+                await run_db(self._insert_many, jobs)
+            finally:
+                self._reserved -= len(jobs)
+            for job in jobs:
+                self._queue.put_nowait(job.id)
+        return jobs, len(ticket_ids) - len(jobs)
+
+    def _insert_many(self, jobs: list[TriageJob]) -> None:
+        with Session(engine) as s:
+            s.expire_on_commit = False
+            s.add_all(jobs)
+            s.commit()
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[TriageJob]:
+        """Long-poll: rend le job dès qu'il est terminé, ou son état courant après `timeout`."""
+        deadline = time.monotonic() + timeout
+        # un event par appelant, retiré à sa sortie (pas d'entrée orpheline pour un id inconnu ou abandonné)
+        event = asyncio.Event()
+        waiters = self._done_events.setdefault(job_id, set())
+        waiters.add(event)
+        try:
+            while True:
+                job = await run_db(self.get, job_id)
+                if job is None or job.status in TERMINAL_STATUSES:
+                    return job
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return job
+                # l'event couvre les jobs de ce process; la relecture périodique ceux d'un autre worker
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=min(remaining, 1.0))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            waiters.discard(event)
+            if not waiters and self._done_events.get(job_id) is waiters:
+                del self._done_events[job_id]
+
+    # ---------- workers ----------
+
+    async def _run(self, job: TriageJob) -> dict:
+        graph = self.graphs[job.graph]
+        # span racine de la trace du job (pas de requête HTTP parente)
+        with span("triage_job", "job", job_id=job.id, ticket_id=job.ticket_id, graph=job.graph):
+            out = await asyncio.wait_for(
+                graph.ainvoke({"ticket_id": job.ticket_id}, config={"configurable": {"session_factory": new_session}}),
+                timeout=LLM_TIMEOUT_SECONDS,
+            )
+        return out["response"]
+
+    async def _worker(self, n: int) -> None:
+        set_endpoint("triage_job")  # label endpoint des métriques LLM/DB émises par ce worker
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = await run_db(self.get, job_id)
+                if job is None or job.status in TERMINAL_STATUSES:
+                    continue
+
+                await run_db(self._update, job_id, status=TriageJobStatus.RUNNING.value)
+                t0 = time.perf_counter()
+                try:
+                    result = await self._run(job)
+                except asyncio.TimeoutError:
+                    record_timeout()
+                    await run_db(
+                        self._update,
+                        job_id,
+                        status=TriageJobStatus.ERROR.value,
+                        error=f"Timeout LLM après {LLM_TIMEOUT_SECONDS}s.",
+                    )
+                except Exception as e:
+                    logger.exception("triage job %s (ticket_id=%s) en erreur", job_id, job.ticket_id)
+                    await run_db(self._update, job_id, status=TriageJobStatus.ERROR.value, error=str(e))
+                else:
+                    await run_db(
+                        self._update,
+                        job_id,
+                        status=TriageJobStatus.DONE.value,
+                        result=json.dumps(result, ensure_ascii=False, default=str),
+                        error=None,
+                    )
+                    logger.info("triage job %s done in %.2fs (worker %s)", job_id, time.perf_counter() - t0, n)
+            finally:
+                for event in self._done_events.pop(job_id, ()):
+                    event.set()
+                self._queue.task_done()
@@ -1,43 +1,72 @@
+import os
+from typing import Iterable, Mapping, Optional
+
+from app.services.guardrail_rules import RuleDecision, RuleScan, get_rule_engine
+from app.services.guardrail_rules import ACCESS_KEYWORDS, DATA_KEYWORDS  # noqa: F401 (compat)
+
 STATUS_RANK = {"OPEN": 0, "IN_PROGRESS": 1, "RESOLVED": 2, "CLOSED": 3}
 PRIORITY_RANK = {"LOW": 0, "MEDIUM": 1, "HIGH": 2, "URGENT": 3}
 
-ACCESS_KEYWORDS = (
-    "403", "401", "forbidden", "unauthorized",
-    "permission", "permissions",
-    "role", "roles", "rôle", "rôles",
-    "auth", "token", "jwt",
-    "access denied", "denied", "droit", "droits",
-)
-
-DATA_KEYWORDS = (
-    "csv", "export", "exports",
-    "colonne", "colonnes",
-    "separator", "séparateur", "separateur",
-    "encoding", "encodage",
-    "delimiter", "délimiteur", "delimiteur",
-    "import", "importer",
-    "rapport", "rapports",
-    "montant",
-)
-
 ALLOWED_TRIAGE_STATUSES = {"OPEN", "IN_PROGRESS"}  # on bloque RESOLVED/CLOSED au triage
 
+# Fast-path "rules first" (opt-in: change les résultats du triage): au-delà de ce seuil de confiance,
+# les règles décident sans LLM (path="rules" dans les réponses des graphes)
+TRIAGE_RULES_FIRST = os.getenv("TRIAGE_RULES_FIRST", "0") == "1"
+TRIAGE_RULES_CONFIDENCE = float(os.getenv("TRIAGE_RULES_CONFIDENCE", "0.75"))
+
+
+def _ticket_text(ticket) -> str:
+    return f"{getattr(ticket, 'title', '')} {getattr(ticket, 'description', '')}"
+
+
+def scan_ticket(ticket) -> RuleScan:
+    """Un seul passage du moteur de règles sur titre + description."""
+    return get_rule_engine().scan(_ticket_text(ticket))
 
-def _is_access_issue(text: str) -> bool:
-    t = (text or "").lower()
-    return any(k in t for k in ACCESS_KEYWORDS)
 
-def _is_data_issue(text: str) -> bool:
-    t = (text or "").lower()
-    return any(k in t for k in DATA_KEYWORDS)
+def scan_tickets(tickets: Iterable) -> list[RuleScan]:
+    return get_rule_engine().scan_many(_ticket_text(t) for t in tickets)
 
-def apply_guardrails(ticket, patch: dict, category_name_to_id: dict | None = None) -> dict:
+
+def rules_decision(
+    ticket,
+    category_name_to_id: Mapping[str, int],
+    *,
+    scan: Optional[RuleScan] = None,
+) -> Optional[RuleDecision]:
+    """
+    Décision pré-LLM si le fast-path est actif ET que la confiance atteint TRIAGE_RULES_CONFIDENCE,
+    sinon None (=> chemin LLM).
+    """
+    if not TRIAGE_RULES_FIRST or not category_name_to_id:
+        return None
+    engine = get_rule_engine()
+    if scan is None:
+        scan = engine.scan(_ticket_text(ticket))
+    decision = engine.decide(scan, category_name_to_id)
+    if decision is None or decision.confidence < TRIAGE_RULES_CONFIDENCE:
+        return None
+    return decision
+
+
+def default_status_for(priority: str) -> str:
+    return "IN_PROGRESS" if priority in {"HIGH", "URGENT"} else "OPEN"
+
+
+def apply_guardrails(
+    ticket,
+    patch: dict,
+    category_name_to_id: Mapping[str, int] | None = None,
+    *,
+    scan: Optional[RuleScan] = None,
+) -> dict:
     """
     Guardrails métier pour rendre le triage fiable.
     - No downgrade status/priority
     - HIGH/URGENT -> IN_PROGRESS (minimum)
     - Triages ne propose pas RESOLVED/CLOSED (sauf si déjà en base)
-    - 401/403/permission/role -> catégorie Access
+    - règles mots-clés -> catégorie (401/403/permission/role -> Access, CSV/export -> Data, ...)
+    `scan` permet de réutiliser un scan déjà calculé (batch).
     """
     out = dict(patch)
 
@@ -47,15 +76,13 @@ def apply_guardrails(ticket, patch: dict, category_name_to_id: dict | None = Non
     proposed_status = (out.get("status") or current_status).upper()
     proposed_priority = (out.get("priority") or current_priority).upper()
 
-    if category_name_to_id and "Access" in category_name_to_id:
-        full_text = f"{getattr(ticket, 'title', '')} {getattr(ticket, 'description', '')}"
-        if _is_access_issue(full_text):
-            out["category_id"] = category_name_to_id["Access"]
-
-    if category_name_to_id and "Data" in category_name_to_id:
-        full_text = f"{getattr(ticket, 'title', '')} {getattr(ticket, 'description', '')}"
-        if _is_data_issue(full_text):
-            out["category_id"] = category_name_to_id["Data"]
+    if category_name_to_id:
+        engine = get_rule_engine()
+        if scan is None:
+            scan = engine.scan(_ticket_text(ticket))
+        override = engine.category_override(scan, category_name_to_id)
+        if override is not None:
+            out["category_id"] = override
 
     # Si le ticket est déjà RESOLVED/CLOSED en base, on respecte (pas de downgrade).
     if current_status in {"RESOLVED", "CLOSED"}:
@@ -86,3 +113,17 @@ def apply_guardrails(ticket, patch: dict, category_name_to_id: dict | None = Non
     out["priority"] = (out.get("priority") or "MEDIUM").upper()
 
     return out
+
+
+def apply_guardrails_many(
+    tickets: Iterable,
+    patches: Iterable[dict],
+    category_name_to_id: Mapping[str, int] | None = None,
+) -> list[dict]:
+    """Version batch: scan de tous les tickets en une passe du moteur, puis guardrails par ticket."""
+    tickets = list(tickets)
+    scans = scan_tickets(tickets)
+    return [
+        apply_guardrails(t, p, category_name_to_id, scan=sc)
+        for t, p, sc in zip(tickets, patches, scans)
+    ]
@@ -0,0 +1,160 @@
+"""
+Triage en phases, sans connexion DB retenue pendant les appels LLM:
+1. lecture courte: snapshot détaché du/des ticket(s) + catalogue des catégories
+2. appel(s) LLM hors de toute session
+3. écriture courte: le ticket est relu et les guardrails recalculés s'il a changé entre-temps
+
+Un ticket en double (duplicate_tickets) reprend la décision de son ticket canonique si celui-ci est
+déjà trié. Sinon il est trié sur le texte du canonique, et le groupe (duplicate_group) partage un
+seul appel LLM (cf. shared_triage).
+
+Les variantes `a*` exécutent les phases DB sur l'executor DB (jamais sur la boucle async).
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Mapping, Optional
+
+from sqlmodel import Session
+
+from app.db.engine import new_session
+from app.db.executor import run_db
+from app.domain.models import Ticket
+from app.services.ticket_service import get_ticket, list_tickets_for_triage, apply_triage_patches
+from app.services.category_service import CategoryCatalog, get_category_catalog
+from app.services.triage_policy import apply_guardrails
+from app.services.duplicate_tickets import CanonicalDecision, canonical_decision, duplicate_index, get_canonicals
+
+SessionFactory = Callable[[], Session]
+
+
+@dataclass(frozen=True)
+class TicketSnapshot:
+    """
+    Copie immuable des champs utiles au triage (lisible sans session).
+    Doublon: title/description sont ceux du ticket canonique (duplicate_of); canonical_decision est
+    le triage du canonique s'il en a déjà un.
+    duplicate_group: id du canonique pour un doublon ou un canonique qui a des doublons, sinon None.
+    """
+    id: int
+    title: str
+    description: str
+    status: str
+    priority: str
+    category_id: Optional[int]
+    updated_at: datetime
+    duplicate_of: Optional[int] = None
+    duplicate_group: Optional[int] = None
+    canonical_decision: Optional[CanonicalDecision] = None
+
+    @classmethod
+    def of(
+        cls, ticket: Ticket, canonical: Optional[Ticket] = None, id_to_name: Optional[Mapping[int, str]] = None
+    ) -> "TicketSnapshot":
+        text = canonical if canonical is not None else ticket
+        if canonical is not None:
+            group = canonical.id
+        else:
+            group = ticket.id if duplicate_index.has_duplicates(ticket.id) else None
+        return cls(
+            id=ticket.id,
+            title=text.title,
+            description=text.description,
+            status=ticket.status,
+            priority=ticket.priority,
+            category_id=ticket.category_id,
+            updated_at=ticket.updated_at,
+            duplicate_of=canonical.id if canonical is not None else None,
+            duplicate_group=group,
+            canonical_decision=canonical_decision(canonical, id_to_name or {}) if canonical is not None else None,
+        )
+
+
+def load_triage_context(
+    ticket_id: int, session_factory: SessionFactory = new_session
+) -> tuple[Optional[TicketSnapshot], CategoryCatalog]:
+    """Phase 1: (snapshot | None si introuvable, catalogue). La connexion est rendue au pool en sortie."""
+    with session_factory() as s:
+        ticket = get_ticket(s, ticket_id)
+        catalog = get_category_catalog(s)
+        if not ticket:
+            return None, catalog
+        canonical = get_canonicals(s, [ticket_id]).get(ticket_id)
+        return TicketSnapshot.of(ticket, canonical, catalog.id_to_name), catalog
+
+
+def load_triage_batch(
+    session_factory: SessionFactory = new_session, **filters
+) -> tuple[list[TicketSnapshot], CategoryCatalog]:
+    """Phase 1 pour un lot (mêmes filtres que list_tickets_for_triage)."""
+    with session_factory() as s:
+        tickets = list_tickets_for_triage(s, **filters)
+        catalog = get_category_catalog(s)
+        canonicals = get_canonicals(s, [t.id for t in tickets])
+        return [TicketSnapshot.of(t, canonicals.get(t.id), catalog.id_to_name) for t in tickets], catalog
+
+
+def commit_triage_patches(
+    snapshots: Mapping[int, TicketSnapshot],
+    patches: dict[int, dict],
+    category_name_to_id: Mapping[str, int],
+    session_factory: SessionFactory = new_session,
+) -> list[Ticket]:
+    """
+    Phase 3: une transaction courte pour tous les patches.
+    Un ticket modifié depuis son snapshot (updated_at différent) voit ses guardrails
+    recalculés sur son état frais: pas de retour en arrière sur un status/priority
+    changé pendant l'appel LLM. Les tickets supprimés entre-temps sont ignorés.
+    Les tickets mis à jour alimentent l'index des tickets similaires (via apply_triage_patches).
+    """
+    def recheck(ticket: Ticket, patch: dict) -> dict:
+        snap = snapshots.get(ticket.id)
+        if snap is not None and ticket.updated_at == snap.updated_at:
+            return patch
+        return apply_guardrails(ticket, patch, category_name_to_id=category_name_to_id)
+
+    with session_factory() as s:
+        # objets lisibles après le commit et la fermeture, sans relecture
+        s.expire_on_commit = False
+        return apply_triage_patches(s, patches, recheck=recheck)
+
+
+def commit_triage_patch(
+    snapshot: TicketSnapshot,
+    patch: dict,
+    category_name_to_id: Mapping[str, int],
+    session_factory: SessionFactory = new_session,
+) -> Optional[Ticket]:
+    updated = commit_triage_patches(
+        {snapshot.id: snapshot}, {snapshot.id: patch}, category_name_to_id, session_factory
+    )
+    return updated[0] if updated else None
+
+
+async def aload_triage_context(
+    ticket_id: int, session_factory: SessionFactory = new_session
+) -> tuple[Optional[TicketSnapshot], CategoryCatalog]:
+    return await run_db(load_triage_context, ticket_id, session_factory)
+
+
+async def aload_triage_batch(
+    session_factory: SessionFactory = new_session, **filters
+) -> tuple[list[TicketSnapshot], CategoryCatalog]:
+    return await run_db(load_triage_batch, session_factory, **filters)
+
+
+async def acommit_triage_patches(
+    snapshots: Mapping[int, TicketSnapshot],
+    patches: dict[int, dict],
+    category_name_to_id: Mapping[str, int],
+    session_factory: SessionFactory = new_session,
+) -> list[Ticket]:
+    return await run_db(commit_triage_patches, snapshots, patches, category_name_to_id, session_factory)
+
+
+async def acommit_triage_patch(
+    snapshot: TicketSnapshot,
+    patch: dict,
+    category_name_to_id: Mapping[str, int],
+    session_factory: SessionFactory = new_session,
+) -> Optional[Ticket]:
+    return await run_db(commit_triage_patch, snapshot, patch, category_name_to_id, session_factory)
@@ -0,0 +1,115 @@
+"""
+Requêtes SQL et latence par lecture de ticket "avec category_name" (lectures MCP).
+
+get:
+- legacy:  session.get + toute la table category chargée en dict (ancien _cats_by_id)
+- catalog: session.get + get_category_catalog (snapshot en cache, revérifié périodiquement)
+- join:    get_ticket_with_category (une requête, LEFT JOIN)
+list (une page):
+- legacy:  page sans noms + un get_ticket par ligne côté client pour obtenir category_name
+- join:    list_tickets_page (noms joints dans la même requête)
+
+Les requêtes sont comptées via l'événement SQLAlchemy before_cursor_execute.
+
+Usage (depuis la racine du repo):
+    python -m benchmarks.bench_category_names --calls 2000 --categories 50 --page 20
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from sqlalchemy import event
+from sqlmodel import SQLModel, Session, create_engine, select
+
+from app.domain.models import Ticket, Category
+from app.services.ticket_service import get_ticket, get_ticket_with_category, list_tickets_page
+from app.services.category_service import get_category_catalog
+
+
+def _make_engine(path: str, n_tickets: int, n_categories: int):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    rng = random.Random(0)
+    with Session(engine) as s:
+        for i in range(n_categories):
+            s.add(Category(name=f"Cat{i}", description=f"Catégorie {i}"))
+        s.flush()
+        for i in range(n_tickets):
+            s.add(Ticket(title=f"Ticket {i}", description="desc", category_id=rng.randint(1, n_categories)))
+        s.commit()
+    return engine
+
+
+def _legacy_get(s: Session, ticket_id: int) -> dict:
+    t = s.get(Ticket, ticket_id)
+    cats = {c.id: c.name for c in s.exec(select(Category)).all()}
+    return {**t.model_dump(), "category_name": cats.get(t.category_id)}
+
+
+def _catalog_get(s: Session, ticket_id: int) -> dict:
+    t = get_ticket(s, ticket_id)
+    return {**t.model_dump(), "category_name": get_category_catalog(s).id_to_name.get(t.category_id)}
+
+
+def _join_get(s: Session, ticket_id: int) -> dict:
+    t, name = get_ticket_with_category(s, ticket_id)
+    return {**t.model_dump(), "category_name": name}
+
+
+def _legacy_list(s: Session, page: int) -> list[dict]:
+    rows = s.exec(select(Ticket).order_by(Ticket.id).limit(page)).all()
+    return [_legacy_get(s, t.id) for t in rows]  # un get_ticket MCP par ligne
+
+
+def _join_list(s: Session, page: int) -> list[dict]:
+    p = list_tickets_page(s, limit=page)
+    return [{**t.model_dump(), "category_name": n} for t, n in zip(p.items, p.category_names)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--tickets", type=int, default=5000)
+    parser.add_argument("--categories", type=int, default=50)
+    parser.add_argument("--page", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = _make_engine(os.path.join(tmp, "bench.db"), args.tickets, args.categories)
+        queries = 0
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _count(*_):
+            nonlocal queries
+            queries += 1
+
+        rng = random.Random(1)
+        ids = [rng.randint(1, args.tickets) for _ in range(args.calls)]
+        cases = [
+            ("get", "legacy", lambda s, i: _legacy_get(s, i)),
+            ("get", "catalog", lambda s, i: _catalog_get(s, i)),
+            ("get", "join", lambda s, i: _join_get(s, i)),
+            ("list", "legacy", lambda s, i: _legacy_list(s, args.page)),
+            ("list", "join", lambda s, i: _join_list(s, args.page)),
+        ]
+
+        print(f"calls={args.calls} tickets={args.tickets} categories={args.categories} page={args.page}")
+        print(f"{'op':<5} {'mode':<8} {'queries/call':>13} {'us/call':>9}")
+        for op, mode, fn in cases:
+            n = args.calls if op == "get" else max(1, args.calls // args.page)
+            with Session(engine) as s:
+                fn(s, ids[0])  # chauffe (catalogue, cache de requêtes compilées)
+                queries = 0
+                t0 = time.perf_counter()
+                for i in ids[:n]:
+                    fn(s, i)
+                    s.expunge_all()
+                elapsed = time.perf_counter() - t0
+            print(f"{op:<5} {mode:<8} {queries / n:>13.2f} {elapsed / n * 1e6:>9.1f}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
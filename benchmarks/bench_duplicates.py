@@ -0,0 +1,109 @@
+"""
+Index des doublons (app/services/duplicate_tickets.py): coût par ticket créé et qualité de détection.
+
+Tickets synthétiques: textes distincts tirés d'un vocabulaire de pseudo-mots, dont une part
+(--dup-rate) sont des copies légèrement modifiées d'un ticket antérieur (mots supprimés / ajoutés,
+comme un même incident signalé par plusieurs utilisateurs). Mesures:
+- latence d'ajout (signature + recherche LSH + rattachement), la durée qui s'ajoute à une création
+- rappel: copies rattachées au groupe de leur original, global et parmi les copies dont le Jaccard
+  exact avec le canonique du groupe atteint le seuil (les autres ont trop divergé: copies de copies);
+  faux positifs: tickets distincts rattachés
+- rechargement depuis les signatures (démarrage, sans recalcul)
+
+Usage (depuis la racine du repo):
+    python -m benchmarks.bench_duplicates --tickets 100000 --dup-rate 0.2
+"""
+import time
+import random
+import argparse
+
+from app.services.duplicate_tickets import DuplicateIndex, DUPLICATE_THRESHOLD, _shingles
+from app.services.similar_tickets import ticket_text
+
+SYLLABLES = ("ka", "lo", "mi", "tra", "ne", "po", "su", "ri", "de", "ban", "for", "ex", "ur", "gi", "vo", "ta")
+
+
+def _vocabulary(rng: random.Random, size: int) -> list[str]:
+    return list({"".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(size)})
+
+
+def _text(rng: random.Random, vocab: list[str]) -> tuple[str, str]:
+    return " ".join(rng.choices(vocab, k=rng.randint(3, 7))), " ".join(rng.choices(vocab, k=rng.randint(10, 60)))
+
+
+def _copy(title: str, desc: str, rng: random.Random) -> tuple[str, str]:
+    words = desc.split()
+    for _ in range(max(1, len(words) // 20)):
+        words.pop(rng.randrange(len(words)))
+    words.insert(rng.randrange(len(words) + 1), rng.choice(("urgent", "merci", "bonjour", "idem")))
+    return title, " ".join(words)
+
+
+def _pct(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickets", type=int, default=100_000)
+    parser.add_argument("--dup-rate", type=float, default=0.2, help="part des tickets qui sont des copies")
+    parser.add_argument("--vocab", type=int, default=20_000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vocab = _vocabulary(rng, args.vocab)
+    texts: list[tuple[str, str]] = []
+    origin: dict[int, int] = {}  # copie -> ticket original
+    for tid in range(1, args.tickets + 1):
+        if texts and rng.random() < args.dup_rate:
+            src = rng.randrange(1, tid)
+            origin[tid] = origin.get(src, src)
+            texts.append(_copy(*texts[src - 1], rng))
+        else:
+            texts.append(_text(rng, vocab))
+
+    index = DuplicateIndex()
+    lat, sigs = [], []
+    for tid, (title, desc) in enumerate(texts, start=1):
+        t0 = time.perf_counter()
+        sig = index.signature(ticket_text(title, desc))
+        index.add_many([(tid, sig)])
+        lat.append((time.perf_counter() - t0) * 1000)
+        sigs.append(sig.tobytes())
+
+    def group(tid: int) -> int:
+        match = index.canonical_of(tid)
+        return match.canonical_id if match else tid
+
+    def jaccard(a: int, b: int) -> float:
+        sa, sb = (_shingles(ticket_text(*texts[i - 1])) for i in (a, b))
+        return len(sa & sb) / max(len(sa | sb), 1)
+
+    found = sum(group(tid) == group(src) for tid, src in origin.items())
+    close = [tid for tid, src in origin.items() if jaccard(tid, group(src)) >= DUPLICATE_THRESHOLD]
+    found_close = sum(group(tid) == group(origin[tid]) for tid in close)
+    false_pos = sum(1 for tid in range(1, args.tickets + 1) if tid not in origin and index.canonical_of(tid))
+
+    # mêmes lignes que la table ticketfingerprint
+    rows = []
+    for tid, raw in enumerate(sigs, start=1):
+        match = index.canonical_of(tid)
+        rows.append((tid, raw, match.canonical_id if match else None, match.similarity if match else None))
+    reloaded = DuplicateIndex()
+    t0 = time.perf_counter()
+    reloaded.load_many(rows)
+    reload_s = time.perf_counter() - t0
+
+    lat.sort()
+    print(f"tickets={args.tickets} copies={len(origin)} stats={index.stats()}")
+    print(f"add: p50={_pct(lat, 0.5):.3f}ms p95={_pct(lat, 0.95):.3f}ms p99={_pct(lat, 0.99):.3f}ms")
+    print(
+        f"rappel copies={found / max(len(origin), 1):.1%} "
+        f"(Jaccard exact >= {DUPLICATE_THRESHOLD}: {found_close / max(len(close), 1):.1%} sur {len(close)}) "
+        f"faux positifs={false_pos / max(args.tickets - len(origin), 1):.2%}"
+    )
+    print(f"rechargement: {reload_s:.2f}s ({args.tickets / reload_s:,.0f} tickets/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Débit et latence de bout en bout (HTTP + MCP) avec le faux LLM (benchmarks/fake_llm_server.py).
+
+Lance le faux LLM et l'API (uvicorn) en sous-process sur une base SQLite temporaire
+(cache LLM, doublons, tickets similaires et fast-path règles désactivés: chaque triage appelle le LLM),
+crée catégories + tickets via POST /tickets/bulk, puis pour chaque scénario et chaque niveau de
+concurrence envoie `--requests` requêtes:
+- suggest, suggest-graph, suggest-multi: POST /triage/{id}/...
+- crud: GET /tickets (page), GET/PATCH /tickets/{id}, POST /tickets
+- mcp:  get_ticket / list_tickets / triage_suggest (une session MCP par client concurrent)
+
+Rapporte p50/p95/p99 (ms), débit (req/s) et erreurs dans un fichier JSON horodaté avec le
+commit courant; --baseline <fichier> affiche l'écart avec un run précédent.
+
+Usage (depuis la racine du repo):
+    python -m benchmarks.bench_e2e --concurrency 1,4,16,64 --requests 200 --ttft-ms 300
+    python -m benchmarks.bench_e2e --scenarios crud,mcp --baseline benchmarks/results/e2e_abc1234_....json
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+import httpx
+
+SCENARIOS = ("suggest", "suggest-graph", "suggest-multi", "crud", "mcp")
+CATEGORIES = ("Access", "Bug", "Data", "Incident", "Billing")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.check_output(["git", *args], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _pct(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+async def _wait_ready(url: str, timeout: float = 60) -> None:
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"serveur non prêt: {url}")
+
+
+def _start_servers(args, tmp: str) -> tuple[list[subprocess.Popen], str]:
+    llm_port, api_port = _free_port(), _free_port()
+    fake = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.fake_llm_server",
+            "--port", str(llm_port),
+            "--ttft-ms", str(args.ttft_ms),
+            "--dist", args.dist,
+            "--tps", str(args.tps),
+            "--malformed-rate", str(args.malformed_rate),
+            "--seed", "0",
+        ]
+    )
+    env = {
+        **os.environ,
+        "DB_URL": f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        "OLLAMA_BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+        "LLM_CACHE_ENABLED": "0",
+        # corpus à 5 descriptions: doublons, tickets similaires et règles court-circuiteraient le LLM
+        "DUPLICATE_DETECTION_ENABLED": "0",
+        "SIMILAR_INDEX_ENABLED": "0",
+        "TRIAGE_RULES_FIRST": "0",
+        "LLM_STREAM_MODE": "1" if args.stream else "0",
+    }
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.api.app:app", "--port", str(api_port), "--log-level", "warning"],
+        env=env,
+    )
+    return [fake, api], f"http://127.0.0.1:{api_port}"
+
+
+async def _seed(client: httpx.AsyncClient, n_tickets: int) -> list[int]:
+    for name in CATEGORIES:
+        await client.post("/categories", json={"name": name})  # 400 si déjà présente: ignoré
+    rng = random.Random(0)
+    lines = [
+        json.dumps({"title": f"Ticket {i}", "description": rng.choice(_DESCRIPTIONS)}, ensure_ascii=False)
+        for i in range(n_tickets)
+    ]
+    r = await client.post("/tickets/bulk?format=ndjson", content="\n".join(lines).encode("utf-8"))
+    r.raise_for_status()
+    summary = r.json()
+    if not summary.get("ticket_ids_truncated"):
+        return summary["ticket_ids"]
+    # réponse plafonnée (TICKETS_BULK_MAX_IDS): ids relus via l'export
+    r = await client.get("/tickets/export", params={"format": "ndjson"})
+    r.raise_for_status()
+    return [json.loads(line)["id"] for line in r.text.splitlines() if line]
+
+
+_DESCRIPTIONS = (
+    "Erreur 403 forbidden en ouvrant la page de facturation depuis hier.",
+    "L'export CSV sort avec un mauvais séparateur et des colonnes décalées.",
+    "L'application plante au chargement du tableau de bord pour tous les utilisateurs.",
+    "Double débit sur ma carte pour la commande du mois dernier, merci de rembourser.",
+    "Le bouton enregistrer ne fait rien sur Firefox, aucun message d'erreur.",
+)
+
+
+def _http_op(scenario: str, ids: list[int]):
+    async def op(client: httpx.AsyncClient, rng: random.Random) -> bool:
+        tid = rng.choice(ids)
+        if scenario != "crud":
+            r = await client.post(f"/triage/{tid}/{scenario}")
+            return r.status_code < 400
+        roll = rng.random()
+        if roll < 0.4:
+            r = await client.get("/tickets", params={"limit": 20})
+        elif roll < 0.7:
+            r = await client.get(f"/tickets/{tid}")
+        elif roll < 0.9:
+            r = await client.patch(f"/tickets/{tid}", json={"priority": rng.choice(["LOW", "MEDIUM", "HIGH"])})
+        else:
+            r = await client.post("/tickets", json={"title": "Bench", "description": rng.choice(_DESCRIPTIONS)})
+        return r.status_code < 400
+    return op
+
+
+async def _run_level(base_url: str, scenario: str, ids: list[int], concurrency: int, n_requests: int) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    remaining = n_requests
+
+    def take() -> bool:
+        nonlocal remaining
+        if remaining <= 0:
+            return False
+        remaining -= 1
+        return True
+
+    async def timed(call, rng) -> None:
+        nonlocal errors
+        t0 = time.perf_counter()
+        try:
+            ok = await call(rng)
+        except Exception:
+            ok = False
+        latencies.append((time.perf_counter() - t0) * 1000)
+        errors += not ok
+
+    async def http_worker(n: int) -> None:
+        op = _http_op(scenario, ids)
+        rng = random.Random(n)
+        limits = httpx.Limits(max_connections=1)
+        async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+            while take():
+                await timed(lambda r: op(client, r), rng)
+
+    async def mcp_worker(n: int) -> None:
+        from mcp import ClientSession
+        from mcp.client.streamable_http import streamablehttp_client
+
+        rng = random.Random(n)
+        async with streamablehttp_client(f"{base_url}/mcp/") as (read, write, _):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+
+                async def call(r: random.Random) -> bool:
+                    roll = r.random()
+                    if roll < 0.5:
+                        res = await session.call_tool("get_ticket", {"ticket_id": r.choice(ids)})
+                    elif roll < 0.8:
+                        res = await session.call_tool("list_tickets", {"limit": 20})
+                    else:
+                        res = await session.call_tool("triage_suggest", {"ticket_id": r.choice(ids)})
+                    return not res.isError
+
+                while take():
+                    await timed(call, rng)
+
+    worker = mcp_worker if scenario == "mcp" else http_worker
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(_pct(latencies, 0.50), 2),
+        "p95_ms": round(_pct(latencies, 0.95), 2),
+        "p99_ms": round(_pct(latencies, 0.99), 2),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def _print_row(r: dict, baseline: dict | None = None) -> None:
+    line = (
+        f"{r['scenario']:<14} {r['concurrency']:>5} {r['requests']:>6} {r['errors']:>6} "
+        f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['throughput_rps']:>9.1f}"
+    )
+    b = (baseline or {}).get((r["scenario"], r["concurrency"]))
+    if b:
+        d_p95 = (r["p95_ms"] / b["p95_ms"] - 1) * 100 if b["p95_ms"] else 0.0
+        d_rps = (r["throughput_rps"] / b["throughput_rps"] - 1) * 100 if b["throughput_rps"] else 0.0
+        line += f"   p95 {d_p95:+.1f}%  rps {d_rps:+.1f}%"
+    print(line)
+
+
+async def _main(args) -> None:
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"scénarios inconnus: {sorted(unknown)} (choix: {', '.join(SCENARIOS)})")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        procs: list[subprocess.Popen] = []
+        base_url = args.api_url
+        try:
+            if base_url is None:
+                procs, base_url = _start_servers(args, tmp)
+            await _wait_ready(f"{base_url}/metrics")
+            async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+                ids = await _seed(client, args.tickets)
+
+            print(f"api={base_url} tickets={len(ids)} ttft_ms={args.ttft_ms} dist={args.dist} tps={args.tps}")
+            print(
+                f"{'scenario':<14} {'conc':>5} {'reqs':>6} {'errors':>6} "
+                f"{'p50_ms':>9} {'p95_ms':>9} {'p99_ms':>9} {'req/s':>9}"
+            )
+            results = []
+            for scenario in scenarios:
+                for c in levels:
+                    r = await _run_level(base_url, scenario, ids, c, max(args.requests, c))
+                    _print_row(r, baseline)
+                    results.append(r)
+        finally:
+            for p in procs:
+                p.terminate()
+            for p in procs:
+                p.wait(timeout=10)
+
+    commit = _git("rev-parse", "--short", "HEAD") or "unknown"
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    out = args.out or os.path.join("benchmarks", "results", f"e2e_{commit}_{stamp}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "commit": commit,
+                "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+                "timestamp": stamp,
+                "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"résultats: {out}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,4,16,64")
+    parser.add_argument("--requests", type=int, default=200, help="requêtes par (scénario, concurrence)")
+    parser.add_argument("--tickets", type=int, default=1000)
+    parser.add_argument("--ttft-ms", type=float, default=300)
+    parser.add_argument("--dist", default="lognormal", choices=["fixed", "uniform", "lognormal", "exp"])
+    parser.add_argument("--tps", type=float, default=40)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--stream", action="store_true", help="LLM_STREAM_MODE=1 côté API")
+    parser.add_argument("--api-url", default=None, help="API déjà lancée (sinon démarrée ici avec le faux LLM)")
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--baseline", default=None, help="fichier de résultats d'un run précédent à comparer")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
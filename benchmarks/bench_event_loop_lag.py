@@ -0,0 +1,125 @@
+"""
+Retard de la boucle d'événements sous charge mixte CRUD + triage (LLM simulé par asyncio.sleep).
+
+- inline:   appels DB synchrones directement dans les coroutines (bloquent la boucle)
+- executor: mêmes appels via run_in_session (executor DB borné, app/db/executor.py)
+
+Le retard est mesuré par une tâche qui dort `--tick` ms en boucle: tout dépassement
+est du temps où la boucle n'a pas pu reprendre la main (autres requêtes LLM en attente).
+
+Usage (depuis la racine du repo):
+    python -m benchmarks.bench_event_loop_lag --seconds 5 --crud 8 --triage 32 --tickets 5000
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+from sqlmodel import SQLModel, Session, create_engine
+
+from app.db.executor import run_in_session, shutdown_db_executor
+from app.domain.models import Ticket, Category
+from app.services.ticket_service import get_ticket, list_tickets_for_triage, update_ticket
+from app.services.category_service import get_category_catalog
+
+
+def _make_engine(path: str, n_tickets: int):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as s:
+        for name in ("Access", "Bug", "Data", "Incident"):
+            s.add(Category(name=name))
+        for i in range(n_tickets):
+            s.add(Ticket(title=f"Ticket {i}", description="La page plante au chargement " * 5))
+        s.commit()
+    return engine
+
+
+def _pct(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+async def _run(engine, mode: str, args) -> dict:
+    factory = lambda: Session(engine)  # noqa: E731
+    rng = random.Random(0)
+
+    async def db(fn, *a, **kw):
+        if mode == "executor":
+            return await run_in_session(fn, *a, session_factory=factory, **kw)
+        with factory() as s:
+            s.expire_on_commit = False
+            return fn(s, *a, **kw)
+
+    deadline = time.perf_counter() + args.seconds
+    counts = {"crud": 0, "triage": 0}
+    lags: list[float] = []
+
+    async def ticker():
+        tick = args.tick / 1000
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            await asyncio.sleep(tick)
+            lags.append((time.perf_counter() - t0 - tick) * 1000)
+
+    async def crud_worker():
+        while time.perf_counter() < deadline:
+            await db(list_tickets_for_triage, status="OPEN", limit=args.page)
+            await db(update_ticket, rng.randint(1, args.tickets), priority="HIGH")
+            counts["crud"] += 1
+
+    async def triage_worker():
+        while time.perf_counter() < deadline:
+            ticket = await db(get_ticket, rng.randint(1, args.tickets))
+            await db(get_category_catalog)
+            await asyncio.sleep(args.llm_latency)
+            await db(update_ticket, ticket.id, status="IN_PROGRESS")
+            counts["triage"] += 1
+
+    await asyncio.gather(
+        ticker(),
+        *(crud_worker() for _ in range(args.crud)),
+        *(triage_worker() for _ in range(args.triage)),
+    )
+    lags.sort()
+    return {
+        "lag_p50": statistics.median(lags) if lags else 0.0,
+        "lag_p99": _pct(lags, 0.99),
+        "lag_max": lags[-1] if lags else 0.0,
+        "crud_s": counts["crud"] / args.seconds,
+        "triage_s": counts["triage"] / args.seconds,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--crud", type=int, default=8, help="clients CRUD simultanés")
+    parser.add_argument("--triage", type=int, default=32, help="triages simultanés")
+    parser.add_argument("--tickets", type=int, default=5000)
+    parser.add_argument("--page", type=int, default=200, help="tickets lus par requête de liste")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="latence LLM simulée (s)")
+    parser.add_argument("--tick", type=float, default=10, help="période du ticker (ms)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = _make_engine(os.path.join(tmp, "bench.db"), args.tickets)
+        print(
+            f"seconds={args.seconds} crud={args.crud} triage={args.triage} tickets={args.tickets} "
+            f"page={args.page} llm_latency={args.llm_latency}s"
+        )
+        print(f"{'mode':<9} {'lag_p50':>8} {'lag_p99':>8} {'lag_max':>8} {'crud/s':>8} {'triage/s':>9}")
+        for mode in ("inline", "executor"):
+            r = await _run(engine, mode, args)
+            print(
+                f"{mode:<9} {r['lag_p50']:>8.2f} {r['lag_p99']:>8.2f} {r['lag_max']:>8.2f} "
+                f"{r['crud_s']:>8.1f} {r['triage_s']:>9.1f}"
+            )
+        shutdown_db_executor()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
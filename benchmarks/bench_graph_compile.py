@@ -0,0 +1,122 @@
+"""
+Micro-benchmark: overhead par requête de build_triage_graph()/build_triage_graph_multi()
+(reconstruction + compile à chaque appel) vs graphes compilés une seule fois.
+
+Le LLM est simulé (asyncio.sleep) et la base est une SQLite en mémoire:
+seul l'overhead du service est mesuré.
+
+Usage (depuis la racine du repo):
+    python -m benchmarks.bench_graph_compile --requests 300 --concurrency 50
+"""
+import time
+import asyncio
+import argparse
+import statistics
+
+from sqlmodel import SQLModel, Session, create_engine
+from sqlalchemy.pool import StaticPool
+
+import app.graphs.triage_graph as single_mod
+import app.graphs.triage_graph_multi as multi_mod
+from app.domain.models import Ticket, Category
+from app.domain.schemas import TicketPriority, TicketStatus
+from app.agents.triage_agent import TriageSuggestion
+from app.agents.classify_agent import CategorySuggestion
+from app.agents.priority_agent import PrioritySuggestion
+from app.agents.reply_agent import ReplySuggestion
+
+
+def _patch_llm(latency: float) -> None:
+    async def suggest_triage(title, description, allowed, allowed_json=None, **kwargs):
+        await asyncio.sleep(latency)
+        return TriageSuggestion(
+            category_name="Bug", priority=TicketPriority.MEDIUM, status=TicketStatus.OPEN, summary="s"
+        )
+
+    async def classify_ticket(title, description, allowed, allowed_json=None, **kwargs):
+        await asyncio.sleep(latency)
+        return CategorySuggestion(category_name="Bug", summary="s")
+
+    async def prioritize_ticket(title, description, category_name=None, **kwargs):
+        await asyncio.sleep(latency)
+        return PrioritySuggestion(priority=TicketPriority.MEDIUM, status=TicketStatus.OPEN)
+
+    async def draft_reply(title, description, category_name, priority, **kwargs):
+        await asyncio.sleep(latency)
+        return ReplySuggestion(draft_reply=None)
+
+    single_mod.suggest_triage = suggest_triage
+    multi_mod.classify_ticket = classify_ticket
+    multi_mod.prioritize_ticket = prioritize_ticket
+    multi_mod.draft_reply = draft_reply
+
+
+def _make_engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as s:
+        for name in ("Access", "Bug", "Data", "Incident"):
+            s.add(Category(name=name))
+        s.add(Ticket(title="Erreur 500", description="La page plante au chargement"))
+        s.commit()
+    return engine
+
+
+async def _run(engine, build, prebuilt, n_requests: int, concurrency: int) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    build_costs: list[float] = []
+
+    async def one_request():
+        async with sem:
+            t0 = time.perf_counter()
+            if prebuilt is None:
+                tb = time.perf_counter()
+                graph = build()
+                build_costs.append(time.perf_counter() - tb)
+            else:
+                graph = prebuilt
+            await graph.ainvoke({"ticket_id": 1}, config={"configurable": {"session_factory": lambda: Session(engine)}})
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(n_requests)))
+    wall = time.perf_counter() - t0
+
+    latencies.sort()
+    return {
+        "wall_s": wall,
+        "rps": n_requests / wall,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "build_ms": statistics.mean(build_costs) * 1000 if build_costs else 0.0,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="latence LLM simulée (s)")
+    args = parser.parse_args()
+
+    _patch_llm(args.llm_latency)
+    engine = _make_engine()
+
+    cases = [
+        ("single", single_mod.build_triage_graph),
+        ("multi", multi_mod.build_triage_graph_multi),
+    ]
+    print(f"requests={args.requests} concurrency={args.concurrency} llm_latency={args.llm_latency}s")
+    print(f"{'graph':<8} {'mode':<16} {'wall_s':>8} {'rps':>8} {'p50_ms':>8} {'p95_ms':>8} {'build_ms':>9}")
+    for name, build in cases:
+        for mode, prebuilt in (("build/request", None), ("compiled once", build())):
+            r = await _run(engine, build, prebuilt, args.requests, args.concurrency)
+            print(
+                f"{name:<8} {mode:<16} {r['wall_s']:>8.2f} {r['rps']:>8.1f} "
+                f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['build_ms']:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+"""
+Benchmark du moteur de règles guardrails (une regex compilée, un scan par ticket)
+vs l'implémentation historique (`any(k in text ...)` par règle, texte re-lowercasé à chaque règle).
+
+Vérifie aussi que les deux donnent la même catégorie sur le jeu généré.
+
+Usage (depuis la racine du repo):
+    python -m benchmarks.bench_guardrails --tickets 5000 --extra-rules 0 10 30
+"""
+import time
+import random
+import argparse
+
+from app.services.guardrail_rules import DEFAULT_RULES, GuardrailRule, RuleEngine
+
+_WORDS = (
+    "le client ne peut pas accéder à la page facture depuis hier erreur lors du chargement "
+    "du tableau de bord merci de vérifier rapidement la commande reste bloquée après validation"
+).split()
+_HITS = ("403 forbidden", "export csv", "colonnes décalées", "rôle admin", "token expiré", "montant incorrect")
+
+
+def _legacy_category(rules, text: str, name_to_id: dict):
+    # reproduction de triage_policy._is_access_issue / _is_data_issue, généralisé à N règles
+    out = None
+    for rule in rules:
+        if rule.category_name in name_to_id:
+            t = (text or "").lower()
+            if any(k in t for k in rule.keywords):
+                out = name_to_id[rule.category_name]
+    return out
+
+
+def _make_rules(extra: int) -> list[GuardrailRule]:
+    rng = random.Random(1)
+    rules = list(DEFAULT_RULES)
+    for i in range(extra):
+        kws = tuple(
+            "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 9))) for _ in range(15)
+        )
+        rules.append(GuardrailRule(f"Cat{i}", kws))
+    return rules
+
+
+def _make_texts(n: int, hit_rate: float) -> list[str]:
+    rng = random.Random(42)
+    texts = []
+    for _ in range(n):
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(20, 120))]
+        if rng.random() < hit_rate:
+            words.insert(rng.randrange(len(words)), rng.choice(_HITS))
+        texts.append(" ".join(words))
+    return texts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickets", type=int, default=5000)
+    parser.add_argument("--extra-rules", type=int, nargs="+", default=[0, 10, 30])
+    parser.add_argument("--hit-rate", type=float, default=0.3, help="part des tickets contenant un mot-clé")
+    args = parser.parse_args()
+
+    texts = _make_texts(args.tickets, args.hit_rate)
+    print(f"tickets={len(texts)} hit_rate={args.hit_rate}")
+    print(f"{'rules':>6} {'legacy_us':>10} {'engine_us':>10} {'batch_us':>9} {'speedup':>8}  same_result")
+
+    for extra in args.extra_rules:
+        rules = _make_rules(extra)
+        name_to_id = {r.category_name: i for i, r in enumerate(rules)}
+        engine = RuleEngine(rules)
+
+        t0 = time.perf_counter()
+        legacy = [_legacy_category(rules, t, name_to_id) for t in texts]
+        t_legacy = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        new = [engine.category_override(engine.scan(t), name_to_id) for t in texts]
+        t_engine = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        scans = engine.scan_many(texts)
+        batch = [engine.category_override(sc, name_to_id) for sc in scans]
+        t_batch = time.perf_counter() - t0
+
+        per = 1e6 / len(texts)
+        print(
+            f"{len(rules):>6} {t_legacy * per:>10.2f} {t_engine * per:>10.2f} {t_batch * per:>9.2f} "
+            f"{t_legacy / t_engine:>7.2f}x  {legacy == new == batch}"
+        )
+
+
+if __name__ == "__main__":
+    main()
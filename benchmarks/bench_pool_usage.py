@@ -0,0 +1,151 @@
+"""
+Connexions DB occupées pendant N triages simultanés (LLM simulé par asyncio.sleep).
+
+- held:   ancien schéma, une session ouverte du fetch jusqu'à la réponse (connexion retenue
+          pendant tout l'appel LLM) => le pool sature au-delà de pool_size + max_overflow
+- phased: triage_service (snapshot -> LLM sans session -> écriture courte)
+- graph:  graphe single compilé avec session_factory
+
+Le pool est échantillonné en continu (engine.pool.checkedout()): en mode phased/graph le pic
+doit rester faible et indépendant du nombre de triages en vol.
+
+Usage (depuis la racine du repo):
+    python -m benchmarks.bench_pool_usage --inflight 50 --llm-latency 0.5
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+from sqlmodel import SQLModel, Session, create_engine
+
+import app.graphs.triage_graph as single_mod
+from app.domain.models import Ticket, Category
+from app.domain.schemas import TicketPriority, TicketStatus
+from app.agents.triage_agent import TriageSuggestion
+from app.services.ticket_service import get_ticket
+from app.services.category_service import get_category_catalog
+from app.services.triage_policy import apply_guardrails
+from app.services.triage_service import load_triage_context, commit_triage_patch
+
+
+def _fake_llm(latency: float):
+    async def suggest_triage(title, description, allowed, allowed_json=None, **kwargs):
+        await asyncio.sleep(latency)
+        return TriageSuggestion(
+            category_name="Bug", priority=TicketPriority.MEDIUM, status=TicketStatus.OPEN, summary="s"
+        )
+    return suggest_triage
+
+
+def _make_engine(path: str, pool_size: int, max_overflow: int, pool_timeout: float):
+    engine = create_engine(
+        f"sqlite:///{path}",
+        connect_args={"check_same_thread": False},
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as s:
+        for name in ("Access", "Bug", "Data", "Incident"):
+            s.add(Category(name=name))
+        s.add(Ticket(title="Erreur 500", description="La page plante au chargement"))
+        s.commit()
+    return engine
+
+
+async def _held(engine, llm, ticket_id: int) -> None:
+    with Session(engine) as s:
+        ticket = get_ticket(s, ticket_id)
+        catalog = get_category_catalog(s)
+        suggestion = await llm(ticket.title, ticket.description, list(catalog.names), catalog.allowed_json)
+        patch = {
+            "category_id": catalog.name_to_id[suggestion.category_name],
+            "priority": suggestion.priority.value,
+            "status": suggestion.status.value,
+        }
+        patch = apply_guardrails(ticket, patch, category_name_to_id=catalog.name_to_id)
+        for k, v in patch.items():
+            setattr(ticket, k, v)
+        s.add(ticket)
+        s.commit()
+
+
+async def _phased(engine, llm, ticket_id: int) -> None:
+    factory = lambda: Session(engine)  # noqa: E731
+    ticket, catalog = load_triage_context(ticket_id, factory)
+    suggestion = await llm(ticket.title, ticket.description, list(catalog.names), catalog.allowed_json)
+    patch = {
+        "category_id": catalog.name_to_id[suggestion.category_name],
+        "priority": suggestion.priority.value,
+        "status": suggestion.status.value,
+    }
+    patch = apply_guardrails(ticket, patch, category_name_to_id=catalog.name_to_id)
+    commit_triage_patch(ticket, patch, catalog.name_to_id, factory)
+
+
+async def _run(engine, one, inflight: int) -> dict:
+    peak = 0
+    stop = asyncio.Event()
+
+    async def sample():
+        nonlocal peak
+        while not stop.is_set():
+            peak = max(peak, engine.pool.checkedout())
+            await asyncio.sleep(0.005)
+
+    sampler = asyncio.create_task(sample())
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(inflight)), return_exceptions=True)
+    wall = time.perf_counter() - t0
+    stop.set()
+    await sampler
+
+    errors = [r for r in results if isinstance(r, Exception)]
+    return {
+        "wall_s": wall,
+        "peak": peak,
+        "errors": len(errors),
+        "first_error": type(errors[0]).__name__ if errors else "",
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inflight", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="latence LLM simulée (s)")
+    parser.add_argument("--pool-size", type=int, default=5)
+    parser.add_argument("--max-overflow", type=int, default=10)
+    parser.add_argument("--pool-timeout", type=float, default=1.0)
+    args = parser.parse_args()
+
+    llm = _fake_llm(args.llm_latency)
+    single_mod.suggest_triage = llm
+    graph = single_mod.build_triage_graph()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = _make_engine(
+            os.path.join(tmp, "bench.db"), args.pool_size, args.max_overflow, args.pool_timeout
+        )
+        factory = lambda: Session(engine)  # noqa: E731
+        cases = {
+            "held": lambda: _held(engine, llm, 1),
+            "phased": lambda: _phased(engine, llm, 1),
+            "graph": lambda: graph.ainvoke({"ticket_id": 1}, config={"configurable": {"session_factory": factory}}),
+        }
+
+        print(
+            f"inflight={args.inflight} llm_latency={args.llm_latency}s "
+            f"pool_size={args.pool_size} max_overflow={args.max_overflow} pool_timeout={args.pool_timeout}s"
+        )
+        print(f"{'mode':<8} {'wall_s':>8} {'peak_conn':>10} {'errors':>7}  first_error")
+        for name, one in cases.items():
+            r = await _run(engine, one, args.inflight)
+            print(f"{name:<8} {r['wall_s']:>8.2f} {r['peak']:>10} {r['errors']:>7}  {r['first_error']}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+"""
+Index des tickets similaires (app/services/similar_tickets.py): construction, ajout incrémental,
+latence de recherche et rappel sur des quasi-doublons.
+
+Tickets synthétiques = gabarits (export CSV, 403, panne, double débit...) x variables
+(produit, navigateur, rôle, n° de commande). Les requêtes sont des tickets indexés légèrement
+modifiés (mots supprimés / ajoutés): "top1" = le ticket d'origine est classé premier,
+"rappel@1 vs exact" = la recherche par listes inversées trouve le même meilleur score
+qu'un balayage complet.
+
+Usage (depuis la racine du repo):
+    python -m benchmarks.bench_similar_tickets --tickets 100000 --queries 1000 --dim 256
+"""
+import time
+import random
+import argparse
+
+from app.services.similar_tickets import SimilarTicketIndex, ticket_text
+
+TEMPLATES = (
+    ("Export CSV {p} cassé", "L'export CSV de {p} sort avec un mauvais séparateur sous {b}, colonnes décalées."),
+    ("403 sur {p}", "Erreur 403 forbidden pour le rôle {r} en ouvrant {p} depuis {b}."),
+    ("{p} indisponible", "Panne: {p} ne répond plus pour tous les utilisateurs, timeout après connexion."),
+    ("Double débit commande {n}", "J'ai été débité deux fois pour la commande {n} sur {p}, merci de rembourser."),
+    ("Bouton enregistrer inactif", "Sur {b}, le bouton enregistrer de {p} ne fait rien, aucun message d'erreur."),
+    ("Mot de passe {p}", "Impossible de réinitialiser mon mot de passe {p}, le lien reçu a expiré ({b})."),
+)
+PRODUCTS = ("facturation", "tableau de bord", "portail client", "API v2", "appli mobile", "back-office", "reporting")
+BROWSERS = ("Firefox", "Chrome", "Safari", "Edge")
+ROLES = ("admin", "manager", "lecteur", "support")
+CATEGORIES = ("Data", "Access", "Incident", "Billing", "Bug", "Access")
+PRIORITIES = ("MEDIUM", "HIGH", "URGENT", "URGENT", "LOW", "MEDIUM")
+
+
+def _ticket(rng: random.Random) -> tuple[str, str, int]:
+    i = rng.randrange(len(TEMPLATES))
+    v = {"p": rng.choice(PRODUCTS), "b": rng.choice(BROWSERS), "r": rng.choice(ROLES), "n": rng.randint(1000, 99999)}
+    title, desc = TEMPLATES[i]
+    return title.format(**v), desc.format(**v), i
+
+
+def _perturb(text: str, rng: random.Random) -> str:
+    words = text.split()
+    for _ in range(max(1, len(words) // 8)):
+        words.pop(rng.randrange(len(words)))
+    words.insert(rng.randrange(len(words) + 1), rng.choice(("svp", "urgent", "bonjour", "merci")))
+    return " ".join(words)
+
+
+def _pct(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickets", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--chunk", type=int, default=2000, help="taille des lots à la construction")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    rows = []
+    for tid in range(1, args.tickets + 1):
+        title, desc, i = _ticket(rng)
+        rows.append((tid, ticket_text(title, desc), title, CATEGORIES[i], PRIORITIES[i], "OPEN"))
+
+    index = SimilarTicketIndex(dim=args.dim)
+    t0 = time.perf_counter()
+    for start in range(0, len(rows), args.chunk):
+        index.add_many(rows[start : start + args.chunk])
+    build_s = time.perf_counter() - t0
+
+    # ajout incrémental (un triage appliqué = un ticket)
+    add_lat = []
+    for n in range(200):
+        title, desc, i = _ticket(rng)
+        t0 = time.perf_counter()
+        index.add(args.tickets + n + 1, ticket_text(title, desc), title, CATEGORIES[i], PRIORITIES[i], "OPEN")
+        add_lat.append((time.perf_counter() - t0) * 1000)
+
+    lat, top1, same_cat, recall, scores = [], 0, 0, 0, []
+    for _ in range(args.queries):
+        tid, text, _, category, *_ = rows[rng.randrange(len(rows))]
+        query = _perturb(text, rng)
+        t0 = time.perf_counter()
+        hits = index.search(query, k=args.k)
+        lat.append((time.perf_counter() - t0) * 1000)
+        if hits:
+            top1 += hits[0].ticket_id == tid
+            same_cat += hits[0].category_name == category
+            scores.append(hits[0].score)
+            # rappel de la recherche approchée: même meilleur score qu'un balayage complet
+            best = index.search(query, k=1, exact=True)
+            recall += bool(best) and abs(best[0].score - hits[0].score) < 1e-6
+
+    lat.sort()
+    add_lat.sort()
+    scores.sort()
+    print(f"tickets={len(index)} dim={args.dim} k={args.k} stats={index.stats()}")
+    print(f"build: {build_s:.2f}s ({len(rows) / build_s:,.0f} tickets/s)")
+    print(f"add:    p50={_pct(add_lat, 0.5):.3f}ms p95={_pct(add_lat, 0.95):.3f}ms p99={_pct(add_lat, 0.99):.3f}ms")
+    print(f"search: p50={_pct(lat, 0.5):.3f}ms p95={_pct(lat, 0.95):.3f}ms p99={_pct(lat, 0.99):.3f}ms")
+    print(
+        f"top1 exact={top1 / args.queries:.1%} même catégorie={same_cat / args.queries:.1%} "
+        f"rappel@1 vs exact={recall / args.queries:.1%} "
+        f"score top1 p10={_pct(scores, 0.1):.3f} p50={_pct(scores, 0.5):.3f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
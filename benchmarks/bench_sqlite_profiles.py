@@ -0,0 +1,128 @@
+"""
+Contention écritures / lectures SQLite selon le profil d'engine (app/db/engine.py).
+
+Chaque profil tourne sur une base neuve: `--writers` threads font des update_ticket (un commit
+chacun) pendant que `--readers` threads lisent des pages de GET /tickets (list_tickets_page).
+"wal+ro" sert les lectures par un engine séparé en query_only (DB_READ_ENGINE=1).
+
+Usage (depuis la racine du repo):
+    python -m benchmarks.bench_sqlite_profiles --seconds 5 --writers 2 --readers 8
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import threading
+
+from sqlalchemy.exc import OperationalError
+from sqlmodel import SQLModel, Session
+
+from app.db.engine import SQLITE_PROFILES, make_engine
+from app.domain.models import Ticket, Category
+from app.services.ticket_service import list_tickets_page, update_ticket
+
+
+def _seed(engine, n_tickets: int) -> None:
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as s:
+        for name in ("Access", "Bug", "Data", "Incident"):
+            s.add(Category(name=name))
+        for i in range(n_tickets):
+            s.add(Ticket(title=f"Ticket {i}", description="La page plante au chargement " * 5))
+        s.commit()
+
+
+def _run(write_engine, read_engine, args) -> dict:
+    deadline = time.perf_counter() + args.seconds
+    lock = threading.Lock()
+    stats = {"writes": 0, "reads": 0, "errors": 0}
+    read_lat: list[float] = []
+    write_lat: list[float] = []
+
+    def writer(seed: int):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            try:
+                with Session(write_engine) as s:
+                    update_ticket(s, rng.randint(1, args.tickets), priority=rng.choice(["LOW", "HIGH"]))
+            except OperationalError:
+                with lock:
+                    stats["errors"] += 1
+                continue
+            with lock:
+                stats["writes"] += 1
+                write_lat.append(time.perf_counter() - t0)
+
+    def reader(seed: int):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            try:
+                with Session(read_engine) as s:
+                    list_tickets_page(s, limit=args.page, status=rng.choice([None, "OPEN"]))
+            except OperationalError:
+                with lock:
+                    stats["errors"] += 1
+                continue
+            with lock:
+                stats["reads"] += 1
+                read_lat.append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(100 + i,)) for i in range(args.readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    def p95(values: list[float]) -> float:
+        values = sorted(values)
+        return values[int(len(values) * 0.95) - 1] * 1000 if values else 0.0
+
+    return {
+        **stats,
+        "write_s": stats["writes"] / args.seconds,
+        "read_s": stats["reads"] / args.seconds,
+        "write_p95": p95(write_lat),
+        "read_p95": p95(read_lat),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--tickets", type=int, default=5000)
+    parser.add_argument("--page", type=int, default=50)
+    args = parser.parse_args()
+
+    cases = [
+        ("legacy", SQLITE_PROFILES["legacy"], False),
+        ("wal", SQLITE_PROFILES["wal"], False),
+        ("wal+ro", SQLITE_PROFILES["wal"], True),
+    ]
+    print(f"seconds={args.seconds} writers={args.writers} readers={args.readers} tickets={args.tickets}")
+    print(
+        f"{'profile':<8} {'writes/s':>9} {'reads/s':>9} {'w_p95_ms':>9} {'r_p95_ms':>9} {'errors':>7}"
+    )
+    for name, profile, separate_reader in cases:
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            write_engine = make_engine(url, profile)
+            _seed(write_engine, args.tickets)
+            read_engine = make_engine(url, profile, readonly=True) if separate_reader else write_engine
+
+            r = _run(write_engine, read_engine, args)
+            print(
+                f"{name:<8} {r['write_s']:>9.1f} {r['read_s']:>9.1f} "
+                f"{r['write_p95']:>9.2f} {r['read_p95']:>9.2f} {r['errors']:>7}"
+            )
+            for eng in {write_engine, read_engine}:
+                eng.dispose()
+
+
+if __name__ == "__main__":
+    main()
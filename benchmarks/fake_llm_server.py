@@ -0,0 +1,194 @@
+"""
+Faux serveur OpenAI-compatible (POST /v1/chat/completions) pour remplacer Ollama en benchmark:
+mesure le surcoût propre du service sans modèle 8B.
+
+Réponse = un objet JSON qui contient les clés de tous les agents (triage, classify, priority,
+reply; les clés en trop sont ignorées par Pydantic). category_name est choisie dans la liste
+"Catégories autorisées" du prompt (ou reprise de l'output précédent pour un appel de repair).
+
+Latence simulée = TTFT (distribution configurable) + tokens de prompt / --prompt-tps
++ tokens de sortie / --tps. --malformed-rate: part de réponses au JSON tronqué (force le
+chemin repair). stream=true: SSE token par token (format chat.completion.chunk).
+
+Usage (depuis la racine du repo):
+    python -m benchmarks.fake_llm_server --port 11500 --ttft-ms 300 --dist lognormal --tps 40
+    OLLAMA_BASE_URL=http://127.0.0.1:11500/v1 python main.py
+"""
+import os
+import re
+import math
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import hashlib
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# mêmes réglages en variables d'env (serveur lancé en sous-process par bench_e2e)
+FAKE_LLM_TTFT_MS = float(os.getenv("FAKE_LLM_TTFT_MS", "300"))
+FAKE_LLM_DIST = os.getenv("FAKE_LLM_DIST", "lognormal")  # fixed | uniform | lognormal | exp
+FAKE_LLM_JITTER = float(os.getenv("FAKE_LLM_JITTER", "0.5"))  # dispersion relative (uniform/lognormal)
+FAKE_LLM_TPS = float(os.getenv("FAKE_LLM_TPS", "40"))  # tokens de sortie / s (0 = instantané)
+FAKE_LLM_PROMPT_TPS = float(os.getenv("FAKE_LLM_PROMPT_TPS", "2000"))  # tokens de prompt / s (0 = ignoré)
+FAKE_LLM_MALFORMED_RATE = float(os.getenv("FAKE_LLM_MALFORMED_RATE", "0.0"))
+FAKE_LLM_SEED = os.getenv("FAKE_LLM_SEED")
+
+_ALLOWED_RE = re.compile(r"Catégories autorisées \(liste stricte\): (\[.*?\])")
+_PREVIOUS_CATEGORY_RE = re.compile(r'"category_name"\s*:\s*"([^"]+)"')
+
+_STATS = {"requests": 0, "streamed": 0, "malformed": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+
+def _tokens(text: str) -> int:
+    # ~4 caractères par token: ordre de grandeur suffisant pour simuler le débit
+    return max(1, len(text) // 4)
+
+
+def _ttft(rng: random.Random, cfg: argparse.Namespace) -> float:
+    mean = cfg.ttft_ms / 1000
+    if cfg.dist == "fixed" or mean <= 0:
+        return max(0.0, mean)
+    if cfg.dist == "uniform":
+        return rng.uniform(mean * (1 - cfg.jitter), mean * (1 + cfg.jitter))
+    if cfg.dist == "exp":
+        return rng.expovariate(1 / mean)
+    # lognormal de moyenne `mean`: sigma = jitter, mu ajusté (queue longue, proche d'un vrai LLM)
+    sigma = cfg.jitter
+    return rng.lognormvariate(math.log(mean) - sigma * sigma / 2, sigma)
+
+
+def _pick_category(prompt: str) -> str:
+    m = _ALLOWED_RE.search(prompt)
+    if m:
+        try:
+            names = json.loads(m.group(1))
+        except json.JSONDecodeError:
+            names = []
+        if names:
+            # déterministe par prompt: même ticket -> même catégorie
+            h = int(hashlib.sha1(prompt.encode("utf-8")).hexdigest(), 16)
+            return names[h % len(names)]
+    prev = _PREVIOUS_CATEGORY_RE.search(prompt)
+    return prev.group(1) if prev else "Bug"
+
+
+def _answer(prompt: str, rng: random.Random) -> dict:
+    priority = rng.choice(["LOW", "MEDIUM", "HIGH", "URGENT"])
+    return {
+        "category_name": _pick_category(prompt),
+        "priority": priority,
+        "status": "IN_PROGRESS" if priority in ("HIGH", "URGENT") else "OPEN",
+        "summary": "Le client signale un dysfonctionnement bloquant sur l'application.",
+        "rationale": ["Symptôme décrit dans le ticket", "Impact utilisateur mentionné"],
+        "draft_reply": "Bonjour, merci pour votre signalement, notre équipe analyse le problème.",
+    }
+
+
+def create_app(cfg: argparse.Namespace) -> FastAPI:
+    app = FastAPI(title="Fake LLM")
+    rng = random.Random(int(cfg.seed) if cfg.seed is not None else None)
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "fake", "object": "model", "owned_by": "bench"}]}
+
+    @app.get("/stats")
+    async def stats():
+        return _STATS
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages") or []
+        prompt = "\n".join(m.get("content") or "" for m in messages if isinstance(m.get("content"), str))
+        model = body.get("model", "fake")
+
+        text = json.dumps(_answer(prompt, rng), ensure_ascii=False)
+        if rng.random() < cfg.malformed_rate:
+            _STATS["malformed"] += 1
+            text = "Voici le JSON demandé: " + text[:-1]  # accolade finale manquante
+
+        prompt_tokens, completion_tokens = _tokens(prompt), _tokens(text)
+        _STATS["requests"] += 1
+        _STATS["prompt_tokens"] += prompt_tokens
+        _STATS["completion_tokens"] += completion_tokens
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        delay = _ttft(rng, cfg) + (prompt_tokens / cfg.prompt_tps if cfg.prompt_tps > 0 else 0.0)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay + (completion_tokens / cfg.tps if cfg.tps > 0 else 0.0))
+            return JSONResponse(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+                    ],
+                    "usage": usage,
+                }
+            )
+
+        _STATS["streamed"] += 1
+
+        def chunk(delta: dict, finish_reason=None, **extra) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **extra,
+            }
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        async def events():
+            await asyncio.sleep(delay)
+            yield chunk({"role": "assistant", "content": ""})
+            per_token = 1 / cfg.tps if cfg.tps > 0 else 0.0
+            for i in range(0, len(text), 4):
+                if per_token:
+                    await asyncio.sleep(per_token)
+                yield chunk({"content": text[i : i + 4]})
+            yield chunk({}, "stop", usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--ttft-ms", type=float, default=FAKE_LLM_TTFT_MS)
+    parser.add_argument("--dist", choices=["fixed", "uniform", "lognormal", "exp"], default=FAKE_LLM_DIST)
+    parser.add_argument("--jitter", type=float, default=FAKE_LLM_JITTER)
+    parser.add_argument("--tps", type=float, default=FAKE_LLM_TPS)
+    parser.add_argument("--prompt-tps", type=float, default=FAKE_LLM_PROMPT_TPS)
+    parser.add_argument("--malformed-rate", type=float, default=FAKE_LLM_MALFORMED_RATE)
+    parser.add_argument("--seed", default=FAKE_LLM_SEED)
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    import uvicorn
+
+    cfg = parse_args()
+    uvicorn.run(create_app(cfg), host=cfg.host, port=cfg.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -31,7 +31,10 @@ agent = Agent(
     instructions=(
         "Tu es un assistant de triage support.\n"
         "Utilise les tools MCP pour lire et appliquer le triage sur les tickets.\n"
-        "Quand l'utilisateur demande d'appliquer le triage, tu DOIS appeler uniquement le tool triage_apply (pas update_ticket, pas triage_suggest).\n"
+        "Quand l'utilisateur demande d'appliquer le triage, tu DOIS appeler uniquement le tool triage_apply pour un ticket, "
+        "ou triage_apply_many pour plusieurs (pas update_ticket/update_tickets, pas triage_suggest).\n"
+        "Pour plusieurs tickets (ex: tickets 1 à 5), fais UN seul appel avec ticket_ids: triage_apply_many, "
+        "triage_suggest_many, ou update_tickets pour une modification manuelle demandée par l'utilisateur.\n"
         "Quand l'utilisateur demande un détail ticket, appelle get_ticket.\n"
         "N'invente jamais category_name : utilise uniquement une category_name explicitement fournie par l'utilisateur ou déjà présente/valide côté ticket/système.\n"
         "Si aucune category_name valide n'est disponible, ne devine pas : demande une précision.\n"
@@ -0,0 +1,189 @@
+"""
+Générateur de charge pour le endpoint MCP streamable-HTTP (/mcp, stateless_http + json_response).
+
+N sessions MCP concurrentes rejouent un mélange pondéré de tools
+(list_tickets, get_ticket, update_ticket, triage_suggest). Deux modes:
+- reused:      une session par client, initialize une seule fois, appels enchaînés
+- per-request: nouvelle connexion + initialize pour CHAQUE appel (client "naïf")
+Rapport: latence p50/p95/p99 et taux d'erreur par tool, coût de mise en place de session.
+
+Backend LLM: lancer l'API contre le faux serveur OpenAI-compatible, ex:
+    python -m benchmarks.fake_llm_server --port 11500 --ttft-ms 300
+    OLLAMA_BASE_URL=http://127.0.0.1:11500/v1 LLM_CACHE_ENABLED=0 python main.py
+    python scripts/mcp_load.py --sessions 32 --calls 50 --mode both
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+MCP_URL = os.getenv("MCP_URL", "http://localhost:8000/mcp/")
+
+DEFAULT_MIX = "list_tickets=4,get_ticket=4,update_ticket=1,triage_suggest=1"
+
+
+def _pct(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def _parse_mix(spec: str) -> tuple[list[str], list[float]]:
+    tools, weights = [], []
+    for part in spec.split(","):
+        name, _, w = part.partition("=")
+        tools.append(name.strip())
+        weights.append(float(w or 1))
+    return tools, weights
+
+
+def _args_for(tool: str, ids: list[int], rng: random.Random) -> dict:
+    if tool == "list_tickets":
+        return {"limit": 20}
+    if tool == "update_ticket":
+        return {"ticket_id": rng.choice(ids), "priority": rng.choice(["LOW", "MEDIUM", "HIGH"])}
+    return {"ticket_id": rng.choice(ids)}
+
+
+def _payload(res) -> dict:
+    if res.structuredContent is not None:
+        return res.structuredContent
+    return json.loads(res.content[0].text) if res.content else {}
+
+
+def _failed(res) -> bool:
+    # erreurs "métier" des tools: isError, ou {"error": ...} dans le résultat
+    if res.isError:
+        return True
+    try:
+        return "error" in _payload(res)
+    except (ValueError, AttributeError, IndexError):
+        return False
+
+
+async def _ticket_ids(url: str, n: int) -> list[int]:
+    async with streamablehttp_client(url) as (read, write, _):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            res = await session.call_tool("list_tickets", {"limit": n})
+    items = _payload(res).get("items", [])
+    return [t["id"] for t in items]
+
+
+class Stats:
+    def __init__(self):
+        self.latency: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.setup: list[float] = []  # ms: connexion + initialize
+
+    def record(self, tool: str, ms: float, ok: bool) -> None:
+        self.latency[tool].append(ms)
+        if not ok:
+            self.errors[tool] += 1
+
+
+async def _call(session: ClientSession, tool: str, args: dict, stats: Stats) -> None:
+    t0 = time.perf_counter()
+    try:
+        ok = not _failed(await session.call_tool(tool, args))
+    except Exception:
+        ok = False
+    stats.record(tool, (time.perf_counter() - t0) * 1000, ok)
+
+
+async def _client(url: str, mode: str, n_calls: int, mix, ids: list[int], seed: int, stats: Stats) -> None:
+    rng = random.Random(seed)
+    tools, weights = mix
+
+    if mode == "reused":
+        t0 = time.perf_counter()
+        async with streamablehttp_client(url) as (read, write, _):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                stats.setup.append((time.perf_counter() - t0) * 1000)
+                for _ in range(n_calls):
+                    tool = rng.choices(tools, weights)[0]
+                    await _call(session, tool, _args_for(tool, ids, rng), stats)
+        return
+
+    for _ in range(n_calls):
+        tool = rng.choices(tools, weights)[0]
+        t0 = time.perf_counter()
+        called = False
+        try:
+            async with streamablehttp_client(url) as (read, write, _):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    stats.setup.append((time.perf_counter() - t0) * 1000)
+                    called = True
+                    await _call(session, tool, _args_for(tool, ids, rng), stats)
+        except Exception:
+            # échec de connexion / initialize (une erreur de fermeture après l'appel n'est pas recomptée)
+            if not called:
+                stats.record(tool, (time.perf_counter() - t0) * 1000, False)
+
+
+async def _run(url: str, mode: str, args, mix, ids: list[int]) -> tuple[Stats, float]:
+    stats = Stats()
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_client(url, mode, args.calls, mix, ids, i, stats) for i in range(args.sessions)))
+    return stats, time.perf_counter() - t0
+
+
+def _report(mode: str, stats: Stats, elapsed: float) -> None:
+    total = sum(len(v) for v in stats.latency.values())
+    setup = sorted(stats.setup)
+    print(f"\n== {mode}: {total} appels en {elapsed:.1f}s ({total / elapsed:.1f} appels/s)")
+    print(
+        f"session setup: n={len(setup)} p50={_pct(setup, 0.5):.1f}ms "
+        f"p95={_pct(setup, 0.95):.1f}ms total={sum(setup) / 1000:.1f}s"
+    )
+    print(f"{'tool':<16} {'calls':>6} {'err%':>6} {'p50_ms':>9} {'p95_ms':>9} {'p99_ms':>9}")
+    for tool in sorted(stats.latency):
+        lat = sorted(stats.latency[tool])
+        err = stats.errors[tool] / len(lat) * 100
+        print(
+            f"{tool:<16} {len(lat):>6} {err:>6.1f} "
+            f"{_pct(lat, 0.5):>9.1f} {_pct(lat, 0.95):>9.1f} {_pct(lat, 0.99):>9.1f}"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=MCP_URL)
+    parser.add_argument("--sessions", type=int, default=16, help="clients MCP concurrents")
+    parser.add_argument("--calls", type=int, default=50, help="appels par client")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="tool=poids,...")
+    parser.add_argument("--mode", choices=["reused", "per-request", "both"], default="both")
+    parser.add_argument("--tickets", type=int, default=200, help="ids de tickets tirés de list_tickets")
+    args = parser.parse_args()
+
+    mix = _parse_mix(args.mix)
+    ids = await _ticket_ids(args.url, args.tickets)
+    if not ids:
+        raise SystemExit("Aucun ticket: crée des tickets (POST /tickets ou /tickets/bulk) d'abord.")
+
+    print(f"[MCP] {args.url} | sessions={args.sessions} calls={args.calls} mix={args.mix} tickets={len(ids)}")
+    modes = ["reused", "per-request"] if args.mode == "both" else [args.mode]
+    results = {}
+    for mode in modes:
+        stats, elapsed = await _run(args.url, mode, args, mix, ids)
+        results[mode] = (stats, elapsed)
+        _report(mode, stats, elapsed)
+
+    if len(results) == 2:
+        (r, r_el), (p, p_el) = results["reused"], results["per-request"]
+        r_calls = sum(len(v) for v in r.latency.values()) or 1
+        p_calls = sum(len(v) for v in p.latency.values()) or 1
+        print(
+            f"\nsetup par appel (per-request): {_pct(sorted(p.setup), 0.5):.1f}ms p50 | "
+            f"débit reused/per-request: {r_calls / r_el:.1f} / {p_calls / p_el:.1f} appels/s"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())